@@ -0,0 +1,85 @@
+"""baseline schema
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-18 12:00:00.000000
+
+Схема, которую создает init.sql. Для существующей базы выполните
+`alembic stamp 0001` перед `alembic upgrade head`.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'streams',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('stream_id', sa.String(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('url', sa.String(), nullable=False),
+        sa.Column('is_active', sa.Boolean(), server_default=sa.true()),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now()),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now()),
+    )
+    op.create_index('idx_streams_stream_id', 'streams', ['stream_id'], unique=True)
+
+    op.create_table(
+        'detections',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('stream_id', sa.Integer(), sa.ForeignKey('streams.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('timestamp', sa.DateTime(), nullable=False),
+        sa.Column('is_violence', sa.Boolean(), nullable=False),
+        sa.Column('confidence', sa.Float(), nullable=False),
+        sa.Column('frame_data', sa.Text()),
+        sa.Column('processed', sa.Boolean(), server_default=sa.false()),
+        sa.Column('acknowledged', sa.Boolean(), server_default=sa.false()),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now()),
+    )
+    op.create_index('idx_detections_stream_id', 'detections', ['stream_id'])
+    op.create_index('idx_detections_timestamp', 'detections', ['timestamp'])
+    op.create_index('idx_detections_is_violence', 'detections', ['is_violence'])
+    op.create_index('idx_detections_acknowledged', 'detections', ['acknowledged'])
+
+    op.create_table(
+        'alerts',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('stream_id', sa.Integer(), sa.ForeignKey('streams.id', ondelete='CASCADE')),
+        sa.Column('detection_id', sa.Integer(), sa.ForeignKey('detections.id', ondelete='CASCADE')),
+        sa.Column('type', sa.String(50), nullable=False),
+        sa.Column('message', sa.Text(), nullable=False),
+        sa.Column('severity', sa.String(20), server_default='medium'),
+        sa.Column('acknowledged', sa.Boolean(), server_default=sa.false()),
+        sa.Column('acknowledged_by', sa.String(255)),
+        sa.Column('acknowledged_at', sa.DateTime()),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now()),
+    )
+    op.create_index('idx_alerts_stream_id', 'alerts', ['stream_id'])
+    op.create_index('idx_alerts_type', 'alerts', ['type'])
+    op.create_index('idx_alerts_acknowledged', 'alerts', ['acknowledged'])
+    op.create_index('idx_alerts_created_at', 'alerts', ['created_at'])
+
+    op.create_table(
+        'system_events',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('event_type', sa.String(100), nullable=False),
+        sa.Column('message', sa.Text(), nullable=False),
+        sa.Column('details', sa.Text()),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now()),
+    )
+    op.create_index('idx_system_events_event_type', 'system_events', ['event_type'])
+    op.create_index('idx_system_events_created_at', 'system_events', ['created_at'])
+
+
+def downgrade() -> None:
+    op.drop_table('system_events')
+    op.drop_table('alerts')
+    op.drop_table('detections')
+    op.drop_table('streams')
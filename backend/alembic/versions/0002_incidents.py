@@ -0,0 +1,52 @@
+"""incidents
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 12:10:00.000000
+
+Окна с насилием объединяются в инциденты; алерт создается один на инцидент.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'incidents',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('stream_id', sa.Integer(), sa.ForeignKey('streams.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=False),
+        sa.Column('ended_at', sa.DateTime(), nullable=False),
+        sa.Column('peak_confidence', sa.Float(), nullable=False),
+        sa.Column('mean_confidence', sa.Float(), nullable=False),
+        sa.Column('window_count', sa.Integer(), nullable=False, server_default='1'),
+        sa.Column('thumbnails', sa.Text()),
+        sa.Column('is_open', sa.Boolean(), server_default=sa.true()),
+        sa.Column('acknowledged', sa.Boolean(), server_default=sa.false()),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now()),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now()),
+    )
+    op.create_index('idx_incidents_stream_id', 'incidents', ['stream_id'])
+    op.create_index('idx_incidents_started_at', 'incidents', ['started_at'])
+
+    # batch режим нужен для SQLite, в PostgreSQL это обычный ALTER TABLE
+    with op.batch_alter_table('alerts') as batch_op:
+        batch_op.add_column(sa.Column('incident_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_alerts_incident_id', 'incidents', ['incident_id'], ['id'],
+                                    ondelete='CASCADE')
+        batch_op.create_index('idx_alerts_incident_id', ['incident_id'])
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('alerts') as batch_op:
+        batch_op.drop_index('idx_alerts_incident_id')
+        batch_op.drop_constraint('fk_alerts_incident_id', type_='foreignkey')
+        batch_op.drop_column('incident_id')
+    op.drop_table('incidents')
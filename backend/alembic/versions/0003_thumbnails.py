@@ -0,0 +1,159 @@
+"""thumbnails table
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 13:30:00.000000
+
+Миниатюры переносятся из detections.frame_data и incidents.thumbnails (base64)
+в отдельную таблицу thumbnails (bytea, ключ - SHA-256 содержимого).
+"""
+from alembic import op
+import sqlalchemy as sa
+import base64
+import hashlib
+import json
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+# Сколько строк переносится за один проход
+CHUNK_SIZE = 1000
+
+INCIDENT_ROLES = ('first', 'peak', 'last')
+
+thumbnails = sa.table(
+    'thumbnails',
+    sa.column('id', sa.String),
+    sa.column('data', sa.LargeBinary),
+    sa.column('size', sa.Integer),
+)
+
+
+def _store(connection, stored, frame_data):
+    """Запись base64 миниатюры в thumbnails, возвращает ключ"""
+    data = base64.b64decode(frame_data)
+    digest = hashlib.sha256(data).hexdigest()
+    if digest not in stored:
+        exists = connection.execute(
+            sa.text("SELECT 1 FROM thumbnails WHERE id = :id"), {"id": digest}
+        ).first()
+        if not exists:
+            connection.execute(sa.insert(thumbnails), {"id": digest, "data": data, "size": len(data)})
+        stored.add(digest)
+    return digest
+
+
+def upgrade() -> None:
+    op.create_table(
+        'thumbnails',
+        sa.Column('id', sa.String(64), primary_key=True),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now()),
+    )
+    op.create_index('idx_thumbnails_created_at', 'thumbnails', ['created_at'])
+
+    with op.batch_alter_table('detections') as batch_op:
+        batch_op.add_column(sa.Column('thumbnail_id', sa.String(64), nullable=True))
+    with op.batch_alter_table('incidents') as batch_op:
+        for role in INCIDENT_ROLES:
+            batch_op.add_column(sa.Column(f'{role}_thumbnail_id', sa.String(64), nullable=True))
+
+    connection = op.get_bind()
+    stored = set()
+
+    # Перенос миниатюр детекций порциями по id
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.text("SELECT id, frame_data FROM detections "
+                    "WHERE id > :last_id AND frame_data IS NOT NULL ORDER BY id LIMIT :limit"),
+            {"last_id": last_id, "limit": CHUNK_SIZE}
+        ).all()
+        if not rows:
+            break
+        for detection_id, frame_data in rows:
+            connection.execute(
+                sa.text("UPDATE detections SET thumbnail_id = :thumbnail_id WHERE id = :id"),
+                {"thumbnail_id": _store(connection, stored, frame_data), "id": detection_id}
+            )
+        last_id = rows[-1][0]
+
+    # Перенос миниатюр инцидентов (JSON роль -> base64)
+    rows = connection.execute(
+        sa.text("SELECT id, thumbnails FROM incidents WHERE thumbnails IS NOT NULL")
+    ).all()
+    for incident_id, encoded in rows:
+        values = {f'{role}_thumbnail_id': _store(connection, stored, frame_data)
+                  for role, frame_data in json.loads(encoded).items() if role in INCIDENT_ROLES}
+        if values:
+            assignments = ", ".join(f"{column} = :{column}" for column in values)
+            connection.execute(sa.text(f"UPDATE incidents SET {assignments} WHERE id = :id"),
+                               {"id": incident_id, **values})
+
+    with op.batch_alter_table('detections') as batch_op:
+        batch_op.create_foreign_key('fk_detections_thumbnail_id', 'thumbnails', ['thumbnail_id'], ['id'])
+        batch_op.create_index('idx_detections_thumbnail_id', ['thumbnail_id'])
+        batch_op.drop_column('frame_data')
+    with op.batch_alter_table('incidents') as batch_op:
+        for role in INCIDENT_ROLES:
+            batch_op.create_foreign_key(f'fk_incidents_{role}_thumbnail_id', 'thumbnails',
+                                        [f'{role}_thumbnail_id'], ['id'])
+        batch_op.drop_column('thumbnails')
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('detections') as batch_op:
+        batch_op.add_column(sa.Column('frame_data', sa.Text(), nullable=True))
+    with op.batch_alter_table('incidents') as batch_op:
+        batch_op.add_column(sa.Column('thumbnails', sa.Text(), nullable=True))
+
+    connection = op.get_bind()
+
+    def encoded(thumbnail_id):
+        data = connection.execute(
+            sa.text("SELECT data FROM thumbnails WHERE id = :id"), {"id": thumbnail_id}
+        ).scalar()
+        return base64.b64encode(data).decode('utf-8') if data is not None else None
+
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.text("SELECT id, thumbnail_id FROM detections "
+                    "WHERE id > :last_id AND thumbnail_id IS NOT NULL ORDER BY id LIMIT :limit"),
+            {"last_id": last_id, "limit": CHUNK_SIZE}
+        ).all()
+        if not rows:
+            break
+        for detection_id, thumbnail_id in rows:
+            connection.execute(
+                sa.text("UPDATE detections SET frame_data = :frame_data WHERE id = :id"),
+                {"frame_data": encoded(thumbnail_id), "id": detection_id}
+            )
+        last_id = rows[-1][0]
+
+    rows = connection.execute(
+        sa.text("SELECT id, first_thumbnail_id, peak_thumbnail_id, last_thumbnail_id FROM incidents")
+    ).all()
+    for incident_id, *thumbnail_ids in rows:
+        values = {role: encoded(thumbnail_id)
+                  for role, thumbnail_id in zip(INCIDENT_ROLES, thumbnail_ids) if thumbnail_id}
+        if values:
+            connection.execute(
+                sa.text("UPDATE incidents SET thumbnails = :thumbnails WHERE id = :id"),
+                {"thumbnails": json.dumps(values), "id": incident_id}
+            )
+
+    with op.batch_alter_table('incidents') as batch_op:
+        for role in INCIDENT_ROLES:
+            batch_op.drop_constraint(f'fk_incidents_{role}_thumbnail_id', type_='foreignkey')
+            batch_op.drop_column(f'{role}_thumbnail_id')
+    with op.batch_alter_table('detections') as batch_op:
+        batch_op.drop_index('idx_detections_thumbnail_id')
+        batch_op.drop_constraint('fk_detections_thumbnail_id', type_='foreignkey')
+        batch_op.drop_column('thumbnail_id')
+    op.drop_table('thumbnails')
@@ -0,0 +1,63 @@
+"""keyset pagination indexes
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 15:00:00.000000
+
+Составные индексы (время, id) под выдачу истории и алертов по курсору и
+частичные индексы для окон с насилием и неподтвержденных алертов. Индексы
+по одной колонке, которые они покрывают, удаляются.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # В PostgreSQL индексы строятся CONCURRENTLY, без блокировки записи детекций
+    with op.get_context().autocommit_block():
+        op.create_index('idx_detections_timestamp_id', 'detections',
+                        [sa.text('timestamp DESC'), sa.text('id DESC')],
+                        postgresql_concurrently=True)
+        op.create_index('idx_detections_stream_timestamp', 'detections',
+                        ['stream_id', sa.text('timestamp DESC'), sa.text('id DESC')],
+                        postgresql_concurrently=True)
+        op.create_index('idx_detections_violence_timestamp', 'detections',
+                        [sa.text('timestamp DESC'), sa.text('id DESC')],
+                        postgresql_where=sa.text('is_violence = true'),
+                        sqlite_where=sa.text('is_violence = 1'),
+                        postgresql_concurrently=True)
+        op.create_index('idx_alerts_created_at_id', 'alerts',
+                        [sa.text('created_at DESC'), sa.text('id DESC')],
+                        postgresql_concurrently=True)
+        op.create_index('idx_alerts_unacknowledged', 'alerts',
+                        [sa.text('created_at DESC'), sa.text('id DESC')],
+                        postgresql_where=sa.text('acknowledged = false'),
+                        sqlite_where=sa.text('acknowledged = 0'),
+                        postgresql_concurrently=True)
+
+    op.drop_index('idx_detections_stream_id', table_name='detections')
+    op.drop_index('idx_detections_timestamp', table_name='detections')
+    op.drop_index('idx_detections_is_violence', table_name='detections')
+    op.drop_index('idx_alerts_acknowledged', table_name='alerts')
+    op.drop_index('idx_alerts_created_at', table_name='alerts')
+
+
+def downgrade() -> None:
+    op.create_index('idx_detections_stream_id', 'detections', ['stream_id'])
+    op.create_index('idx_detections_timestamp', 'detections', ['timestamp'])
+    op.create_index('idx_detections_is_violence', 'detections', ['is_violence'])
+    op.create_index('idx_alerts_acknowledged', 'alerts', ['acknowledged'])
+    op.create_index('idx_alerts_created_at', 'alerts', ['created_at'])
+
+    op.drop_index('idx_alerts_unacknowledged', table_name='alerts')
+    op.drop_index('idx_alerts_created_at_id', table_name='alerts')
+    op.drop_index('idx_detections_violence_timestamp', table_name='detections')
+    op.drop_index('idx_detections_stream_timestamp', table_name='detections')
+    op.drop_index('idx_detections_timestamp_id', table_name='detections')
@@ -0,0 +1,37 @@
+"""stats rollups
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 16:30:00.000000
+
+Агрегаты статистики по потокам за минуту, час и сутки. После миграции
+существующие данные переносятся скриптом rebuild_rollups.py.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'stats_rollups',
+        sa.Column('granularity', sa.String(6), nullable=False),
+        sa.Column('bucket_start', sa.DateTime(), nullable=False),
+        sa.Column('stream_id', sa.Integer(), sa.ForeignKey('streams.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('windows', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('violent_windows', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('incidents', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('confidence_sum', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('max_confidence', sa.Float(), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('granularity', 'bucket_start', 'stream_id', name='stats_rollups_pkey'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('stats_rollups')
@@ -0,0 +1,153 @@
+"""daily partitions
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 18:00:00.000000
+
+detections, alerts и system_events становятся секционированными по суткам
+таблицами PostgreSQL. Данные не копируются: существующая таблица целиком
+подключается как секция за все время до завтрашнего дня и удаляется
+обслуживанием секций, когда выйдет за срок хранения. Последующие секции
+создает PartitionManager (partitions.py). В SQLite миграция ничего не делает.
+
+Подключение не держит блокировку на время проверки: заранее создаются
+CHECK с границей секции (NOT VALID, затем VALIDATE без блокировки записи) и
+уникальный индекс (id, ключ) через CREATE INDEX CONCURRENTLY, поэтому ATTACH
+PARTITION не просматривает таблицу и не строит индекс первичного ключа.
+
+Внешний ключ alerts.detection_id -> detections удаляется: ссылаться можно
+только на уникальный ключ, а он у секционированной таблицы (id, timestamp).
+"""
+from alembic import op
+from datetime import date, timedelta
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+# Таблица -> (ключ секционирования, внешние ключи, индексы)
+TABLES = {
+    'detections': (
+        'timestamp',
+        [
+            "FOREIGN KEY (stream_id) REFERENCES streams(id) ON DELETE CASCADE",
+            "FOREIGN KEY (thumbnail_id) REFERENCES thumbnails(id)",
+        ],
+        {
+            'idx_detections_acknowledged': "(acknowledged)",
+            'idx_detections_thumbnail_id': "(thumbnail_id)",
+            'idx_detections_timestamp_id': "(timestamp DESC, id DESC)",
+            'idx_detections_stream_timestamp': "(stream_id, timestamp DESC, id DESC)",
+            'idx_detections_violence_timestamp': "(timestamp DESC, id DESC) WHERE is_violence = true",
+        },
+    ),
+    'alerts': (
+        'created_at',
+        [
+            "FOREIGN KEY (stream_id) REFERENCES streams(id) ON DELETE CASCADE",
+            "FOREIGN KEY (incident_id) REFERENCES incidents(id) ON DELETE CASCADE",
+        ],
+        {
+            'idx_alerts_stream_id': "(stream_id)",
+            'idx_alerts_type': "(type)",
+            'idx_alerts_incident_id': "(incident_id)",
+            'idx_alerts_created_at_id': "(created_at DESC, id DESC)",
+            'idx_alerts_unacknowledged': "(created_at DESC, id DESC) WHERE acknowledged = false",
+        },
+    ),
+    'system_events': (
+        'created_at',
+        [],
+        {
+            'idx_system_events_event_type': "(event_type)",
+            'idx_system_events_created_at': "(created_at)",
+        },
+    ),
+}
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+    if connection.dialect.name != 'postgresql':
+        return
+
+    op.execute("ALTER TABLE alerts DROP CONSTRAINT IF EXISTS alerts_detection_id_fkey")
+
+    # Все, что записано до завтрашнего дня, остается в прежней таблице
+    tomorrow = date.today() + timedelta(days=1)
+    for table, (key, _, _) in TABLES.items():
+        op.execute(f"UPDATE {table} SET {key} = now() WHERE {key} IS NULL")
+
+    # Долгие проверки и построение индекса - без исключительной блокировки
+    with op.get_context().autocommit_block():
+        for table, (key, _, _) in TABLES.items():
+            op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_partition_bound "
+                       f"CHECK ({key} IS NOT NULL AND {key} < '{tomorrow.isoformat()}') NOT VALID")
+            op.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {table}_partition_bound")
+            op.execute(f"CREATE UNIQUE INDEX CONCURRENTLY {table}_partition_key ON {table} (id, {key})")
+
+    for table, (key, foreign_keys, indexes) in TABLES.items():
+        legacy = f'{table}_legacy'
+        # Проверенный CHECK доказывает отсутствие NULL: SET NOT NULL не просматривает таблицу
+        op.execute(f"ALTER TABLE {table} ALTER COLUMN {key} SET NOT NULL")
+        op.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+        op.execute(f"ALTER TABLE {legacy} RENAME CONSTRAINT {table}_pkey TO {legacy}_pkey")
+        # Первичный ключ новой таблицы подключится к этому ограничению без построения индекса
+        op.execute(f"ALTER TABLE {legacy} ADD CONSTRAINT {legacy}_partition_key "
+                   f"UNIQUE USING INDEX {table}_partition_key")
+        # Имена индексов уникальны в схеме: прежние переименовываются, одинаковые
+        # по определению подключатся к индексам новой таблицы при ATTACH PARTITION
+        index_names = connection.exec_driver_sql(
+            "SELECT indexname FROM pg_indexes WHERE tablename = %(table)s AND indexname <> ALL(%(skip)s)",
+            {"table": legacy, "skip": [f"{legacy}_pkey", f"{legacy}_partition_key"]}
+        ).scalars().all()
+        for name in index_names:
+            op.execute(f"ALTER INDEX {name} RENAME TO {name}_legacy")
+
+        op.execute(f"CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE ({key})")
+        op.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id, {key})")
+        # Последовательность id иначе будет удалена вместе с прежней секцией
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+        for foreign_key in foreign_keys:
+            op.execute(f"ALTER TABLE {table} ADD {foreign_key}")
+        for name, definition in indexes.items():
+            columns, _, where = definition.partition(" WHERE ")
+            op.execute(f"CREATE INDEX {name} ON {table} {columns}" + (f" WHERE {where}" if where else ""))
+
+        # Граница секции уже доказана CHECK: ATTACH обходится без просмотра строк
+        op.execute(f"ALTER TABLE {table} ATTACH PARTITION {legacy} "
+                   f"FOR VALUES FROM (MINVALUE) TO ('{tomorrow.isoformat()}')")
+        op.execute(f"ALTER TABLE {legacy} DROP CONSTRAINT {table}_partition_bound")
+        op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+        for offset in range(4):
+            day = tomorrow + timedelta(days=offset)
+            op.execute(f"CREATE TABLE {table}_p{day:%Y%m%d} PARTITION OF {table} "
+                       f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')")
+
+
+def downgrade() -> None:
+    connection = op.get_bind()
+    if connection.dialect.name != 'postgresql':
+        return
+
+    # Обратно - копированием в обычную таблицу
+    for table, (key, foreign_keys, indexes) in TABLES.items():
+        plain = f'{table}_plain'
+        op.execute(f"CREATE TABLE {plain} (LIKE {table} INCLUDING DEFAULTS)")
+        op.execute(f"INSERT INTO {plain} SELECT * FROM {table}")
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+        op.execute(f"DROP TABLE {table}")
+        op.execute(f"ALTER TABLE {plain} RENAME TO {table}")
+        op.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id)")
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+        for foreign_key in foreign_keys:
+            op.execute(f"ALTER TABLE {table} ADD {foreign_key}")
+        for name, definition in indexes.items():
+            columns, _, where = definition.partition(" WHERE ")
+            op.execute(f"CREATE INDEX {name} ON {table} {columns}" + (f" WHERE {where}" if where else ""))
+
+    op.execute("ALTER TABLE alerts ADD CONSTRAINT alerts_detection_id_fkey "
+               "FOREIGN KEY (detection_id) REFERENCES detections(id) ON DELETE CASCADE")
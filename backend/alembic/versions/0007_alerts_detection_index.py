@@ -0,0 +1,30 @@
+"""alerts detection index
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 21:00:00.000000
+
+Индекс alerts(detection_id): SQLite с foreign_keys=ON проверяет ссылки
+алертов при удалении каждой детекции, без индекса - полным просмотром alerts.
+Только для SQLite: в PostgreSQL миграция 0006 удалила этот внешний ключ.
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.create_index('idx_alerts_detection_id', 'alerts', ['detection_id'])
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.drop_index('idx_alerts_detection_id', table_name='alerts')
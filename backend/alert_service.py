@@ -1,203 +1,668 @@
+from sqlalchemy import insert, select, update, delete, exists, func, case, and_, or_, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
-from database import SessionLocal, Stream, Detection, Alert, SystemEvent
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import (session_scope, async_session_scope, DB_QUERY_TIMEOUT, ROLLUP_GRANULARITIES, ROLLUP_STEPS,
+                      rollup_bucket, Stream, Detection, Thumbnail, Incident, Alert, StatsRollup, SystemEvent)
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable, Awaitable, AsyncIterator, Set
+import asyncio
+import base64
 import json
+import threading
 
 class AlertService:
+    """Работа с детекциями и алертами в базе данных.
+    
+    Методы записи открывают свою сессию (session_scope), поэтому их можно
+    вызывать одновременно из потоков детекции, writer'а и из asyncio.to_thread.
+    Методы чтения асинхронные (async_session_scope) и ограничены по времени
+    DB_QUERY_TIMEOUT; при превышении выбрасывается asyncio.TimeoutError.
+    Все методы возвращают словари или id, а не ORM объекты.
+    """
+    
     def __init__(self):
-        self.db = SessionLocal()
+        # Реестр потоков: stream_id -> первичный ключ в таблице streams
+        self.stream_ids: Dict[str, int] = {}
+        self.stream_lock = threading.Lock()
     
-    def __del__(self):
-        if self.db:
-            self.db.close()
+    # Колонки списков: строки читаются без ORM объектов, stream_id - строковый id потока из join
+    DETECTION_COLUMNS = (Detection.id, Stream.stream_id, Detection.timestamp, Detection.is_violence,
+                         Detection.confidence, Detection.thumbnail_id, Detection.processed,
+                         Detection.acknowledged, Detection.created_at)
+    ALERT_COLUMNS = (Alert.id, Alert.type, Alert.message, Alert.severity, Alert.acknowledged,
+                     Alert.acknowledged_by, Alert.acknowledged_at, Alert.created_at, Stream.stream_id,
+                     Alert.detection_id, Alert.incident_id)
+    INCIDENT_COLUMNS = (Incident.id, Stream.stream_id, Incident.started_at, Incident.ended_at,
+                        Incident.peak_confidence, Incident.mean_confidence, Incident.window_count,
+                        Incident.first_thumbnail_id, Incident.peak_thumbnail_id, Incident.last_thumbnail_id,
+                        Incident.is_open, Incident.acknowledged)
     
-    def create_stream(self, stream_id: str, name: str, url: str) -> Stream:
-        """Создание нового потока в базе данных"""
-        stream = Stream(
-            stream_id=stream_id,
-            name=name,
-            url=url,
-            is_active=True
+    @staticmethod
+    def detection_to_dict(detection) -> Dict[str, Any]:
+        """Детекция (строка DETECTION_COLUMNS) в формате API"""
+        return {
+            "id": detection.id,
+            "stream_id": detection.stream_id,
+            "timestamp": detection.timestamp.isoformat(),
+            "is_violence": detection.is_violence,
+            "confidence": detection.confidence,
+            "thumbnail_url": f"/api/thumbnails/{detection.thumbnail_id}" if detection.thumbnail_id else None,
+            "processed": detection.processed,
+            "acknowledged": detection.acknowledged,
+            "created_at": detection.created_at.isoformat()
+        }
+    
+    @staticmethod
+    def alert_to_dict(alert) -> Dict[str, Any]:
+        """Алерт (строка ALERT_COLUMNS) в формате API"""
+        return {
+            "id": alert.id,
+            "type": alert.type,
+            "message": alert.message,
+            "severity": alert.severity,
+            "acknowledged": alert.acknowledged,
+            "acknowledged_by": alert.acknowledged_by,
+            "acknowledged_at": alert.acknowledged_at.isoformat() if alert.acknowledged_at else None,
+            "created_at": alert.created_at.isoformat(),
+            "stream_id": alert.stream_id,
+            "detection_id": alert.detection_id,
+            "incident_id": alert.incident_id
+        }
+    
+    @staticmethod
+    def incident_to_dict(incident) -> Dict[str, Any]:
+        """Инцидент (строка INCIDENT_COLUMNS) в формате API"""
+        thumbnail_ids = {
+            "first": incident.first_thumbnail_id,
+            "peak": incident.peak_thumbnail_id,
+            "last": incident.last_thumbnail_id
+        }
+        return {
+            "id": incident.id,
+            "stream_id": incident.stream_id,
+            "started_at": incident.started_at.isoformat(),
+            "ended_at": incident.ended_at.isoformat(),
+            "duration": (incident.ended_at - incident.started_at).total_seconds(),
+            "peak_confidence": incident.peak_confidence,
+            "mean_confidence": incident.mean_confidence,
+            "window_count": incident.window_count,
+            "thumbnail_urls": {role: f"/api/thumbnails/{thumbnail_id}"
+                               for role, thumbnail_id in thumbnail_ids.items() if thumbnail_id},
+            "is_open": incident.is_open,
+            "acknowledged": incident.acknowledged
+        }
+    
+    @staticmethod
+    def encode_cursor(timestamp: str, row_id: int) -> str:
+        """Курсор страницы: позиция последней строки в порядке (время, id)"""
+        return base64.urlsafe_b64encode(f"{timestamp}|{row_id}".encode()).decode('ascii')
+    
+    @staticmethod
+    def decode_cursor(cursor: str) -> tuple:
+        """Разбор курсора; ValueError, если курсор поврежден"""
+        try:
+            timestamp, row_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode().split("|")
+            return datetime.fromisoformat(timestamp), int(row_id)
+        except Exception:
+            raise ValueError("Invalid cursor")
+    
+    async def _read(self, query: Callable[[AsyncSession], Awaitable[Any]]) -> Any:
+        """Выполнение запроса чтения в отдельной сессии с таймаутом"""
+        async with async_session_scope() as db:
+            return await asyncio.wait_for(query(db), timeout=DB_QUERY_TIMEOUT)
+    
+    @staticmethod
+    def _upsert_insert(db: Session, model):
+        """INSERT с поддержкой ON CONFLICT для диалекта базы (PostgreSQL или SQLite)"""
+        dialect = db.get_bind().dialect.name
+        if dialect == 'postgresql':
+            return postgresql.insert(model)
+        if dialect == 'sqlite':
+            return sqlite.insert(model)
+        raise NotImplementedError(f"Upsert is not supported for {dialect}")
+    
+    @staticmethod
+    def _greatest(db: Session, left, right):
+        # В SQLite max() с двумя аргументами - скалярная функция
+        return func.max(left, right) if db.get_bind().dialect.name == 'sqlite' else func.greatest(left, right)
+    
+    def _insert_thumbnails(self, db: Session, thumbnails: Dict[str, bytes]):
+        """Запись миниатюр; уже сохраненное содержимое пропускается"""
+        rows = [{'id': digest, 'data': data, 'size': len(data)} for digest, data in thumbnails.items()]
+        db.execute(self._upsert_insert(db, Thumbnail).on_conflict_do_nothing(), rows)
+    
+    def _add_rollups(self, db: Session, rollups: List[Dict[str, Any]], streams: Dict[str, int]):
+        """Прибавление приращений к агрегатам статистики (INSERT ... ON CONFLICT DO UPDATE)"""
+        stmt = self._upsert_insert(db, StatsRollup)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[StatsRollup.granularity, StatsRollup.bucket_start, StatsRollup.stream_id],
+            set_={
+                'windows': StatsRollup.windows + stmt.excluded.windows,
+                'violent_windows': StatsRollup.violent_windows + stmt.excluded.violent_windows,
+                'incidents': StatsRollup.incidents + stmt.excluded.incidents,
+                'confidence_sum': StatsRollup.confidence_sum + stmt.excluded.confidence_sum,
+                'max_confidence': self._greatest(db, StatsRollup.max_confidence, stmt.excluded.max_confidence)
+            }
         )
-        self.db.add(stream)
-        self.db.commit()
-        self.db.refresh(stream)
-        return stream
+        db.execute(stmt, [{**rollup, 'stream_id': streams[rollup['stream_id']]} for rollup in rollups])
     
-    def get_or_create_stream(self, stream_id: str, name: str, url: str) -> Stream:
-        """Получение существующего потока или создание нового"""
-        stream = self.db.query(Stream).filter(Stream.stream_id == stream_id).first()
+    def _get_or_create_stream(self, db: Session, stream_id: str, name: str, url: str) -> Stream:
+        stream = db.query(Stream).filter(Stream.stream_id == stream_id).first()
         if not stream:
-            stream = self.create_stream(stream_id, name, url)
+            stream = Stream(stream_id=stream_id, name=name, url=url, is_active=True)
+            db.add(stream)
+            db.flush()
         return stream
     
-    def save_detection(self, stream_id: str, is_violence: bool, confidence: float, 
-                      frame_data: str = None) -> Detection:
-        """Сохранение результата детекции"""
-        # Получаем или создаем поток
-        stream = self.get_or_create_stream(stream_id, stream_id, f"rtsp://{stream_id}")
-        
-        detection = Detection(
-            stream_id=stream.id,
-            timestamp=datetime.now(),
-            is_violence=is_violence,
-            confidence=confidence,
-            frame_data=frame_data,
-            processed=False,
-            acknowledged=False
-        )
+    def _resolve_stream_ids(self, db: Session, stream_ids, created: Dict[str, int]) -> Dict[str, int]:
+        """Первичные ключи потоков из реестра; запрос к БД только для неизвестных.
         
-        self.db.add(detection)
-        self.db.commit()
-        self.db.refresh(detection)
-        
-        # Если обнаружено насилие, создаем алерт
-        if is_violence:
-            self.create_violence_alert(detection)
-        
-        return detection
-    
-    def create_violence_alert(self, detection: Detection) -> Alert:
-        """Создание алерта о насилии"""
-        alert = Alert(
-            stream_id=detection.stream_id,
-            detection_id=detection.id,
-            type='violence',
-            message=f"Violence detected in stream {detection.stream.stream_id}",
-            severity='high',
-            acknowledged=False
-        )
+        Новые ключи попадают в created и заносятся в реестр вызывающим кодом
+        после успешного commit.
+        """
+        with self.stream_lock:
+            resolved = {stream_id: self.stream_ids.get(stream_id) for stream_id in stream_ids}
+        for stream_id, pk in resolved.items():
+            if pk is None:
+                # Поток, не добавленный через RTSPManager (например, после рестарта без прогрева)
+                pk = self._get_or_create_stream(db, stream_id, stream_id, f"rtsp://{stream_id}").id
+                resolved[stream_id] = pk
+                created[stream_id] = pk
+        return resolved
+    
+    def _remember_streams(self, stream_ids: Dict[str, int]):
+        if stream_ids:
+            with self.stream_lock:
+                self.stream_ids.update(stream_ids)
+    
+    def warm_stream_cache(self) -> int:
+        """Загрузка реестра потоков из таблицы streams (при старте)"""
+        with session_scope() as db:
+            rows = db.execute(select(Stream.stream_id, Stream.id)).all()
+        with self.stream_lock:
+            self.stream_ids = {stream_id: pk for stream_id, pk in rows}
+        return len(rows)
+    
+    def register_stream(self, stream_id: str, name: str, url: str) -> int:
+        """Запись потока с настоящими именем и URL (вызывается RTSPManager.add_stream)"""
+        with session_scope() as db:
+            stream = db.query(Stream).filter(Stream.stream_id == stream_id).first()
+            if stream:
+                stream.name = name
+                stream.url = url
+                stream.is_active = True
+            else:
+                stream = Stream(stream_id=stream_id, name=name, url=url, is_active=True)
+                db.add(stream)
+            db.flush()
+            pk = stream.id
+        self._remember_streams({stream_id: pk})
+        return pk
+    
+    def deactivate_stream(self, stream_id: str) -> bool:
+        """Пометка потока неактивным (вызывается RTSPManager.remove_stream).
+        
+        Строка и ключ в реестре сохраняются: на поток ссылается история детекций.
+        """
+        with session_scope() as db:
+            result = db.execute(
+                update(Stream).where(Stream.stream_id == stream_id).values(is_active=False)
+            )
+            return result.rowcount > 0
+    
+    def create_stream(self, stream_id: str, name: str, url: str) -> int:
+        """Создание нового потока в базе данных"""
+        with session_scope() as db:
+            stream = Stream(
+                stream_id=stream_id,
+                name=name,
+                url=url,
+                is_active=True
+            )
+            db.add(stream)
+            db.flush()
+            return stream.id
+    
+    def get_or_create_stream(self, stream_id: str, name: str, url: str) -> int:
+        """Получение существующего потока или создание нового"""
+        with session_scope() as db:
+            return self._get_or_create_stream(db, stream_id, name, url).id
+    
+    def save_detections_batch(self, records: List[Dict[str, Any]],
+                              incidents: List[Dict[str, Any]] = (),
+                              thumbnails: Dict[str, bytes] = None,
+                              rollups: List[Dict[str, Any]] = (),
+                              obsolete_thumbnails: Set[str] = ()) -> List[int]:
+        """Пакетное сохранение детекций и инцидентов одной транзакцией.
+        
+        records - сырые окна (stream_id, timestamp, is_violence, confidence, thumbnail_id),
+        пишутся многострочным INSERT. incidents - состояния инцидентов из DetectionWriter:
+        без id создаются (вместе с одним алертом на инцидент), с id обновляются на месте.
+        thumbnails - JPEG миниатюр по SHA-256, на которые ссылаются records и incidents.
+        rollups - приращения агрегатов статистики (stream_id, granularity, bucket_start, счетчики).
+        obsolete_thumbnails - ключи замененных миниатюр инцидентов; удаляются, если на них
+        больше не ссылаются ни детекции, ни инциденты.
+        Возвращает id инцидентов в порядке incidents.
+        """
+        if not records and not incidents and not rollups:
+            return []
+        
+        created = {}
+        with session_scope() as db:
+            if thumbnails:
+                self._insert_thumbnails(db, thumbnails)
+            
+            # Ключи потоков берутся из реестра без запроса к БД
+            stream_ids = ({record['stream_id'] for record in records} |
+                          {incident['stream_id'] for incident in incidents} |
+                          {rollup['stream_id'] for rollup in rollups})
+            streams = self._resolve_stream_ids(db, stream_ids, created)
+            
+            if rollups:
+                self._add_rollups(db, rollups, streams)
+            
+            if records:
+                db.execute(insert(Detection), [
+                    {
+                        'stream_id': streams[record['stream_id']],
+                        'timestamp': record['timestamp'],
+                        'is_violence': record['is_violence'],
+                        'confidence': record['confidence'],
+                        'thumbnail_id': record.get('thumbnail_id'),
+                        'processed': False,
+                        'acknowledged': False
+                    }
+                    for record in records
+                ])
+            
+            def incident_row(incident: Dict[str, Any]) -> Dict[str, Any]:
+                return {
+                    'started_at': incident['started_at'],
+                    'ended_at': incident['ended_at'],
+                    'peak_confidence': incident['peak_confidence'],
+                    'mean_confidence': incident['mean_confidence'],
+                    'window_count': incident['window_count'],
+                    'first_thumbnail_id': incident['thumbnail_ids'].get('first'),
+                    'peak_thumbnail_id': incident['thumbnail_ids'].get('peak'),
+                    'last_thumbnail_id': incident['thumbnail_ids'].get('last'),
+                    'is_open': incident['is_open']
+                }
+            
+            new_incidents = [incident for incident in incidents if incident['id'] is None]
+            new_ids = []
+            if new_incidents:
+                # Многострочный INSERT ... RETURNING
+                new_ids = db.scalars(
+                    insert(Incident).returning(Incident.id, sort_by_parameter_order=True),
+                    [
+                        {'stream_id': streams[incident['stream_id']], 'acknowledged': False, **incident_row(incident)}
+                        for incident in new_incidents
+                    ]
+                ).all()
+                
+                # Один алерт на инцидент
+                db.execute(insert(Alert), [
+                    {
+                        'stream_id': streams[incident['stream_id']],
+                        'incident_id': incident_id,
+                        'type': 'violence',
+                        'message': f"Violence detected in stream {incident['stream_id']}",
+                        'severity': 'high',
+                        'acknowledged': False
+                    }
+                    for incident, incident_id in zip(new_incidents, new_ids)
+                ])
+            
+            updated = [{'id': incident['id'], **incident_row(incident)}
+                       for incident in incidents if incident['id'] is not None]
+            if updated:
+                # UPDATE по первичному ключу для всех продолжающихся инцидентов
+                db.execute(update(Incident), updated)
+            
+            if obsolete_thumbnails:
+                db.execute(delete(Thumbnail).where(
+                    Thumbnail.id.in_(list(obsolete_thumbnails)),
+                    ~exists().where(Detection.thumbnail_id == Thumbnail.id),
+                    ~exists().where(or_(
+                        Incident.first_thumbnail_id == Thumbnail.id,
+                        Incident.peak_thumbnail_id == Thumbnail.id,
+                        Incident.last_thumbnail_id == Thumbnail.id
+                    ))
+                ), execution_options={"synchronize_session": False})
         
-        self.db.add(alert)
-        self.db.commit()
-        self.db.refresh(alert)
-        return alert
+        self._remember_streams(created)
+        new_ids = iter(new_ids)
+        return [incident['id'] if incident['id'] is not None else next(new_ids) for incident in incidents]
     
-    def create_system_alert(self, alert_type: str, message: str, 
-                           severity: str = 'medium', stream_id: str = None) -> Alert:
+    def create_system_alert(self, alert_type: str, message: str,
+                           severity: str = 'medium', stream_id: str = None) -> int:
         """Создание системного алерта"""
-        stream = None
-        if stream_id:
-            stream = self.db.query(Stream).filter(Stream.stream_id == stream_id).first()
-        
-        alert = Alert(
-            stream_id=stream.id if stream else None,
-            type=alert_type,
-            message=message,
-            severity=severity,
-            acknowledged=False
-        )
+        with self.stream_lock:
+            stream_pk = self.stream_ids.get(stream_id) if stream_id else None
         
-        self.db.add(alert)
-        self.db.commit()
-        self.db.refresh(alert)
-        return alert
+        with session_scope() as db:
+            if stream_id and stream_pk is None:
+                stream = db.query(Stream).filter(Stream.stream_id == stream_id).first()
+                stream_pk = stream.id if stream else None
+            
+            alert = Alert(
+                stream_id=stream_pk,
+                type=alert_type,
+                message=message,
+                severity=severity,
+                acknowledged=False
+            )
+            db.add(alert)
+            db.flush()
+            return alert.id
     
-    def create_system_event(self, event_type: str, message: str, details: Dict = None) -> SystemEvent:
+    def create_system_event(self, event_type: str, message: str, details: Dict = None) -> int:
         """Создание системного события"""
-        event = SystemEvent(
-            event_type=event_type,
-            message=message,
-            details=json.dumps(details) if details else None
-        )
-        
-        self.db.add(event)
-        self.db.commit()
-        self.db.refresh(event)
-        return event
+        with session_scope() as db:
+            event = SystemEvent(
+                event_type=event_type,
+                message=message,
+                details=json.dumps(details) if details else None
+            )
+            db.add(event)
+            db.flush()
+            return event.id
     
-    def get_detections(self, limit: int = 100, offset: int = 0, 
-                      stream_id: str = None, is_violence: bool = None) -> List[Detection]:
-        """Получение списка детекций"""
-        query = self.db.query(Detection).join(Stream)
+    async def get_detections(self, limit: int = 100, offset: int = 0,
+                             stream_id: str = None, is_violence: bool = None,
+                             since: datetime = None, cursor: str = None) -> List[Dict[str, Any]]:
+        """Получение списка детекций.
+        
+        С cursor (из encode_cursor по последней строке предыдущей страницы)
+        страница выбирается по индексу (timestamp, id) без OFFSET.
+        """
+        query = select(*self.DETECTION_COLUMNS).join(Stream, Stream.id == Detection.stream_id)
         
         if stream_id:
-            query = query.filter(Stream.stream_id == stream_id)
+            query = query.where(Stream.stream_id == stream_id)
         
         if is_violence is not None:
-            query = query.filter(Detection.is_violence == is_violence)
+            query = query.where(Detection.is_violence == is_violence)
+        
+        if since is not None:
+            query = query.where(Detection.timestamp > since)
         
-        return query.order_by(Detection.timestamp.desc()).offset(offset).limit(limit).all()
+        if cursor:
+            query = query.where(tuple_(Detection.timestamp, Detection.id) < self.decode_cursor(cursor))
+        elif offset:
+            query = query.offset(offset)
+        
+        query = query.order_by(Detection.timestamp.desc(), Detection.id.desc()).limit(limit)
+        
+        async def run(db: AsyncSession):
+            rows = (await db.execute(query)).all()
+            return [self.detection_to_dict(row) for row in rows]
+        
+        return await self._read(run)
     
-    def get_alerts(self, limit: int = 100, offset: int = 0, 
-                   alert_type: str = None, acknowledged: bool = None) -> List[Alert]:
-        """Получение списка алертов"""
-        query = self.db.query(Alert)
+    # Колонки выгрузки: (имя, тип) для exporters.export_stream
+    DETECTION_EXPORT_COLUMNS = [("id", "int"), ("stream_id", "str"), ("timestamp", "datetime"),
+                                ("is_violence", "bool"), ("confidence", "float"), ("thumbnail_id", "str")]
+    ALERT_EXPORT_COLUMNS = [("id", "int"), ("stream_id", "str"), ("incident_id", "int"), ("detection_id", "int"),
+                            ("type", "str"), ("message", "str"), ("severity", "str"), ("acknowledged", "bool"),
+                            ("acknowledged_by", "str"), ("acknowledged_at", "datetime"), ("created_at", "datetime")]
+    
+    @staticmethod
+    async def _stream_rows(query, batch_size: int) -> AsyncIterator[List[tuple]]:
+        """Порции строк запроса через серверный курсор: в памяти одна порция"""
+        async with async_session_scope() as db:
+            result = await db.stream(query.execution_options(yield_per=batch_size))
+            async for partition in result.partitions():
+                yield [tuple(row) for row in partition]
+    
+    def stream_detections(self, stream_id: str = None, since: datetime = None, until: datetime = None,
+                          min_confidence: float = None, max_confidence: float = None,
+                          is_violence: bool = None, include_thumbnails: bool = False,
+                          batch_size: int = 1000) -> AsyncIterator[List[tuple]]:
+        """Выгрузка детекций порциями в порядке времени (колонки DETECTION_EXPORT_COLUMNS,
+        с include_thumbnails - еще JPEG миниатюры)"""
+        query = select(Detection.id, Stream.stream_id, Detection.timestamp, Detection.is_violence,
+                       Detection.confidence, Detection.thumbnail_id).join(Stream, Stream.id == Detection.stream_id)
+        if include_thumbnails:
+            query = query.add_columns(Thumbnail.data).outerjoin(Thumbnail, Thumbnail.id == Detection.thumbnail_id)
+        
+        if stream_id:
+            query = query.where(Stream.stream_id == stream_id)
+        if since is not None:
+            query = query.where(Detection.timestamp >= since)
+        if until is not None:
+            query = query.where(Detection.timestamp < until)
+        if min_confidence is not None:
+            query = query.where(Detection.confidence >= min_confidence)
+        if max_confidence is not None:
+            query = query.where(Detection.confidence <= max_confidence)
+        if is_violence is not None:
+            query = query.where(Detection.is_violence == is_violence)
+        
+        return self._stream_rows(query.order_by(Detection.timestamp, Detection.id), batch_size)
+    
+    def stream_alerts(self, stream_id: str = None, since: datetime = None, until: datetime = None,
+                      alert_type: str = None, acknowledged: bool = None,
+                      batch_size: int = 1000) -> AsyncIterator[List[tuple]]:
+        """Выгрузка алертов порциями в порядке времени (колонки ALERT_EXPORT_COLUMNS)"""
+        query = select(Alert.id, Stream.stream_id, Alert.incident_id, Alert.detection_id, Alert.type,
+                       Alert.message, Alert.severity, Alert.acknowledged, Alert.acknowledged_by,
+                       Alert.acknowledged_at, Alert.created_at).outerjoin(Stream, Stream.id == Alert.stream_id)
+        
+        if stream_id:
+            query = query.where(Stream.stream_id == stream_id)
+        if since is not None:
+            query = query.where(Alert.created_at >= since)
+        if until is not None:
+            query = query.where(Alert.created_at < until)
+        if alert_type:
+            query = query.where(Alert.type == alert_type)
+        if acknowledged is not None:
+            query = query.where(Alert.acknowledged == acknowledged)
+        
+        return self._stream_rows(query.order_by(Alert.created_at, Alert.id), batch_size)
+    
+    async def get_thumbnail(self, thumbnail_id: str) -> Optional[bytes]:
+        """Получение JPEG миниатюры по ключу содержимого"""
+        async def run(db: AsyncSession):
+            return await db.scalar(select(Thumbnail.data).where(Thumbnail.id == thumbnail_id))
+        
+        return await self._read(run)
+    
+    async def get_detection_thumbnail(self, detection_id: int) -> Optional[bytes]:
+        """Получение JPEG миниатюры детекции"""
+        async def run(db: AsyncSession):
+            return await db.scalar(
+                select(Thumbnail.data).join(Detection, Detection.thumbnail_id == Thumbnail.id)
+                .where(Detection.id == detection_id)
+            )
+        
+        return await self._read(run)
+    
+    async def get_alerts(self, limit: int = 100, offset: int = 0,
+                         alert_type: str = None, acknowledged: bool = None,
+                         cursor: str = None) -> List[Dict[str, Any]]:
+        """Получение списка алертов (cursor - по (created_at, id), как в get_detections)"""
+        query = select(*self.ALERT_COLUMNS).outerjoin(Stream, Stream.id == Alert.stream_id)
         
         if alert_type:
-            query = query.filter(Alert.type == alert_type)
+            query = query.where(Alert.type == alert_type)
         
         if acknowledged is not None:
-            query = query.filter(Alert.acknowledged == acknowledged)
+            query = query.where(Alert.acknowledged == acknowledged)
+        
+        if cursor:
+            query = query.where(tuple_(Alert.created_at, Alert.id) < self.decode_cursor(cursor))
+        elif offset:
+            query = query.offset(offset)
         
-        return query.order_by(Alert.created_at.desc()).offset(offset).limit(limit).all()
+        query = query.order_by(Alert.created_at.desc(), Alert.id.desc()).limit(limit)
+        
+        async def run(db: AsyncSession):
+            rows = (await db.execute(query)).all()
+            return [self.alert_to_dict(row) for row in rows]
+        
+        return await self._read(run)
     
-    def acknowledge_alert(self, alert_id: int, acknowledged_by: str = "system") -> bool:
-        """Подтверждение алерта"""
-        alert = self.db.query(Alert).filter(Alert.id == alert_id).first()
-        if alert:
-            alert.acknowledged = True
-            alert.acknowledged_by = acknowledged_by
-            alert.acknowledged_at = datetime.now()
-            self.db.commit()
+    async def get_incidents(self, limit: int = 100, offset: int = 0, stream_id: str = None,
+                            is_open: bool = None, since: datetime = None,
+                            cursor: str = None) -> List[Dict[str, Any]]:
+        """Получение списка инцидентов (cursor - по (started_at, id), как в get_detections)"""
+        query = select(*self.INCIDENT_COLUMNS).join(Stream, Stream.id == Incident.stream_id)
+        
+        if stream_id:
+            query = query.where(Stream.stream_id == stream_id)
+        
+        if is_open is not None:
+            query = query.where(Incident.is_open == is_open)
+        
+        if since is not None:
+            query = query.where(Incident.ended_at > since)
+        
+        if cursor:
+            query = query.where(tuple_(Incident.started_at, Incident.id) < self.decode_cursor(cursor))
+        elif offset:
+            query = query.offset(offset)
+        
+        query = query.order_by(Incident.started_at.desc(), Incident.id.desc()).limit(limit)
+        
+        async def run(db: AsyncSession):
+            rows = (await db.execute(query)).all()
+            return [self.incident_to_dict(row) for row in rows]
+        
+        return await self._read(run)
+    
+    async def get_incident_thumbnail(self, incident_id: int, role: str) -> Optional[bytes]:
+        """Получение JPEG представительной миниатюры инцидента (first, peak или last)"""
+        column = {
+            "first": Incident.first_thumbnail_id,
+            "peak": Incident.peak_thumbnail_id,
+            "last": Incident.last_thumbnail_id
+        }.get(role)
+        if column is None:
+            return None
+        
+        async def run(db: AsyncSession):
+            return await db.scalar(
+                select(Thumbnail.data).join(Incident, column == Thumbnail.id)
+                .where(Incident.id == incident_id)
+            )
+        
+        return await self._read(run)
+    
+    def acknowledge_incident(self, incident_id: int) -> bool:
+        """Подтверждение инцидента вместе с его алертами"""
+        with session_scope() as db:
+            result = db.execute(
+                update(Incident).where(Incident.id == incident_id).values(acknowledged=True)
+            )
+            if result.rowcount == 0:
+                return False
+            db.execute(
+                update(Alert).where(Alert.incident_id == incident_id, Alert.acknowledged == False)
+                .values(acknowledged=True, acknowledged_by="system", acknowledged_at=datetime.now())
+            )
             return True
-        return False
+    
+    def acknowledge_alert(self, alert_id: int, acknowledged_by: str = "system") -> bool:
+        """Подтверждение алерта одним UPDATE"""
+        with session_scope() as db:
+            result = db.execute(
+                update(Alert).where(Alert.id == alert_id)
+                .values(acknowledged=True, acknowledged_by=acknowledged_by, acknowledged_at=datetime.now())
+            )
+            return result.rowcount > 0
     
     def acknowledge_detection(self, detection_id: int) -> bool:
-        """Подтверждение детекции"""
-        detection = self.db.query(Detection).filter(Detection.id == detection_id).first()
-        if detection:
-            detection.acknowledged = True
-            self.db.commit()
-            return True
-        return False
-    
-    def get_statistics(self, days: int = 7) -> Dict[str, Any]:
-        """Получение статистики за указанное количество дней"""
-        start_date = datetime.now() - timedelta(days=days)
-        
-        # Общая статистика детекций
-        total_detections = self.db.query(Detection).filter(
-            Detection.created_at >= start_date
-        ).count()
-        
-        violence_detections = self.db.query(Detection).filter(
-            Detection.created_at >= start_date,
-            Detection.is_violence == True
-        ).count()
-        
-        # Статистика по потокам
-        stream_stats = self.db.query(
-            Stream.stream_id,
-            Stream.name,
-            self.db.func.count(Detection.id).label('total_detections'),
-            self.db.func.count(self.db.case([(Detection.is_violence == True, 1)])).label('violence_detections')
-        ).outerjoin(Detection).filter(
-            Detection.created_at >= start_date
-        ).group_by(Stream.id).all()
-        
-        # Статистика алертов
-        total_alerts = self.db.query(Alert).filter(
-            Alert.created_at >= start_date
-        ).count()
-        
-        unacknowledged_alerts = self.db.query(Alert).filter(
-            Alert.created_at >= start_date,
-            Alert.acknowledged == False
-        ).count()
+        """Подтверждение детекции одним UPDATE"""
+        with session_scope() as db:
+            result = db.execute(
+                update(Detection).where(Detection.id == detection_id).values(acknowledged=True)
+            )
+            return result.rowcount > 0
+    
+    @staticmethod
+    def _rollup_ranges(start: datetime, end: datetime) -> List[tuple]:
+        """Покрытие периода [start, end] агрегатами: минуты по краям часа, часы по краям суток,
+        целые сутки в середине. Возвращает (гранулярность, начало, конец) полуоткрытых интервалов."""
+        start = rollup_bucket(start, "minute")
+        end = rollup_bucket(end, "minute") + ROLLUP_STEPS["minute"]
+        
+        def ceil(moment: datetime, granularity: str) -> datetime:
+            bucket = rollup_bucket(moment, granularity)
+            return bucket if bucket == moment else bucket + ROLLUP_STEPS[granularity]
+        
+        first_hour = ceil(start, "hour")
+        last_hour = rollup_bucket(end, "hour")
+        if first_hour >= last_hour:
+            return [("minute", start, end)]
+        
+        first_day = ceil(first_hour, "day")
+        last_day = rollup_bucket(last_hour, "day")
+        if first_day >= last_day:
+            middle = [("hour", first_hour, last_hour)]
+        else:
+            middle = [("hour", first_hour, first_day), ("day", first_day, last_day), ("hour", last_day, last_hour)]
+        
+        ranges = [("minute", start, first_hour), *middle, ("minute", last_hour, end)]
+        return [(granularity, begin, finish) for granularity, begin, finish in ranges if begin < finish]
+    
+    async def get_statistics(self, days: int = 7) -> Dict[str, Any]:
+        """Получение статистики за указанное количество дней по агрегатам stats_rollups"""
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=days)
+        
+        # Число читаемых строк зависит от числа интервалов, а не от числа детекций
+        in_period = or_(*[
+            and_(StatsRollup.granularity == granularity,
+                 StatsRollup.bucket_start >= begin,
+                 StatsRollup.bucket_start < finish)
+            for granularity, begin, finish in self._rollup_ranges(start_date, end_date)
+        ])
+        
+        async def run(db: AsyncSession):
+            # Статистика по потокам
+            stream_stats = (await db.execute(
+                select(
+                    Stream.stream_id,
+                    Stream.name,
+                    func.sum(StatsRollup.windows).label('windows'),
+                    func.sum(StatsRollup.violent_windows).label('violent_windows'),
+                    func.sum(StatsRollup.incidents).label('incidents')
+                ).join(Stream, Stream.id == StatsRollup.stream_id).where(
+                    in_period
+                ).group_by(Stream.id, Stream.stream_id, Stream.name)
+            )).all()
+            
+            # Статистика алертов (один алерт на инцидент, таблица небольшая)
+            total_alerts, unacknowledged_alerts = (await db.execute(
+                select(
+                    func.count(Alert.id),
+                    func.count(case((Alert.acknowledged == False, 1)))
+                ).where(Alert.created_at >= start_date)
+            )).one()
+            
+            return stream_stats, total_alerts, unacknowledged_alerts
+        
+        stream_stats, total_alerts, unacknowledged_alerts = await self._read(run)
+        
+        total_detections = sum(stat.windows for stat in stream_stats)
+        violence_detections = sum(stat.violent_windows for stat in stream_stats)
         
         return {
             'period_days': days,
             'total_detections': total_detections,
             'violence_detections': violence_detections,
             'violence_percentage': (violence_detections / total_detections * 100) if total_detections > 0 else 0,
+            'total_incidents': sum(stat.incidents for stat in stream_stats),
             'stream_statistics': [
                 {
                     'stream_id': stat.stream_id,
                     'name': stat.name,
-                    'total_detections': stat.total_detections,
-                    'violence_detections': stat.violence_detections
+                    'total_detections': stat.windows,
+                    'violence_detections': stat.violent_windows,
+                    'incidents': stat.incidents
                 }
                 for stat in stream_stats
             ],
@@ -205,29 +670,161 @@ class AlertService:
             'unacknowledged_alerts': unacknowledged_alerts
         }
     
-    def cleanup_old_data(self, days: int = 30) -> Dict[str, int]:
-        """Очистка старых данных"""
-        cutoff_date = datetime.now() - timedelta(days=days)
+    @staticmethod
+    def _spread_windows(started_at: datetime, ended_at: datetime, windows: int) -> List[tuple]:
+        """Окна инцидента по минутам: [(момент внутри минуты, число окон)].
         
-        # Удаляем старые детекции
-        old_detections = self.db.query(Detection).filter(
-            Detection.created_at < cutoff_date
-        ).delete()
+        Первое окно приходится на минуту начала, последнее - на минуту конца,
+        остальные делятся пропорционально времени инцидента в каждой минуте.
+        """
+        step = ROLLUP_STEPS["minute"]
+        first = rollup_bucket(started_at, "minute")
+        last = rollup_bucket(ended_at, "minute")
+        if first >= last or windows < 2:
+            return [(started_at, windows)]
         
-        # Удаляем старые алерты
-        old_alerts = self.db.query(Alert).filter(
-            Alert.created_at < cutoff_date
-        ).delete()
+        buckets = [first]
+        while buckets[-1] < last:
+            buckets.append(buckets[-1] + step)
+        counts = [0] * len(buckets)
+        counts[0] = counts[-1] = 1
+        total = (ended_at - started_at).total_seconds()
+        shares = [
+            (min(ended_at, bucket + step) - max(started_at, bucket)).total_seconds() / total * (windows - 2)
+            for bucket in buckets
+        ]
+        # Метод наибольших остатков: сумма по минутам равна числу окон
+        for index, share in enumerate(shares):
+            counts[index] += int(share)
+        remainders = sorted(range(len(buckets)), key=lambda index: shares[index] - int(shares[index]),
+                            reverse=True)
+        for index in remainders[:windows - sum(counts)]:
+            counts[index] += 1
+        return [(max(started_at, bucket), count) for bucket, count in zip(buckets, counts) if count]
+    
+    def rebuild_rollups(self, days: int = None, chunk_size: int = 5000) -> Dict[str, Any]:
+        """Пересчет агрегатов статистики из сохраненных данных (за days суток или за все время).
         
-        # Удаляем старые системные события
-        old_events = self.db.query(SystemEvent).filter(
-            SystemEvent.created_at < cutoff_date
-        ).delete()
+        Окна с насилием берутся из инцидентов, детекции учитываются только до первого
+        инцидента - это данные, записанные до появления инцидентов. При записи каждое окно
+        попадает в интервал своего времени, а инцидент хранит только начало, конец и число
+        окон, поэтому окна инцидента, пересекающего границу минуты, распределяются по
+        минутам пропорционально длительности (первое и последнее окно - в интервалы начала
+        и конца), средняя уверенность и пик берутся для всех его интервалов. Для таких
+        инцидентов (spread_incidents в результате) поминутные и почасовые разбивки
+        приблизительны, итоги за весь инцидент точны. Пересчитываются только столбцы насилия и инцидентов:
+        окна без насилия в базе не хранятся, поэтому windows существующих агрегатов
+        сохраняется и берется из данных только для интервалов без агрегата. Интервалы,
+        исходные строки которых уже удалены очисткой, не пересчитываются.
+        """
+        since = rollup_bucket(datetime.now() - timedelta(days=days), "day") if days else None
+        # Начало пересчета для каждой гранулярности
+        bounds: Dict[str, Optional[datetime]] = dict.fromkeys(ROLLUP_GRANULARITIES, since)
+        rollups: Dict[tuple, Dict[str, Any]] = {}
         
-        self.db.commit()
+        def add(stream_pk: int, moment: datetime, windows: int, violent_windows: int,
+                incidents: int, confidence_sum: float, max_confidence: float):
+            for granularity in ROLLUP_GRANULARITIES:
+                key = (granularity, rollup_bucket(moment, granularity), stream_pk)
+                if bounds[granularity] and key[1] < bounds[granularity]:
+                    continue
+                rollup = rollups.setdefault(key, {
+                    'granularity': key[0], 'bucket_start': key[1], 'stream_id': stream_pk,
+                    'windows': 0, 'violent_windows': 0, 'incidents': 0,
+                    'confidence_sum': 0.0, 'max_confidence': 0.0
+                })
+                rollup['windows'] += windows
+                rollup['violent_windows'] += violent_windows
+                rollup['incidents'] += incidents
+                rollup['confidence_sum'] += confidence_sum
+                rollup['max_confidence'] = max(rollup['max_confidence'], max_confidence)
         
-        return {
-            'deleted_detections': old_detections,
-            'deleted_alerts': old_alerts,
-            'deleted_events': old_events
-        } 
\ No newline at end of file
+        def rebuilt():
+            """Условие на агрегаты, которые заменяются пересчитанными"""
+            return or_(*[
+                and_(StatsRollup.granularity == granularity, StatsRollup.bucket_start >= bound)
+                if bound else StatsRollup.granularity == granularity
+                for granularity, bound in bounds.items()
+            ])
+        
+        counts = {'incidents': 0, 'detections': 0, 'spread_incidents': 0}
+        with session_scope() as db:
+            first_incident = db.scalar(select(func.min(Incident.started_at)))
+            first_detection = db.scalar(select(func.min(Detection.timestamp)))
+            sources = [moment for moment in (first_incident, first_detection) if moment is not None]
+            if not sources:
+                return {**counts, 'rollups': 0, 'since': None}
+            
+            # Агрегаты старше самых ранних исходных строк остались от удаленных данных:
+            # пересчитываются только интервалы, целиком лежащие после них
+            earliest = min(sources)
+            purged = db.scalar(select(StatsRollup.stream_id).where(or_(*[
+                and_(StatsRollup.granularity == granularity,
+                     StatsRollup.bucket_start < rollup_bucket(earliest, granularity))
+                for granularity in ROLLUP_GRANULARITIES
+            ])).limit(1))
+            if purged is not None:
+                for granularity in ROLLUP_GRANULARITIES:
+                    bucket = rollup_bucket(earliest, granularity)
+                    covered = bucket if bucket == earliest else bucket + ROLLUP_STEPS[granularity]
+                    bounds[granularity] = max(since, covered) if since else covered
+                since = bounds["minute"]
+            
+            # Чтение порциями по id, чтобы не держать всю таблицу в памяти
+            last_id = 0
+            while True:
+                query = select(Incident.id, Incident.stream_id, Incident.started_at, Incident.ended_at,
+                           Incident.window_count,
+                               Incident.mean_confidence, Incident.peak_confidence).where(Incident.id > last_id)
+                if since:
+                    # Инцидент, начавшийся раньше since, может продолжаться в пересчитываемых интервалах
+                    query = query.where(Incident.ended_at >= since)
+                rows = db.execute(query.order_by(Incident.id).limit(chunk_size)).all()
+                if not rows:
+                    break
+                for row in rows:
+                    parts = self._spread_windows(row.started_at, row.ended_at, row.window_count)
+                    if len(parts) > 1:
+                        counts['spread_incidents'] += 1
+                    for index, (moment, windows) in enumerate(parts):
+                        # Инцидент учитывается в интервале, где он начался
+                        add(row.stream_id, moment, windows, windows, int(index == 0),
+                            row.mean_confidence * windows, row.peak_confidence)
+                counts['incidents'] += len(rows)
+                last_id = rows[-1].id
+            
+            last_id = 0
+            while True:
+                query = select(Detection.id, Detection.stream_id, Detection.timestamp,
+                               Detection.is_violence, Detection.confidence).where(Detection.id > last_id)
+                if since:
+                    query = query.where(Detection.timestamp >= since)
+                if first_incident:
+                    query = query.where(Detection.timestamp < first_incident)
+                rows = db.execute(query.order_by(Detection.id).limit(chunk_size)).all()
+                if not rows:
+                    break
+                for row in rows:
+                    add(row.stream_id, row.timestamp, 1, int(row.is_violence), 0,
+                        row.confidence if row.is_violence else 0.0,
+                        row.confidence if row.is_violence else 0.0)
+                counts['detections'] += len(rows)
+                last_id = rows[-1].id
+            
+            # windows существующих агрегатов сохраняется, остальные столбцы пересчитываются
+            existing = db.execute(select(StatsRollup.granularity, StatsRollup.bucket_start,
+                                         StatsRollup.stream_id, StatsRollup.windows).where(rebuilt()))
+            for granularity, bucket_start, stream_pk, windows in existing:
+                rollup = rollups.setdefault((granularity, bucket_start, stream_pk), {
+                    'granularity': granularity, 'bucket_start': bucket_start, 'stream_id': stream_pk,
+                    'violent_windows': 0, 'incidents': 0, 'confidence_sum': 0.0, 'max_confidence': 0.0
+                })
+                rollup['windows'] = windows
+            
+            # Старые агрегаты заменяются пересчитанными в той же транзакции
+            db.execute(delete(StatsRollup).where(rebuilt()))
+            rows = list(rollups.values())
+            for offset in range(0, len(rows), chunk_size):
+                db.execute(insert(StatsRollup), rows[offset:offset + chunk_size])
+        
+        return {**counts, 'rollups': len(rollups), 'since': since}
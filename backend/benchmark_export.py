@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Замер скорости выгрузки детекций (строк в секунду) на синтетической таблице.
+
+По умолчанию создает отдельную базу SQLite с миллионом детекций, чтобы не
+трогать рабочую; для PostgreSQL передайте --database-url на тестовую базу.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import resource
+import sys
+import time
+from datetime import datetime, timedelta
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Замер скорости выгрузки детекций")
+    parser.add_argument("--database-url", default="sqlite:///./export_benchmark.db")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--formats", default="csv,ndjson,parquet")
+    return parser.parse_args()
+
+def fill(rows: int):
+    """Заполнение таблицы detections синтетическими строками, если их меньше rows"""
+    from sqlalchemy import func, insert, select
+    from database import session_scope, Detection
+    from alert_service import AlertService
+
+    service = AlertService()
+    stream_pks = [service.register_stream(f"bench_{index}", f"Bench {index}", f"rtsp://bench/{index}")
+                  for index in range(8)]
+    with session_scope() as db:
+        existing = db.scalar(select(func.count()).select_from(Detection))
+    if existing >= rows:
+        return
+
+    print(f"📝 Заполнение: {rows - existing} строк")
+    start = datetime.now() - timedelta(days=30)
+    chunk = 50_000
+    for offset in range(existing, rows, chunk):
+        with session_scope() as db:
+            db.execute(insert(Detection), [
+                {
+                    "stream_id": random.choice(stream_pks),
+                    "timestamp": start + timedelta(seconds=index * 2),
+                    "is_violence": random.random() < 0.1,
+                    "confidence": random.random(),
+                    "processed": False,
+                    "acknowledged": False
+                }
+                for index in range(offset, min(offset + chunk, rows))
+            ])
+
+async def measure(fmt: str, batch_size: int):
+    from alert_service import AlertService
+    from exporters import export_stream
+
+    service = AlertService()
+    rows = 0
+
+    async def counted():
+        nonlocal rows
+        async for batch in service.stream_detections(batch_size=batch_size):
+            rows += len(batch)
+            yield batch
+
+    size = 0
+    started = time.perf_counter()
+    async for chunk in export_stream(counted(), AlertService.DETECTION_EXPORT_COLUMNS, fmt):
+        size += len(chunk)
+    elapsed = time.perf_counter() - started
+    max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{fmt:>8}: {rows} строк за {elapsed:.1f} с, {rows / elapsed:,.0f} строк/с, "
+          f"{size / 1024 / 1024:.1f} МБ, пик RSS процесса {max_rss_mb:.0f} МБ")
+
+def main():
+    """Основная функция"""
+    args = parse_args()
+    # Настройки базы читаются при импорте database
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    from database import create_tables, dispose_async_engine
+    create_tables()
+    fill(args.rows)
+
+    print("⏱  Выгрузка детекций")
+    print("=" * 50)
+
+    async def run():
+        for fmt in args.formats.split(","):
+            await measure(fmt, args.batch_size)
+        await dispose_async_engine()
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    main()
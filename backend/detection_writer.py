@@ -0,0 +1,406 @@
+import atexit
+import hashlib
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set
+from database import ROLLUP_GRANULARITIES, rollup_bucket
+
+@dataclass
+class PendingDetection:
+    """Детекция, ожидающая записи в базу данных"""
+    stream_id: str
+    timestamp: float
+    is_violence: bool
+    confidence: float
+    thumbnail_id: Optional[str] = None
+
+@dataclass
+class IncidentState:
+    """Инцидент в памяти writer'а: окна с насилием подряд на одном потоке"""
+    stream_id: str
+    started_at: float
+    ended_at: float
+    peak_confidence: float
+    confidence_sum: float = 0.0
+    window_count: int = 0
+    # Представительные миниатюры: роль (first/peak/last) -> thumbnail_id
+    thumbnail_ids: Dict[str, str] = field(default_factory=dict)
+    # Уже сохраненные миниатюры: роль -> (thumbnail_id, SHA-256 содержимого)
+    thumbnails: Dict[str, tuple] = field(default_factory=dict)
+    db_id: Optional[int] = None
+    is_open: bool = True
+    dirty: bool = True
+
+    def add(self, detection: PendingDetection):
+        self.ended_at = detection.timestamp
+        self.window_count += 1
+        self.confidence_sum += detection.confidence
+        if detection.thumbnail_id:
+            self.thumbnail_ids.setdefault("first", detection.thumbnail_id)
+            self.thumbnail_ids["last"] = detection.thumbnail_id
+            if detection.confidence >= self.peak_confidence or "peak" not in self.thumbnail_ids:
+                self.thumbnail_ids["peak"] = detection.thumbnail_id
+        self.peak_confidence = max(self.peak_confidence, detection.confidence)
+        self.dirty = True
+
+    @property
+    def mean_confidence(self) -> float:
+        return self.confidence_sum / self.window_count if self.window_count else 0.0
+
+class DetectionWriter:
+    """Отложенная пакетная запись детекций, инцидентов и алертов в базу данных.
+
+    Потоки детекции только кладут результат в очередь; отдельный поток-писатель
+    накапливает пакет, объединяет окна с насилием в инциденты и записывает все
+    одной транзакцией, когда пакет заполнен или истек интервал сброса.
+    Инцидент обновляется на месте, пока он продолжается, и закрывается, если
+    новых окон с насилием нет дольше incident_gap секунд. Сырые окна пишутся
+    в detections только при store_raw_detections. Миниатюры записываются
+    в отдельную таблицу thumbnails по SHA-256 содержимого, строки детекций
+    и инцидентов хранят только ключ; у инцидента хранятся первый кадр, кадр
+    пика (прежний удаляется при смене) и последний кадр (при закрытии). Каждое окно (с насилием или без)
+    учитывается в агрегатах статистики stats_rollups, которые пишутся
+    приращениями вместе с пакетом. После каждой успешной записи вызывается
+    on_flush(потоки с новыми детекциями, потоки с новыми алертами, есть ли
+    приращения статистики) - например, для сброса кэша запросов.
+    Пока база недоступна, несохраненное копится в памяти не больше max_queue
+    записей каждого вида: лишними становятся самые старые детекции, закрытые
+    инциденты (вместе с их миниатюрами) и поминутные агрегаты, а повтор записи
+    откладывается с растущей паузой до max_retry_interval секунд.
+    """
+
+    def __init__(self, alert_service, thumbnail_cache=None, flush_interval: float = 1.0,
+                 batch_size: int = 200, max_queue: int = 10000,
+                 incident_gap: float = 5.0, store_raw_detections: bool = False,
+                 max_retry_interval: float = 30.0,
+                 on_flush: Optional[Callable[[Set[str], Set[str], bool], None]] = None):
+        self.alert_service = alert_service
+        self.thumbnail_cache = thumbnail_cache
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.incident_gap = incident_gap
+        self.store_raw_detections = store_raw_detections
+        self.max_retry_interval = max_retry_interval
+        self.on_flush = on_flush
+        self.queue: "queue.Queue[PendingDetection]" = queue.Queue(maxsize=max_queue)
+        self.thread: Optional[threading.Thread] = None
+        self.stop_event = threading.Event()
+
+        # Открытые инциденты по потокам и закрытые, еще не записанные в БД
+        self.open_incidents: Dict[str, IncidentState] = {}
+        self.closed_incidents: List[IncidentState] = []
+        # Сырые детекции, которые не удалось записать; повторяются при следующем сбросе
+        self.pending_records: List[Dict] = []
+        # Миниатюры для записи вместе со следующим пакетом: SHA-256 -> JPEG
+        self.pending_thumbnails: Dict[str, bytes] = {}
+        # Замененные миниатюры инцидентов (сменился пик): удаляются, если на них больше нет ссылок
+        self.obsolete_thumbnails: Set[str] = set()
+        # Приращения агрегатов статистики: (stream_id, гранулярность, начало интервала) -> счетчики
+        self.pending_rollups: Dict[tuple, Dict] = {}
+
+        # Статистика
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.dropped_incidents = 0
+        self.dropped_rollups = 0
+        self.failed_flushes = 0
+        self.consecutive_failures = 0
+        self.batches = 0
+        self.incidents_opened = 0
+        self.incidents_closed = 0
+        self.max_depth = 0
+        self.last_flush_ms = 0.0
+        self.last_error: Optional[str] = None
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="detection-writer", daemon=True)
+        self.thread.start()
+        # Сброс очереди даже при выходе без штатного shutdown
+        atexit.register(self.stop)
+
+    def stop(self, timeout: float = 10.0):
+        """Остановка с записью всего, что осталось в очереди"""
+        if not self.thread:
+            return
+        self.stop_event.set()
+        self.thread.join(timeout=timeout)
+        if self.thread.is_alive():
+            print(f"Detection writer did not finish in {timeout}s, "
+                  f"{self.queue.qsize() + len(self.pending_records)} detections not saved")
+        self.thread = None
+        atexit.unregister(self.stop)
+
+    def submit(self, detection: PendingDetection) -> bool:
+        """Постановка детекции в очередь записи (не блокирует поток детекции)"""
+        try:
+            self.queue.put_nowait(detection)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.submitted += 1
+        depth = self.queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+    def run(self):
+        while not self.stop_event.is_set():
+            batch = self._collect(self.flush_interval)
+            self._process(batch)
+            self._close_stale(time.time())
+            if self._has_pending():
+                self._flush()
+
+        # Финальный сброс: записываем все, что осталось, и закрываем инциденты
+        while True:
+            batch = self._collect(0)
+            self._process(batch)
+            if not batch:
+                break
+        for incident in list(self.open_incidents.values()):
+            self._close(incident)
+        if self._has_pending() and not self._flush():
+            print(f"Detection writer: dropping {len(self.pending_records)} detections and "
+                  f"{len(self.closed_incidents)} incidents on shutdown")
+
+    def _collect(self, timeout: float) -> List[PendingDetection]:
+        """Сбор пакета: до batch_size записей или до истечения timeout"""
+        batch = []
+        deadline = time.monotonic() + timeout
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0 and not self.stop_event.is_set():
+                    batch.append(self.queue.get(timeout=remaining))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _process(self, batch: List[PendingDetection]):
+        """Объединение окон пакета в инциденты и агрегаты статистики"""
+        for item in batch:
+            incident = self.open_incidents.get(item.stream_id)
+            if incident and item.timestamp - incident.ended_at > self.incident_gap:
+                self._close(incident)
+                incident = None
+
+            opened = item.is_violence and incident is None
+            self._add_rollup(item, opened)
+
+            if item.is_violence:
+                if incident is None:
+                    incident = IncidentState(
+                        stream_id=item.stream_id,
+                        started_at=item.timestamp,
+                        ended_at=item.timestamp,
+                        peak_confidence=item.confidence
+                    )
+                    self.open_incidents[item.stream_id] = incident
+                    self.incidents_opened += 1
+                incident.add(item)
+
+            if item.is_violence and self.store_raw_detections:
+                self.pending_records.append({
+                    "stream_id": item.stream_id,
+                    "timestamp": datetime.fromtimestamp(item.timestamp),
+                    "is_violence": item.is_violence,
+                    "confidence": item.confidence,
+                    "thumbnail_id": self._store_thumbnail(item.thumbnail_id)
+                })
+
+        self._trim_pending()
+
+    def _trim_pending(self):
+        """Ограничение несохраненного: не держим в памяти больше, чем вмещает очередь"""
+        limit = self.queue.maxsize
+        if limit <= 0:
+            return
+        trimmed = False
+        overflow = len(self.pending_records) - limit
+        if overflow > 0:
+            del self.pending_records[:overflow]
+            self.dropped += overflow
+            trimmed = True
+
+        overflow = len(self.closed_incidents) - limit
+        if overflow > 0:
+            del self.closed_incidents[:overflow]
+            self.dropped_incidents += overflow
+            trimmed = True
+
+        overflow = len(self.pending_rollups) - limit
+        if overflow > 0:
+            # Первыми уходят самые старые поминутные агрегаты: почасовые и суточные
+            # нужны для статистики за длинные периоды
+            oldest = sorted(self.pending_rollups, key=lambda key: (key[1] != "minute", key[2]))[:overflow]
+            for key in oldest:
+                del self.pending_rollups[key]
+            self.dropped_rollups += overflow
+
+        # Замененные миниатюры без ссылок потом удалит очистка по сроку хранения
+        overflow = len(self.obsolete_thumbnails) - limit
+        if overflow > 0:
+            for digest in list(self.obsolete_thumbnails)[:overflow]:
+                self.obsolete_thumbnails.discard(digest)
+
+        if trimmed:
+            # JPEG остаются только для детекций и инцидентов, которые еще будут записаны
+            referenced = {record["thumbnail_id"] for record in self.pending_records}
+            for incident in self.closed_incidents + list(self.open_incidents.values()):
+                referenced.update(digest for _, digest in incident.thumbnails.values())
+            self.pending_thumbnails = {digest: jpeg for digest, jpeg in self.pending_thumbnails.items()
+                                       if digest in referenced}
+
+    def _add_rollup(self, item: PendingDetection, opened_incident: bool):
+        moment = datetime.fromtimestamp(item.timestamp)
+        for granularity in ROLLUP_GRANULARITIES:
+            key = (item.stream_id, granularity, rollup_bucket(moment, granularity))
+            rollup = self.pending_rollups.get(key)
+            if rollup is None:
+                rollup = self.pending_rollups[key] = {
+                    "stream_id": item.stream_id,
+                    "granularity": granularity,
+                    "bucket_start": key[2],
+                    "windows": 0,
+                    "violent_windows": 0,
+                    "incidents": 0,
+                    "confidence_sum": 0.0,
+                    "max_confidence": 0.0
+                }
+            rollup["windows"] += 1
+            if item.is_violence:
+                rollup["violent_windows"] += 1
+                rollup["confidence_sum"] += item.confidence
+                rollup["max_confidence"] = max(rollup["max_confidence"], item.confidence)
+            if opened_incident:
+                rollup["incidents"] += 1
+
+    def _close_stale(self, now: float):
+        """Закрытие инцидентов, по которым давно нет окон с насилием"""
+        for incident in list(self.open_incidents.values()):
+            if now - incident.ended_at > self.incident_gap:
+                self._close(incident)
+
+    def _close(self, incident: IncidentState):
+        incident.is_open = False
+        incident.dirty = True
+        self.open_incidents.pop(incident.stream_id, None)
+        self.closed_incidents.append(incident)
+        self.incidents_closed += 1
+
+    def _has_pending(self) -> bool:
+        return bool(self.pending_records or self.closed_incidents or self.pending_rollups or
+                    any(incident.dirty for incident in self.open_incidents.values()))
+
+    def _store_thumbnail(self, thumbnail_id: Optional[str]) -> Optional[str]:
+        """Постановка JPEG миниатюры в пакет записи, возвращает ключ содержимого"""
+        if not (self.thumbnail_cache and thumbnail_id):
+            return None
+        jpeg = self.thumbnail_cache.get_jpeg(thumbnail_id)
+        if jpeg is None:
+            return None
+        digest = hashlib.sha256(jpeg).hexdigest()
+        self.pending_thumbnails[digest] = jpeg
+        return digest
+
+    def _incident_record(self, incident: IncidentState) -> Dict:
+        # Сохраняем только миниатюры, которые сменились с прошлой записи
+        for role, thumbnail_id in incident.thumbnail_ids.items():
+            # Последний кадр меняется с каждым окном: сохраняется один раз, при закрытии
+            if role == "last" and incident.is_open:
+                continue
+            stored = incident.thumbnails.get(role)
+            if stored is None or stored[0] != thumbnail_id:
+                digest = self._store_thumbnail(thumbnail_id)
+                if digest:
+                    if stored is not None and stored[1] != digest:
+                        self.obsolete_thumbnails.add(stored[1])
+                    incident.thumbnails[role] = (thumbnail_id, digest)
+        return {
+            "id": incident.db_id,
+            "stream_id": incident.stream_id,
+            "started_at": datetime.fromtimestamp(incident.started_at),
+            "ended_at": datetime.fromtimestamp(incident.ended_at),
+            "peak_confidence": incident.peak_confidence,
+            "mean_confidence": incident.mean_confidence,
+            "window_count": incident.window_count,
+            "thumbnail_ids": {role: digest for role, (_, digest) in incident.thumbnails.items()},
+            "is_open": incident.is_open
+        }
+
+    def _flush(self) -> bool:
+        started = time.perf_counter()
+        incidents = self.closed_incidents + [incident for incident in self.open_incidents.values()
+                                             if incident.dirty]
+        records = self.pending_records
+        try:
+            incident_records = [self._incident_record(incident) for incident in incidents]
+            incident_ids = self.alert_service.save_detections_batch(
+                records, incident_records, self.pending_thumbnails,
+                list(self.pending_rollups.values()), self.obsolete_thumbnails
+            )
+        except Exception as e:
+            self.failed_flushes += 1
+            self.last_error = str(e)
+            print(f"Error writing detection batch ({len(records)} detections, {len(incidents)} incidents): {e}")
+            self._trim_pending()
+            # Пауза перед повтором растет с каждой неудачей подряд
+            self.consecutive_failures += 1
+            delay = min(self.flush_interval, 1.0) * 2 ** min(self.consecutive_failures - 1, 10)
+            self.stop_event.wait(min(delay, self.max_retry_interval))
+            return False
+
+        # Для новых инцидентов записаны и алерты
+        alert_streams = {incident.stream_id for incident in incidents if incident.db_id is None}
+        for incident, incident_id in zip(incidents, incident_ids):
+            incident.db_id = incident_id
+            incident.dirty = False
+        if self.on_flush:
+            try:
+                self.on_flush({record["stream_id"] for record in records}, alert_streams,
+                              bool(self.pending_rollups))
+            except Exception as e:
+                print(f"Detection writer on_flush error: {e}")
+        self.closed_incidents = []
+        self.pending_records = []
+        self.pending_thumbnails = {}
+        self.obsolete_thumbnails = set()
+        self.pending_rollups = {}
+        self.written += len(records)
+        self.batches += 1
+        self.consecutive_failures = 0
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+        return True
+
+    def get_stats(self) -> Dict:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "max_depth": self.max_depth,
+            "queue_size": self.queue.maxsize,
+            "pending_records": len(self.pending_records),
+            "pending_thumbnails": len(self.pending_thumbnails),
+            "pending_thumbnail_bytes": sum(len(jpeg) for jpeg in self.pending_thumbnails.values()),
+            "pending_incidents": len(self.closed_incidents),
+            "pending_rollups": len(self.pending_rollups),
+            "open_incidents": len(self.open_incidents),
+            "incidents_opened": self.incidents_opened,
+            "incidents_closed": self.incidents_closed,
+            "submitted": self.submitted,
+            "written": self.written,
+            "dropped": self.dropped,
+            "dropped_incidents": self.dropped_incidents,
+            "dropped_rollups": self.dropped_rollups,
+            "batches": self.batches,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "last_error": self.last_error
+        }
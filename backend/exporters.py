@@ -0,0 +1,141 @@
+import asyncio
+import base64
+import csv
+import io
+from datetime import datetime
+from typing import AsyncIterator, List, Sequence, Tuple
+import orjson
+
+# Формат выгрузки -> MIME тип и расширение файла
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+# Колонка выгрузки: (имя, тип) где тип - int, str, float, bool, datetime или bytes
+Column = Tuple[str, str]
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def _text_value(value):
+    """Значение для CSV/NDJSON: бинарные данные (миниатюры) в base64"""
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode('ascii')
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+# Кодирование порции выполняется в потоке (asyncio.to_thread), чтобы большие
+# порции не задерживали event loop
+
+async def _csv(batches: AsyncIterator[Sequence[tuple]], columns: List[Column]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def encode(rows: Sequence[tuple]) -> bytes:
+        writer.writerows([_text_value(value) for value in row] for row in rows)
+        data = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    yield encode([[name for name, _ in columns]])
+    async for rows in batches:
+        yield await asyncio.to_thread(encode, rows)
+
+async def _ndjson(batches: AsyncIterator[Sequence[tuple]], columns: List[Column]) -> AsyncIterator[bytes]:
+    names = [name for name, _ in columns]
+    binary = [kind == "bytes" for _, kind in columns]
+
+    def encode(rows: Sequence[tuple]) -> bytes:
+        return b"".join(
+            orjson.dumps({
+                name: base64.b64encode(value).decode('ascii') if is_binary and value is not None else value
+                for name, value, is_binary in zip(names, row, binary)
+            }) + b"\n"
+            for row in rows
+        )
+
+    async for rows in batches:
+        yield await asyncio.to_thread(encode, rows)
+
+class _ChunkSink(io.RawIOBase):
+    """Файл для ParquetWriter, из которого записанные байты забираются по частям"""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks: List[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        chunk = bytes(data)
+        self.chunks.append(chunk)
+        self.position += len(chunk)
+        return len(chunk)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+async def _parquet(batches: AsyncIterator[Sequence[tuple]], columns: List[Column]) -> AsyncIterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {
+        "int": pa.int64(),
+        "str": pa.string(),
+        "float": pa.float64(),
+        "bool": pa.bool_(),
+        "datetime": pa.timestamp("us"),
+        "bytes": pa.binary(),
+    }
+    schema = pa.schema([(name, types[kind]) for name, kind in columns])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+
+    def encode(rows: Sequence[tuple]) -> bytes:
+        arrays = [pa.array([row[index] for row in rows], type=schema.field(index).type)
+                  for index in range(len(columns))]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        return sink.drain()
+
+    def finish() -> bytes:
+        writer.close()
+        return sink.drain()
+
+    # Каждая порция строк - отдельная группа строк Parquet, в памяти только она
+    try:
+        async for rows in batches:
+            data = await asyncio.to_thread(encode, rows)
+            if data:
+                yield data
+    except BaseException:
+        writer.close()
+        raise
+    data = await asyncio.to_thread(finish)
+    if data:
+        yield data
+
+def export_stream(batches: AsyncIterator[Sequence[tuple]], columns: List[Column],
+                  fmt: str) -> AsyncIterator[bytes]:
+    """Поток байтов выгрузки в формате fmt из порций строк"""
+    if fmt == "csv":
+        return _csv(batches, columns)
+    if fmt == "ndjson":
+        return _ndjson(batches, columns)
+    if fmt == "parquet":
+        return _parquet(batches, columns)
+    raise ValueError(f"Unsupported export format: {fmt}")
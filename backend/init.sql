@@ -14,49 +14,105 @@ CREATE TABLE IF NOT EXISTS streams (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Миниатюры хранятся отдельно от горячих таблиц, ключ - SHA-256 содержимого
+CREATE TABLE IF NOT EXISTS thumbnails (
+    id VARCHAR(64) PRIMARY KEY,
+    data BYTEA NOT NULL,
+    size INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- detections, alerts и system_events секционированы по суткам; секции на ближайшие
+-- дни создает и устаревшие удаляет backend (partitions.py), DEFAULT принимает остальное
 CREATE TABLE IF NOT EXISTS detections (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     stream_id INTEGER NOT NULL REFERENCES streams(id) ON DELETE CASCADE,
     timestamp TIMESTAMP NOT NULL,
     is_violence BOOLEAN NOT NULL,
     confidence FLOAT NOT NULL,
-    frame_data TEXT,
+    thumbnail_id VARCHAR(64) REFERENCES thumbnails(id),
     processed BOOLEAN DEFAULT FALSE,
     acknowledged BOOLEAN DEFAULT FALSE,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+CREATE TABLE IF NOT EXISTS detections_default PARTITION OF detections DEFAULT;
+
+CREATE TABLE IF NOT EXISTS incidents (
+    id SERIAL PRIMARY KEY,
+    stream_id INTEGER NOT NULL REFERENCES streams(id) ON DELETE CASCADE,
+    started_at TIMESTAMP NOT NULL,
+    ended_at TIMESTAMP NOT NULL,
+    peak_confidence FLOAT NOT NULL,
+    mean_confidence FLOAT NOT NULL,
+    window_count INTEGER NOT NULL DEFAULT 1,
+    first_thumbnail_id VARCHAR(64) REFERENCES thumbnails(id),
+    peak_thumbnail_id VARCHAR(64) REFERENCES thumbnails(id),
+    last_thumbnail_id VARCHAR(64) REFERENCES thumbnails(id),
+    is_open BOOLEAN DEFAULT TRUE,
+    acknowledged BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
 CREATE TABLE IF NOT EXISTS alerts (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     stream_id INTEGER REFERENCES streams(id) ON DELETE CASCADE,
-    detection_id INTEGER REFERENCES detections(id) ON DELETE CASCADE,
+    -- без внешнего ключа: уникальный ключ detections - (id, timestamp)
+    detection_id INTEGER,
+    incident_id INTEGER REFERENCES incidents(id) ON DELETE CASCADE,
     type VARCHAR(50) NOT NULL,
     message TEXT NOT NULL,
     severity VARCHAR(20) DEFAULT 'medium',
     acknowledged BOOLEAN DEFAULT FALSE,
     acknowledged_by VARCHAR(255),
     acknowledged_at TIMESTAMP,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE IF NOT EXISTS alerts_default PARTITION OF alerts DEFAULT;
+
+-- Агрегаты статистики по потокам за минуту, час и сутки
+CREATE TABLE IF NOT EXISTS stats_rollups (
+    granularity VARCHAR(6) NOT NULL,
+    bucket_start TIMESTAMP NOT NULL,
+    stream_id INTEGER NOT NULL REFERENCES streams(id) ON DELETE CASCADE,
+    windows INTEGER NOT NULL DEFAULT 0,
+    violent_windows INTEGER NOT NULL DEFAULT 0,
+    incidents INTEGER NOT NULL DEFAULT 0,
+    confidence_sum FLOAT NOT NULL DEFAULT 0,
+    max_confidence FLOAT NOT NULL DEFAULT 0,
+    PRIMARY KEY (granularity, bucket_start, stream_id)
 );
 
 CREATE TABLE IF NOT EXISTS system_events (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     event_type VARCHAR(100) NOT NULL,
     message TEXT NOT NULL,
     details TEXT,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE IF NOT EXISTS system_events_default PARTITION OF system_events DEFAULT;
 
 -- Создание индексов для оптимизации
 CREATE INDEX IF NOT EXISTS idx_streams_stream_id ON streams(stream_id);
-CREATE INDEX IF NOT EXISTS idx_detections_stream_id ON detections(stream_id);
-CREATE INDEX IF NOT EXISTS idx_detections_timestamp ON detections(timestamp);
-CREATE INDEX IF NOT EXISTS idx_detections_is_violence ON detections(is_violence);
+CREATE INDEX IF NOT EXISTS idx_detections_timestamp_id ON detections(timestamp DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_detections_stream_timestamp ON detections(stream_id, timestamp DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_detections_violence_timestamp ON detections(timestamp DESC, id DESC) WHERE is_violence = TRUE;
 CREATE INDEX IF NOT EXISTS idx_detections_acknowledged ON detections(acknowledged);
+CREATE INDEX IF NOT EXISTS idx_detections_thumbnail_id ON detections(thumbnail_id);
+CREATE INDEX IF NOT EXISTS idx_thumbnails_created_at ON thumbnails(created_at);
 CREATE INDEX IF NOT EXISTS idx_alerts_stream_id ON alerts(stream_id);
 CREATE INDEX IF NOT EXISTS idx_alerts_type ON alerts(type);
-CREATE INDEX IF NOT EXISTS idx_alerts_acknowledged ON alerts(acknowledged);
-CREATE INDEX IF NOT EXISTS idx_alerts_created_at ON alerts(created_at);
+CREATE INDEX IF NOT EXISTS idx_alerts_created_at_id ON alerts(created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_alerts_unacknowledged ON alerts(created_at DESC, id DESC) WHERE acknowledged = FALSE;
+CREATE INDEX IF NOT EXISTS idx_alerts_incident_id ON alerts(incident_id);
+CREATE INDEX IF NOT EXISTS idx_incidents_stream_id ON incidents(stream_id);
+CREATE INDEX IF NOT EXISTS idx_incidents_started_at ON incidents(started_at);
 CREATE INDEX IF NOT EXISTS idx_system_events_event_type ON system_events(event_type);
 CREATE INDEX IF NOT EXISTS idx_system_events_created_at ON system_events(created_at);
 
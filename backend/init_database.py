@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 """
-Скрипт для инициализации базы данных PostgreSQL
+Скрипт для инициализации базы данных PostgreSQL или встроенной SQLite (DB_BACKEND=sqlite)
 """
 
 import os
@@ -37,22 +37,25 @@ def create_tables():
 def create_indexes():
     """Создание индексов для оптимизации"""
     try:
-        from database import engine
+        from database import engine, IS_SQLITE
         from sqlalchemy import text
         
         indexes = [
-            "CREATE INDEX IF NOT EXISTS idx_detections_stream_id ON detections(stream_id);",
-            "CREATE INDEX IF NOT EXISTS idx_detections_timestamp ON detections(timestamp);",
-            "CREATE INDEX IF NOT EXISTS idx_detections_is_violence ON detections(is_violence);",
             "CREATE INDEX IF NOT EXISTS idx_detections_acknowledged ON detections(acknowledged);",
+            "CREATE INDEX IF NOT EXISTS idx_detections_thumbnail_id ON detections(thumbnail_id);",
             "CREATE INDEX IF NOT EXISTS idx_alerts_stream_id ON alerts(stream_id);",
             "CREATE INDEX IF NOT EXISTS idx_alerts_type ON alerts(type);",
-            "CREATE INDEX IF NOT EXISTS idx_alerts_acknowledged ON alerts(acknowledged);",
-            "CREATE INDEX IF NOT EXISTS idx_alerts_created_at ON alerts(created_at);",
+            "CREATE INDEX IF NOT EXISTS idx_alerts_incident_id ON alerts(incident_id);",
+            "CREATE INDEX IF NOT EXISTS idx_incidents_stream_id ON incidents(stream_id);",
+            "CREATE INDEX IF NOT EXISTS idx_incidents_started_at ON incidents(started_at);",
+            "CREATE INDEX IF NOT EXISTS idx_thumbnails_created_at ON thumbnails(created_at);",
             "CREATE INDEX IF NOT EXISTS idx_streams_stream_id ON streams(stream_id);",
             "CREATE INDEX IF NOT EXISTS idx_system_events_event_type ON system_events(event_type);",
             "CREATE INDEX IF NOT EXISTS idx_system_events_created_at ON system_events(created_at);"
         ]
+        if IS_SQLITE:
+            # Проверка внешнего ключа при удалении детекций (в PostgreSQL ключа нет)
+            indexes.append("CREATE INDEX IF NOT EXISTS idx_alerts_detection_id ON alerts(detection_id);")
         
         with engine.connect() as conn:
             for index_sql in indexes:
@@ -141,17 +144,17 @@ def insert_sample_data():
 
 def main():
     """Основная функция"""
-    print("🚀 Инициализация базы данных PostgreSQL")
+    print("🚀 Инициализация базы данных")
     print("=" * 50)
     
-    # Проверяем переменные окружения
-    database_url = os.getenv("DATABASE_URL")
-    if not database_url:
+    # Проверяем переменные окружения (встроенной SQLite DATABASE_URL не нужен)
+    if not os.getenv("DATABASE_URL") and os.getenv("DB_BACKEND", "").lower() != "sqlite":
         print("❌ DATABASE_URL не установлен в переменных окружения")
         print("Создайте файл .env на основе env.example")
         sys.exit(1)
     
-    print(f"📊 База данных: {database_url}")
+    from database import DATABASE_URL
+    print(f"📊 База данных: {DATABASE_URL}")
     
     # Проверяем подключение
     if not check_database_connection():
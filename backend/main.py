@@ -8,19 +8,32 @@ import time
 import base64
 import signal
 import sys
+import re
 import requests
-from typing import Dict, List, Optional
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends
+from typing import Callable, Dict, List, Optional, Set
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from contextlib import asynccontextmanager
 from pydantic import BaseModel
 from dataclasses import dataclass
 import threading
-import queue
-import aiohttp
+import orjson
+import msgpack
+import uuid
+import itertools
+from collections import deque
 from datetime import datetime
-from database import create_tables, get_db, SessionLocal
+from database import create_tables, dispose_async_engine, engine
+from partitions import PartitionManager
+from retention import RetentionWorker
+from exporters import EXPORT_FORMATS, export_stream, parquet_available
+from query_cache import QueryCache, query_key, table_tags, stream_write_tags
+from telegram_dispatcher import TelegramDispatcher
 from alert_service import AlertService
+from thumbnail_cache import ThumbnailCache
+from detection_writer import DetectionWriter, PendingDetection
 
 # Настройка OpenCV для RTSP
 os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = "rtsp_transport;tcp"
@@ -30,27 +43,99 @@ rtsp_manager = None
 connection_manager = None
 telegram_service = None
 alert_service = None
+detection_bridge = None
+delivery_latency = None
+status_snapshot = None
+event_log = None
+thumbnail_cache = None
+detection_writer = None
+partition_manager = None
+retention_worker = None
+query_cache = None
+telegram_dispatcher = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     global rtsp_manager, connection_manager, telegram_service, alert_service
+    global detection_bridge, delivery_latency, status_snapshot, event_log, thumbnail_cache
+    global detection_writer, partition_manager, retention_worker, query_cache, telegram_dispatcher
     
     # Создаем таблицы базы данных
     create_tables()
     
     rtsp_manager = RTSPManager()
-    connection_manager = ConnectionManager()
-    telegram_service = TelegramService()
+    connection_manager = ConnectionManager(max_queue=system_settings.ws_queue_size,
+                                           max_lag=system_settings.ws_max_lag_seconds)
+    # Единственный путь отправки в Telegram: очередь с ограничением частоты и повторами
+    telegram_dispatcher = TelegramDispatcher(api_url=system_settings.telegram.api_url,
+                                             max_queue=system_settings.telegram.queue_size)
+    await telegram_dispatcher.start()
+    telegram_service = TelegramService(telegram_dispatcher)
+    telegram_service.update_settings(system_settings.telegram)
     alert_service = AlertService()
+    try:
+        print(f"Stream registry warmed: {alert_service.warm_stream_cache()} streams")
+    except Exception as e:
+        print(f"Error warming stream registry: {e}")
+    thumbnail_cache = ThumbnailCache(max_bytes=thumbnail_cache_budget(system_settings),
+                                     size=system_settings.thumbnail_size,
+                                     quality=system_settings.thumbnail_jpeg_quality)
+    
+    # Кэш результатов запросов страниц алертов, истории и статистики
+    query_cache = QueryCache(max_entries=system_settings.query_cache_size,
+                             ttl=system_settings.query_cache_ttl)
+    
+    # Отложенная пакетная запись детекций в базу данных
+    detection_writer = DetectionWriter(alert_service, thumbnail_cache,
+                                       flush_interval=system_settings.db_flush_interval,
+                                       batch_size=system_settings.db_batch_size,
+                                       max_queue=system_settings.db_queue_size,
+                                       incident_gap=system_settings.incident_gap_seconds,
+                                       store_raw_detections=system_settings.store_raw_detections,
+                                       on_flush=invalidate_after_flush)
+    detection_writer.start()
+    
+    # Секции таблиц по суткам (только PostgreSQL после миграции 0006)
+    partition_manager = PartitionManager(engine, premake_days=system_settings.partition_premake_days,
+                                         batch_size=system_settings.retention_batch_size)
+    try:
+        partitioned = partition_manager.refresh()
+        if partitioned:
+            partition_manager.ensure_partitions()
+            print(f"Partitioned tables: {', '.join(partitioned)}")
+    except Exception as e:
+        print(f"Error preparing partitions: {e}")
+    
+    # Фоновая очистка данных старше retention_days
+    retention_worker = RetentionWorker(partition_manager,
+                                       retention_days=system_settings.retention_days,
+                                       interval=system_settings.retention_interval,
+                                       batch_size=system_settings.retention_batch_size,
+                                       max_transaction_seconds=system_settings.retention_max_transaction_seconds,
+                                       pause=system_settings.retention_pause)
+    retention_worker.start()
+    
+    # Мост для передачи результатов детекции из потоков в event loop
+    detection_bridge = DetectionBridge(maxsize=system_settings.detection_queue_size)
+    detection_bridge.attach(asyncio.get_running_loop())
+    delivery_latency = LatencyStats()
+    status_snapshot = StatusSnapshot()
+    event_log = EventLog(maxlen=system_settings.event_log_size)
     
-    # Запускаем фоновую задачу
-    asyncio.create_task(broadcast_detection_results())
+    # Запускаем фоновые задачи
+    background_tasks = [
+        asyncio.create_task(deliver_detection_results()),
+        asyncio.create_task(broadcast_streams_status()),
+        asyncio.create_task(monitor_triton_health()),
+    ]
     
     yield
     
     # Shutdown
     print("Shutting down...")
+    for task in background_tasks:
+        task.cancel()
     if rtsp_manager:
         # Останавливаем все потоки
         for stream_id in list(rtsp_manager.streams.keys()):
@@ -58,6 +143,17 @@ async def lifespan(app: FastAPI):
                 rtsp_manager.stop_detection(stream_id)
             except:
                 pass
+    if retention_worker:
+        retention_worker.stop()
+    if detection_writer:
+        # Записываем накопленные детекции после остановки потоков
+        detection_writer.stop()
+    if telegram_service:
+        # Накопленная сводка уходит до остановки отправителя
+        await telegram_service.drain()
+    if telegram_dispatcher:
+        await telegram_dispatcher.stop()
+    await dispose_async_engine()
 
 app = FastAPI(title="RTSP Violence Detection API", version="1.0.0", lifespan=lifespan)
 
@@ -68,6 +164,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 # Pydantic модели
@@ -82,7 +179,7 @@ class DetectionResult(BaseModel):
     timestamp: float
     is_violence: bool
     confidence: float
-    frame_data: str = ""  # base64 encoded thumbnail
+    thumbnail_id: Optional[str] = None  # ссылка на миниатюру: GET /api/thumbnails/{thumbnail_id}
 
 class StreamStatus(BaseModel):
     id: str
@@ -102,6 +199,15 @@ class TelegramSettings(BaseModel):
     notification_interval: int = 300  # seconds between notifications during ongoing events
     max_notifications: int = 5  # maximum notifications per event
     send_thumbnails: bool = True
+    api_url: str = "https://api.telegram.org"  # Bot API (или локальный Bot API сервер)
+    queue_size: int = 100  # очередь отправки; при переполнении вытесняются самые старые
+    global_rate: float = 30.0  # сообщений в секунду на бота
+    chat_rate: float = 1.0  # сообщений в секунду в личный чат
+    group_rate: float = 0.33  # сообщений в секунду в группу (20 в минуту)
+    max_retries: int = 3  # повторов при 429, 5xx и сетевых ошибках
+    digest_enabled: bool = False  # объединять события нескольких камер в одно сообщение
+    digest_window: float = 3.0  # сколько секунд накапливается сводка
+    digest_max_streams: int = 9  # сводка отправляется сразу, когда в ней столько камер
 
 class SystemSettings(BaseModel):
     # Triton Server Settings
@@ -118,6 +224,32 @@ class SystemSettings(BaseModel):
     max_fps: int = 30
     buffer_size: int = 16
     enable_gpu: bool = True
+    detection_queue_size: int = 1000
+    ws_queue_size: int = 256
+    ws_max_lag_seconds: float = 10.0
+    status_update_interval: float = 1.0
+    event_log_size: int = 10000
+    resume_history_limit: int = 500
+    db_flush_interval: float = 1.0
+    db_batch_size: int = 200
+    db_queue_size: int = 10000
+    
+    # Incident Settings
+    incident_gap_seconds: float = 5.0  # пауза без насилия, после которой инцидент закрывается
+    store_raw_detections: bool = False  # сохранять каждое окно в detections
+    
+    # Preview Settings
+    preview_width: int = 640
+    preview_height: int = 480
+    preview_fps: int = 25
+    preview_jpeg_quality: int = 85
+    
+    # Thumbnail Settings
+    thumbnail_size: int = 128
+    thumbnail_jpeg_quality: int = 80
+    # Сколько секунд миниатюра окна с насилием должна оставаться в кэше (для
+    # инцидентов, уведомлений и просмотра); объем кэша - на max_streams потоков
+    thumbnail_cache_seconds: float = 30.0
     
     # Security Settings
     enable_auth: bool = False
@@ -128,16 +260,36 @@ class SystemSettings(BaseModel):
     enable_recording: bool = False
     max_storage_gb: int = 10
     retention_days: int = 30
+    retention_interval: float = 3600.0  # как часто удаляются устаревшие данные (секунды)
+    partition_premake_days: int = 3  # на сколько суток вперед создаются секции
+    retention_batch_size: int = 1000  # наибольшая порция удаления строк
+    retention_max_transaction_seconds: float = 1.0  # предел длительности одной транзакции очистки
+    retention_pause: float = 0.1  # пауза между порциями (секунды)
+    export_batch_size: int = 1000  # строк в одной порции выгрузки
+    query_cache_ttl: float = 2.0  # сколько секунд хранится результат запроса (0 - без кэша)
+    query_cache_size: int = 256  # наибольшее число кэшированных результатов
     
     # Telegram Settings
     telegram: TelegramSettings = TelegramSettings()
 
+# Пауза цикла детекции: не больше 10 окон в секунду на поток
+DETECTION_INTERVAL = 0.1
+
+def thumbnail_cache_budget(settings: SystemSettings) -> int:
+    """Объем кэша миниатюр: thumbnail_cache_seconds окон каждого из max_streams потоков"""
+    return ThumbnailCache.budget(settings.max_streams, settings.thumbnail_cache_seconds,
+                                 1 / DETECTION_INTERVAL, settings.thumbnail_size)
+
 # Triton клиент
 class TritonClient:
+    # Интервал фоновой проверки здоровья (секунды)
+    HEALTH_CHECK_INTERVAL = 5.0
+    
     def __init__(self, url: str = "localhost:8000"):
         self.url = url
         self.client = None
-        self.connect()
+        # Последний результат проверки здоровья; обновляется фоновой задачей
+        self.healthy = self.connect()
     
     def connect(self):
         """Подключение к Triton серверу"""
@@ -161,6 +313,19 @@ class TritonClient:
         except:
             return False
     
+    def refresh_health(self) -> bool:
+        """Повторная проверка здоровья (блокирующий запрос); True, если состояние изменилось"""
+        if self.client is None:
+            # Сервер был недоступен при подключении: клиент создается без запроса к серверу
+            try:
+                self.client = http.InferenceServerClient(self.url)
+            except Exception:
+                pass
+        healthy = self.is_healthy()
+        changed = healthy != self.healthy
+        self.healthy = healthy
+        return changed
+    
     def predict(self, frame_sequence: np.ndarray) -> tuple[bool, float]:
         """Предсказание насилия в последовательности кадров"""
         try:
@@ -212,6 +377,8 @@ class RTSPProcessor:
         self.cap = None
         self.is_running = False
         self.frame_buffer = []
+        # Последний кадр буфера в uint8 (для миниатюр)
+        self.last_model_frame = None
         # Используем настройки из глобальной переменной
         self.buffer_size = system_settings.buffer_size
         
@@ -222,8 +389,8 @@ class RTSPProcessor:
         self.last_detection = None
         self.start_time = time.time()
         
-        # Очередь результатов
-        self.results_queue = queue.Queue()
+        # Последние результаты детекции (для REST API)
+        self.recent_results = deque(maxlen=100)
         
         # Поток для детекции (отдельный от основного потока чтения)
         self.detection_thread = None
@@ -232,6 +399,16 @@ class RTSPProcessor:
         # Блокировка для синхронизации доступа к буферу
         self.buffer_lock = threading.Lock()
         
+        # Буфер превью: один слот с последним декодированным кадром (uint8, уже уменьшенным).
+        # Заполняется только пока есть зрители, буфер модели для отображения не используется
+        self.preview_lock = threading.Lock()
+        self.preview_viewers = 0
+        self.preview_frame = None
+        self.preview_seq = 0
+        self._preview_time = 0.0
+        self._preview_jpeg = None
+        self._preview_jpeg_seq = -1
+        
         # Флаги для безопасного завершения
         self._shutdown_event = threading.Event()
         self._frame_thread = None
@@ -264,8 +441,8 @@ class RTSPProcessor:
         """Обработка одного кадра"""
         try:
             # Изменение размера и нормализация для нашей модели
-            frame = cv2.resize(frame, (224, 224))
-            frame = frame.astype(np.float32) / 255.0
+            resized = cv2.resize(frame, (224, 224))
+            frame = resized.astype(np.float32) / 255.0
             
             # Преобразование в формат CHW (3, 224, 224)
             frame = np.transpose(frame, (2, 0, 1))  # (C, H, W)
@@ -273,6 +450,7 @@ class RTSPProcessor:
             # Безопасное добавление в буфер
             with self.buffer_lock:
                 self.frame_buffer.append(frame)
+                self.last_model_frame = resized
                 
                 # Используем актуальный размер буфера из настроек
                 current_buffer_size = system_settings.buffer_size
@@ -282,6 +460,73 @@ class RTSPProcessor:
         except Exception as e:
             print(f"Error processing frame: {e}")
     
+    def attach_viewer(self):
+        """Регистрация зрителя превью"""
+        with self.preview_lock:
+            self.preview_viewers += 1
+    
+    def detach_viewer(self):
+        """Отключение зрителя превью; без зрителей слот превью освобождается"""
+        with self.preview_lock:
+            self.preview_viewers = max(0, self.preview_viewers - 1)
+            if self.preview_viewers == 0:
+                self._reset_preview()
+    
+    def _reset_preview(self):
+        self.preview_frame = None
+        self._preview_jpeg = None
+        self._preview_jpeg_seq = -1
+    
+    def update_preview(self, frame: np.ndarray):
+        """Обновление слота превью исходным кадром (вызывается в потоке чтения)"""
+        if self.preview_viewers == 0:
+            return
+        
+        # Ограничиваем частоту обновления превью
+        current_time = time.time()
+        if current_time - self._preview_time < 1.0 / max(1, system_settings.preview_fps):
+            return
+        self._preview_time = current_time
+        
+        try:
+            # Уменьшаем один раз при декодировании с сохранением пропорций (без увеличения)
+            height, width = frame.shape[:2]
+            scale = min(system_settings.preview_width / width,
+                        system_settings.preview_height / height, 1.0)
+            if scale < 1.0:
+                frame = cv2.resize(frame, (int(width * scale), int(height * scale)),
+                                   interpolation=cv2.INTER_AREA)
+            
+            with self.preview_lock:
+                if self.preview_viewers == 0:
+                    return
+                self.preview_frame = frame
+                self.preview_seq += 1
+        except Exception as e:
+            print(f"Error updating preview for {self.stream_id}: {e}")
+    
+    def get_preview_jpeg(self) -> tuple[int, Optional[bytes]]:
+        """JPEG последнего кадра превью. Кодируется один раз на кадр и разделяется между зрителями"""
+        with self.preview_lock:
+            seq = self.preview_seq
+            frame = self.preview_frame
+            if frame is None:
+                return seq, None
+            if self._preview_jpeg_seq == seq:
+                return seq, self._preview_jpeg
+        
+        ok, buffer = cv2.imencode('.jpg', frame,
+                                  [cv2.IMWRITE_JPEG_QUALITY, system_settings.preview_jpeg_quality])
+        if not ok:
+            return seq, None
+        jpeg = buffer.tobytes()
+        
+        with self.preview_lock:
+            if self.preview_seq == seq:
+                self._preview_jpeg = jpeg
+                self._preview_jpeg_seq = seq
+        return seq, jpeg
+    
     def detect_violence(self) -> Optional[DetectionResult]:
         """Детекция насилия в буфере кадров"""
         try:
@@ -294,6 +539,7 @@ class RTSPProcessor:
                     return None
                 # Создаем копию буфера для обработки
                 frame_buffer_copy = self.frame_buffer.copy()
+                last_frame = self.last_model_frame
             
             # Подготовка данных для модели
             frame_sequence = np.stack(frame_buffer_copy, axis=0)  # (16, 3, 224, 224)
@@ -305,45 +551,33 @@ class RTSPProcessor:
             # Предсказание через Triton
             is_violence, confidence = self.triton_client.predict(frame_sequence)
             
-            # Создание thumbnail последнего кадра
-            last_frame = frame_buffer_copy[-1]
-            # Конвертация обратно в HWC формат для кодирования
-            thumbnail = np.transpose(last_frame, (1, 2, 0))  # (H, W, C)
-            thumbnail = (thumbnail * 255).astype(np.uint8)
-            thumbnail = cv2.resize(thumbnail, (128, 128))  # Уменьшаем для передачи
-            _, buffer = cv2.imencode('.jpg', thumbnail)
-            frame_data = base64.b64encode(buffer).decode('utf-8')
+            # Миниатюра нужна только окнам с насилием (детекции, инциденты, уведомления);
+            # кадр сохраняется в кэш без кодирования, JPEG - только по запросу
+            thumbnail_id = (thumbnail_cache.put(last_frame)
+                            if is_violence and thumbnail_cache and last_frame is not None else None)
             
             result = DetectionResult(
                 stream_id=self.stream_id,
                 timestamp=time.time(),
                 is_violence=is_violence,
                 confidence=confidence,
-                frame_data=frame_data
+                thumbnail_id=thumbnail_id
             )
             
+            # Сохраняем в базу данных (запись выполняет detection_writer): окна без
+            # насилия учитываются только в агрегатах статистики
+            if detection_writer:
+                detection_writer.submit(PendingDetection(
+                    stream_id=self.stream_id,
+                    timestamp=result.timestamp,
+                    is_violence=is_violence,
+                    confidence=confidence,
+                    thumbnail_id=thumbnail_id
+                ))
+            
             if is_violence:
                 self.detection_count += 1
                 self.last_detection = result
-                
-                # Сохраняем в базу данных
-                try:
-                    if alert_service:
-                        alert_service.save_detection(
-                            stream_id=self.stream_id,
-                            is_violence=is_violence,
-                            confidence=confidence,
-                            frame_data=frame_data
-                        )
-                except Exception as e:
-                    print(f"Error saving detection to database: {e}")
-                
-                # Отправляем уведомление в Telegram
-                try:
-                    if telegram_service:
-                        telegram_service.handle_detection(result)
-                except Exception as e:
-                    print(f"Error sending Telegram notification: {e}")
             
             return result
             
@@ -372,10 +606,13 @@ class RTSPProcessor:
                     if buffer_size >= current_buffer_size:
                         result = self.detect_violence()
                         if result:
-                            self.results_queue.put(result)
+                            self.recent_results.append(result)
+                            # Сразу передаем результат в event loop
+                            if detection_bridge:
+                                detection_bridge.publish(result)
                     
                     # Небольшая задержка для детекции
-                    time.sleep(0.1)  # 10 FPS для детекции
+                    time.sleep(DETECTION_INTERVAL)
                     
                 except Exception as e:
                     print(f"Detection loop error for {self.stream_id}: {e}")
@@ -415,6 +652,9 @@ class RTSPProcessor:
                         self.fps = 1.0 / (current_time - last_time)
                     last_time = current_time
                     
+                    # Превью берется из исходного кадра, а не из буфера модели
+                    self.update_preview(frame)
+                    
                     # Используем frame_skip из настроек
                     current_frame_skip = system_settings.frame_skip
                     
@@ -444,6 +684,9 @@ class RTSPProcessor:
             self._shutdown_event.clear()
             with self.buffer_lock:
                 self.frame_buffer = []
+                self.last_model_frame = None
+            with self.preview_lock:
+                self._reset_preview()
             self.fps = 0.0
             self.total_frames = 0
             self.detection_count = 0
@@ -510,20 +753,60 @@ class RTSPProcessor:
     
     def get_latest_results(self, max_results: int = 10) -> List[DetectionResult]:
         """Получение последних результатов детекции"""
-        results = []
-        while not self.results_queue.empty() and len(results) < max_results:
+        return list(self.recent_results)[-max_results:]
+
+# Счетчик версий для условных GET запросов
+class VersionCounter:
+    """Монотонный счетчик версий с ожиданием изменения (long-poll)"""
+    
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+        self.waiters: List[tuple] = []
+    
+    def bump(self):
+        """Увеличение версии; можно вызывать из любого потока"""
+        with self.lock:
+            self.value += 1
+            waiters, self.waiters = self.waiters, []
+        for loop, future in waiters:
             try:
-                result = self.results_queue.get_nowait()
-                results.append(result)
-            except queue.Empty:
-                break
-        return results
+                loop.call_soon_threadsafe(self._wake, future)
+            except RuntimeError:
+                # Event loop уже остановлен
+                pass
+    
+    @staticmethod
+    def _wake(future: asyncio.Future):
+        if not future.done():
+            future.set_result(None)
+    
+    async def wait(self, version: int, timeout: float) -> bool:
+        """Ожидание версии, отличной от version; False по таймауту"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = (loop, future)
+        with self.lock:
+            if self.value != version:
+                return True
+            self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self.lock:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
 
 # Менеджер RTSP потоков
 class RTSPManager:
     def __init__(self):
         self.streams: Dict[str, RTSPProcessor] = {}
         self.triton_client = TritonClient()
+        # Версия списка и статуса потоков (для ETag и long-poll)
+        self.version = VersionCounter()
     
     def add_stream(self, stream_id: str, rtsp_url: str, name: str = "") -> bool:
         """Добавление нового RTSP потока"""
@@ -532,7 +815,14 @@ class RTSPManager:
                 raise ValueError(f"Stream {stream_id} already exists")
             
             processor = RTSPProcessor(stream_id, rtsp_url, name)
+            # Запись потока в БД с настоящими именем и URL (и в реестр AlertService)
+            if alert_service:
+                try:
+                    alert_service.register_stream(stream_id, processor.name, rtsp_url)
+                except Exception as e:
+                    print(f"Error registering stream {stream_id} in database: {e}")
             self.streams[stream_id] = processor
+            self.version.bump()
             print(f"Added stream: {stream_id} -> {rtsp_url}")
             return True
         except Exception as e:
@@ -544,6 +834,12 @@ class RTSPManager:
         if stream_id in self.streams:
             self.streams[stream_id].stop()
             del self.streams[stream_id]
+            self.version.bump()
+            if alert_service:
+                try:
+                    alert_service.deactivate_stream(stream_id)
+                except Exception as e:
+                    print(f"Error deactivating stream {stream_id} in database: {e}")
             print(f"Removed stream: {stream_id}")
             return True
         return False
@@ -552,6 +848,7 @@ class RTSPManager:
         """Запуск детекции для потока"""
         if stream_id in self.streams:
             self.streams[stream_id].start()
+            self.version.bump()
             return True
         return False
     
@@ -559,6 +856,7 @@ class RTSPManager:
         """Остановка детекции для потока"""
         if stream_id in self.streams:
             self.streams[stream_id].stop()
+            self.version.bump()
             return True
         return False
     
@@ -582,44 +880,626 @@ class RTSPManager:
         all_results.sort(key=lambda x: x.timestamp, reverse=True)
         return all_results
 
+# Мост между потоками детекции и asyncio
+class DetectionBridge:
+    """Потокобезопасная передача результатов детекции в asyncio очередь"""
+    
+    def __init__(self, maxsize: int = 1000):
+        self.maxsize = maxsize
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.queue: Optional[asyncio.Queue] = None
+        self.published = 0
+        self.dropped = 0
+    
+    def attach(self, loop: asyncio.AbstractEventLoop):
+        """Привязка к event loop (вызывается из loop)"""
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=self.maxsize)
+    
+    def publish(self, result: DetectionResult):
+        """Передача результата из потока детекции"""
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(self._put, result)
+        except RuntimeError:
+            # Event loop уже остановлен
+            pass
+    
+    def _put(self, result: DetectionResult):
+        # При переполнении вытесняем самый старый результат
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(result)
+        self.published += 1
+    
+    async def get(self) -> DetectionResult:
+        return await self.queue.get()
+    
+    def get_stats(self) -> Dict:
+        return {
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "published": self.published,
+            "dropped": self.dropped
+        }
+
+class LatencyStats:
+    """Скользящая статистика задержек в миллисекундах"""
+    
+    def __init__(self, window: int = 1000):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.max_ms = 0.0
+    
+    def record(self, seconds: float):
+        ms = seconds * 1000.0
+        self.samples.append(ms)
+        self.count += 1
+        self.max_ms = max(self.max_ms, ms)
+    
+    def summary(self) -> Dict:
+        samples = sorted(self.samples)
+        if not samples:
+            return {"count": self.count, "avg_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0,
+                    "p99_ms": 0.0, "max_ms": round(self.max_ms, 2)}
+        
+        def percentile(p: float) -> float:
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))], 2)
+        
+        return {
+            "count": self.count,
+            "avg_ms": round(sum(samples) / len(samples), 2),
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(self.max_ms, 2)
+        }
+
+# Кодеки исходящих сообщений
+def _json_default(value):
+    # Бинарные данные (JPEG кадры) в JSON передаются как base64
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode('ascii')
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def encode_json(payload: Dict) -> bytes:
+    return orjson.dumps(payload, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY)
+
+def encode_msgpack(payload: Dict) -> bytes:
+    return msgpack.packb(payload, use_bin_type=True)
+
+CODECS = {"json": encode_json, "msgpack": encode_msgpack}
+# Кодеки, сообщения которых отправляются текстовыми фреймами
+TEXT_CODECS = {"json"}
+DEFAULT_CODEC = "json"
+
+def negotiate_codec(websocket: WebSocket) -> str:
+    """Кодек клиента задается параметром ?codec=json|msgpack"""
+    codec = websocket.query_params.get("codec", DEFAULT_CODEC)
+    return codec if codec in CODECS else DEFAULT_CODEC
+
+class EncodeMetrics:
+    """Время и объем кодирования исходящих сообщений по кодекам"""
+    
+    def __init__(self):
+        self.latency = {codec: LatencyStats() for codec in CODECS}
+        self.bytes = {codec: 0 for codec in CODECS}
+    
+    def record(self, codec: str, seconds: float, size: int):
+        self.latency[codec].record(seconds)
+        self.bytes[codec] += size
+    
+    def summary(self) -> Dict:
+        return {
+            codec: {**self.latency[codec].summary(), "bytes": self.bytes[codec]}
+            for codec in CODECS
+        }
+
+encode_metrics = EncodeMetrics()
+
+class OutgoingMessage:
+    """Исходящее сообщение: кодируется один раз на кодек и разделяется всеми получателями"""
+    __slots__ = ("payload", "_encoded")
+    
+    def __init__(self, payload: Dict):
+        self.payload = payload
+        self._encoded = {}
+    
+    def encode(self, codec: str):
+        data = self._encoded.get(codec)
+        if data is None:
+            start = time.perf_counter()
+            data = CODECS[codec](self.payload)
+            # Объем - в байтах UTF-8, как он уходит в сеть
+            encode_metrics.record(codec, time.perf_counter() - start, len(data))
+            if codec in TEXT_CODECS:
+                # Текстовый фрейм ASGI принимает только str: декодируем один раз на все получатели
+                data = data.decode('utf-8')
+            self._encoded[codec] = data
+        return data
+
+# Журнал событий для восстановления клиентов после переподключения
+class EventLog:
+    """Кольцевой журнал событий (детекции с насилием и алерты) с монотонными номерами"""
+    
+    def __init__(self, maxlen: int = 10000):
+        # Идентификатор запуска: номера событий не переживают перезапуск сервера
+        self.epoch = uuid.uuid4().hex[:12]
+        self.seq = 0
+        # (seq, темы, поток, сообщение)
+        self.events = deque(maxlen=maxlen)
+    
+    def append(self, topics: List[str], stream_id: str, payload: Dict) -> OutgoingMessage:
+        """Добавление события; номер записывается в само сообщение"""
+        self.seq += 1
+        payload["seq"] = self.seq
+        message = OutgoingMessage(payload)
+        self.events.append((self.seq, tuple(topics), stream_id, message))
+        return message
+    
+    def since(self, last_seq: int) -> Optional[List[tuple]]:
+        """События после last_seq или None, если часть из них уже вытеснена из журнала"""
+        if last_seq >= self.seq:
+            return []
+        if not self.events or last_seq < self.events[0][0] - 1:
+            return None
+        # Номера в журнале идут подряд, поэтому позицию можно вычислить
+        return list(itertools.islice(self.events, last_seq - self.events[0][0] + 1, None))
+    
+    def get_stats(self) -> Dict:
+        return {
+            "epoch": self.epoch,
+            "seq": self.seq,
+            "size": len(self.events),
+            "oldest_seq": self.events[0][0] if self.events else None
+        }
+
+# Версионированный снимок статуса потоков
+class StatusSnapshot:
+    """Снимок статусов потоков; клиентам рассылаются только изменившиеся поля"""
+    
+    # Поля, изменение которых меняет ETag списка потоков; счетчики (fps,
+    # total_frames, детекции) меняются каждую секунду и идут только в WebSocket
+    LIFECYCLE_FIELDS = frozenset({"id", "url", "name", "enabled", "is_running"})
+    
+    def __init__(self):
+        self.version = 0
+        self.streams: Dict[str, Dict] = {}
+        # Версия последнего изменения каждого потока (для отфильтрованных подписок)
+        self.changed_at: Dict[str, int] = {}
+        self._previous_changed_at: Dict[str, int] = {}
+    
+    def update(self, statuses: List[StreamStatus]) -> Optional[Dict]:
+        """Применение новых статусов. Возвращает дельту или None, если ничего не изменилось"""
+        current = {}
+        for status in statuses:
+            # Миниатюры в статус не входят
+            current[status.id] = status.model_dump(exclude={"last_detection": {"thumbnail_id"}})
+        
+        changes = {}
+        for stream_id, fields in current.items():
+            previous = self.streams.get(stream_id)
+            if previous is None:
+                changes[stream_id] = fields
+            else:
+                changed = {key: value for key, value in fields.items() if previous.get(key) != value}
+                if changed:
+                    changes[stream_id] = changed
+        removed = [stream_id for stream_id in self.streams if stream_id not in current]
+        
+        if not changes and not removed:
+            return None
+        
+        base_version = self.version
+        self.version += 1
+        self.streams = current
+        self._previous_changed_at = dict(self.changed_at)
+        for stream_id in list(changes) + removed:
+            self.changed_at[stream_id] = self.version
+        return {
+            "type": "streams_status",
+            "snapshot": False,
+            "version": self.version,
+            "base_version": base_version,
+            "changes": changes,
+            "removed": removed
+        }
+    
+    @classmethod
+    def lifecycle_changed(cls, delta: Dict) -> bool:
+        """Затрагивает ли дельта состав потоков или их состояние, а не только счетчики"""
+        return bool(delta["removed"]) or any(
+            cls.LIFECYCLE_FIELDS & fields.keys() for fields in delta["changes"].values()
+        )
+    
+    def snapshot_message(self, streams: Optional[Set[str]] = None) -> Dict:
+        """Полный снимок для новых клиентов (с учетом фильтра потоков)"""
+        return {
+            "type": "streams_status",
+            "snapshot": True,
+            "version": self.version,
+            "data": [status for stream_id, status in self.streams.items()
+                     if streams is None or stream_id in streams]
+        }
+    
+    def filter_delta(self, delta: Dict, streams: Set[str]) -> Optional[Dict]:
+        """Дельта только для выбранных потоков.
+        
+        base_version указывает на последнее изменение этих потоков, поэтому
+        пропущенные клиентом чужие дельты не выглядят как разрыв.
+        """
+        changes = {stream_id: fields for stream_id, fields in delta["changes"].items()
+                   if stream_id in streams}
+        removed = [stream_id for stream_id in delta["removed"] if stream_id in streams]
+        if not changes and not removed:
+            return None
+        return {
+            **delta,
+            "base_version": max((self._previous_changed_at.get(stream_id, 0) for stream_id in streams),
+                                default=0),
+            "changes": changes,
+            "removed": removed
+        }
+
+def merge_status_deltas(older: Dict, newer: Dict) -> Dict:
+    """Объединение двух последовательных дельт статуса в одну"""
+    changes = {stream_id: dict(fields) for stream_id, fields in older["changes"].items()}
+    removed = set(older["removed"])
+    
+    for stream_id in newer["removed"]:
+        changes.pop(stream_id, None)
+        removed.add(stream_id)
+    
+    for stream_id, fields in newer["changes"].items():
+        if stream_id in removed:
+            # Поток удален и добавлен заново: новая дельта содержит все поля
+            removed.discard(stream_id)
+            changes[stream_id] = dict(fields)
+        else:
+            changes.setdefault(stream_id, {}).update(fields)
+    
+    return {
+        "type": "streams_status",
+        "snapshot": False,
+        "version": newer["version"],
+        "base_version": older["base_version"],
+        "changes": changes,
+        "removed": list(removed)
+    }
+
+# Темы подписки /ws
+TOPIC_DETECTIONS = "detection_result"  # все результаты детекции
+TOPIC_VIOLENCE = "violence"  # только результаты с насилием
+TOPIC_ALERTS = "alert"  # алерты
+TOPIC_STATUS = "streams_status"  # статус потоков
+TOPICS = {TOPIC_DETECTIONS, TOPIC_VIOLENCE, TOPIC_ALERTS, TOPIC_STATUS}
+DEFAULT_TOPICS = {TOPIC_DETECTIONS, TOPIC_STATUS}
+
+class SubscriptionIndex:
+    """Индекс подписок: тема -> поток -> клиенты"""
+    
+    def __init__(self):
+        self.by_stream: Dict[str, Dict[str, Set["ClientConnection"]]] = {topic: {} for topic in TOPICS}
+        self.all_streams: Dict[str, Set["ClientConnection"]] = {topic: set() for topic in TOPICS}
+    
+    def add(self, client: "ClientConnection"):
+        for topic in client.topics:
+            if client.streams is None:
+                self.all_streams[topic].add(client)
+            else:
+                for stream_id in client.streams:
+                    self.by_stream[topic].setdefault(stream_id, set()).add(client)
+    
+    def remove(self, client: "ClientConnection"):
+        for topic in TOPICS:
+            self.all_streams[topic].discard(client)
+            by_stream = self.by_stream[topic]
+            for stream_id in list(by_stream):
+                by_stream[stream_id].discard(client)
+                if not by_stream[stream_id]:
+                    del by_stream[stream_id]
+    
+    def recipients(self, topic: str, stream_id: str) -> Set["ClientConnection"]:
+        subscribers = self.by_stream[topic].get(stream_id)
+        if subscribers:
+            return self.all_streams[topic] | subscribers
+        return self.all_streams[topic]
+    
+    def topic_subscribers(self, topic: str) -> Set["ClientConnection"]:
+        clients = set(self.all_streams[topic])
+        for subscribers in self.by_stream[topic].values():
+            clients |= subscribers
+        return clients
+
+async def send_encoded(websocket: WebSocket, data):
+    """Отправка закодированного сообщения: текстовый или бинарный фрейм"""
+    if isinstance(data, bytes):
+        await websocket.send_bytes(data)
+    else:
+        await websocket.send_text(data)
+
+# WebSocket клиент
+class ClientConnection:
+    """WebSocket клиент с собственной очередью отправки и задачей-писателем"""
+    
+    def __init__(self, websocket: WebSocket, max_queue: int, max_lag: float, codec: str = DEFAULT_CODEC):
+        self.websocket = websocket
+        self.codec = codec
+        self.max_queue = max_queue
+        self.max_lag = max_lag
+        # Сообщения с гарантированной доставкой: (время постановки, сообщение, время события)
+        self.pending = deque()
+        # Дельта статуса потоков: неотправленные дельты объединяются в одну
+        self.status_message: Optional[OutgoingMessage] = None
+        self.wakeup = asyncio.Event()
+        self.writer_task: Optional[asyncio.Task] = None
+        self.busy_since: Optional[float] = None
+        self.closed = False
+        self.sent = 0
+        self.coalesced = 0
+        # Подписки: темы и потоки (None - все потоки)
+        self.topics: Set[str] = set(DEFAULT_TOPICS)
+        self.streams: Optional[Set[str]] = None
+    
+    def wants(self, topics, stream_id: str) -> bool:
+        """Подписан ли клиент на событие"""
+        return (self.streams is None or stream_id in self.streams) and not self.topics.isdisjoint(topics)
+    
+    def lag(self, now: float) -> float:
+        """Отставание клиента: возраст самого старого неотправленного сообщения"""
+        lag = now - self.pending[0][0] if self.pending else 0.0
+        if self.busy_since is not None:
+            lag = max(lag, now - self.busy_since)
+        return lag
+    
+    def is_lagging(self, now: float) -> bool:
+        return len(self.pending) >= self.max_queue or self.lag(now) > self.max_lag
+    
+    def enqueue(self, message: OutgoingMessage, created_at: float = None):
+        """Постановка сообщения с гарантированной доставкой"""
+        self.pending.append((time.time(), message, created_at))
+        self.wakeup.set()
+    
+    def set_status(self, message: OutgoingMessage):
+        """Постановка дельты статуса; неотправленная дельта объединяется с новой"""
+        if self.status_message is not None:
+            self.coalesced += 1
+            message = OutgoingMessage(merge_status_deltas(self.status_message.payload, message.payload))
+        self.status_message = message
+        self.wakeup.set()
+    
+    def send_status_snapshot(self, message: OutgoingMessage):
+        """Полный снимок статуса заменяет все неотправленные дельты"""
+        self.status_message = None
+        self.enqueue(message)
+    
+    async def _send(self, message: OutgoingMessage):
+        self.busy_since = time.time()
+        try:
+            await send_encoded(self.websocket, message.encode(self.codec))
+            self.sent += 1
+        finally:
+            self.busy_since = None
+    
+    async def run_writer(self):
+        """Задача-писатель: отправляет сообщения клиента по очереди"""
+        while not self.closed:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            
+            while self.pending:
+                _, message, created_at = self.pending[0]
+                await self._send(message)
+                self.pending.popleft()
+                if created_at is not None and delivery_latency is not None:
+                    # Задержка от момента детекции до отправки клиенту
+                    delivery_latency.record(time.time() - created_at)
+            
+            if self.status_message is not None:
+                message, self.status_message = self.status_message, None
+                await self._send(message)
+
 # WebSocket менеджер
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    def __init__(self, max_queue: int = 256, max_lag: float = 10.0):
+        self.active_connections: List[ClientConnection] = []
+        self.index = SubscriptionIndex()
+        self.max_queue = max_queue
+        self.max_lag = max_lag
+        self.slow_disconnects = 0
+        self._close_tasks = set()
     
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, websocket: WebSocket, topics: Optional[Set[str]] = None,
+                      streams: Optional[Set[str]] = None, codec: str = DEFAULT_CODEC) -> ClientConnection:
         await websocket.accept()
-        self.active_connections.append(websocket)
+        client = ClientConnection(websocket, self.max_queue, self.max_lag, codec)
+        if topics is not None:
+            client.topics = topics & TOPICS
+        client.streams = streams
+        client.writer_task = asyncio.create_task(self._run_client(client))
+        self.active_connections.append(client)
+        self.index.add(client)
         print(f"WebSocket connected. Total connections: {len(self.active_connections)}")
+        return client
     
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+    def disconnect(self, client: ClientConnection):
+        if client.closed:
+            return
+        client.closed = True
+        if client.writer_task and client.writer_task is not asyncio.current_task():
+            client.writer_task.cancel()
+        if client in self.active_connections:
+            self.active_connections.remove(client)
+        self.index.remove(client)
         print(f"WebSocket disconnected. Total connections: {len(self.active_connections)}")
     
-    async def broadcast(self, message: str):
-        """Отправка сообщения всем подключенным клиентам"""
-        disconnected = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except:
-                disconnected.append(connection)
+    async def _run_client(self, client: ClientConnection):
+        try:
+            await client.run_writer()
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            # Ошибка отправки: клиент отключился
+            self.disconnect(client)
+    
+    def _drop_slow(self, client: ClientConnection):
+        """Отключение клиента, не успевающего получать сообщения"""
+        self.slow_disconnects += 1
+        print(f"Disconnecting slow WebSocket client: queue={len(client.pending)}, "
+              f"lag={client.lag(time.time()):.1f}s")
+        self.disconnect(client)
+        task = asyncio.create_task(self._close(client))
+        self._close_tasks.add(task)
+        task.add_done_callback(self._close_tasks.discard)
+    
+    async def _close(self, client: ClientConnection):
+        try:
+            await asyncio.wait_for(client.websocket.close(code=1008, reason="Client too slow"), timeout=5)
+        except Exception:
+            pass
+    
+    def update_subscription(self, client: ClientConnection, add_topics: Set[str] = frozenset(),
+                            remove_topics: Set[str] = frozenset(), streams=None,
+                            remove_streams: Set[str] = frozenset()):
+        """Изменение подписки клиента с переиндексацией"""
+        self.index.remove(client)
+        client.topics = (client.topics | (add_topics & TOPICS)) - remove_topics
+        if streams == "*":
+            client.streams = None
+        elif streams is not None:
+            client.streams = set(streams) if client.streams is None else client.streams | set(streams)
+        if remove_streams and client.streams is not None:
+            client.streams = client.streams - remove_streams
+        self.index.add(client)
+    
+    def _admit(self, client: ClientConnection, now: float) -> bool:
+        """Можно ли поставить клиенту сообщение; отстающий клиент отключается"""
+        if client.closed:
+            return False
+        if client.is_lagging(now):
+            self._drop_slow(client)
+            return False
+        return True
+    
+    def send(self, client: ClientConnection, message: OutgoingMessage, created_at: float = None) -> bool:
+        """Постановка сообщения одному клиенту с той же проверкой отставания, что и при рассылке"""
+        if not self._admit(client, time.time()):
+            return False
+        client.enqueue(message, created_at)
+        return True
+    
+    def send_status_snapshot(self, client: ClientConnection, message: OutgoingMessage) -> bool:
+        if not self._admit(client, time.time()):
+            return False
+        client.send_status_snapshot(message)
+        return True
+    
+    def _deliver(self, clients, message: OutgoingMessage, created_at: float = None):
+        now = time.time()
+        for client in clients:
+            if self._admit(client, now):
+                client.enqueue(message, created_at)
+    
+    def recipients(self, topics: List[str], stream_id: str) -> Set[ClientConnection]:
+        recipients = set()
+        for topic in topics:
+            recipients |= self.index.recipients(topic, stream_id)
+        return recipients
+    
+    def publish(self, topics: List[str], stream_id: str, message: OutgoingMessage,
+                created_at: float = None) -> bool:
+        """Отправка сообщения подписчикам тем по потоку.
         
-        # Удаление отключенных соединений
-        for connection in disconnected:
-            self.active_connections.remove(connection)
+        Сообщение кодируется только если есть получатели, и не более одного раза на кодек.
+        """
+        recipients = self.recipients(topics, stream_id)
+        if not recipients:
+            return False
+        self._deliver(recipients, message, created_at)
+        return True
+    
+    def broadcast_status(self, delta: Dict, snapshot: StatusSnapshot):
+        """Отправка дельты статуса подписчикам; одно сообщение на фильтр потоков"""
+        groups: Dict[Optional[frozenset], List[ClientConnection]] = {}
+        for client in self.index.topic_subscribers(TOPIC_STATUS):
+            key = frozenset(client.streams) if client.streams is not None else None
+            groups.setdefault(key, []).append(client)
+        
+        now = time.time()
+        for streams, clients in groups.items():
+            group_delta = delta if streams is None else snapshot.filter_delta(delta, streams)
+            if group_delta is None:
+                continue
+            message = OutgoingMessage(group_delta)
+            for client in clients:
+                if self._admit(client, now):
+                    client.set_status(message)
+    
+    def get_stats(self) -> Dict:
+        return {
+            "connections": len(self.active_connections),
+            "max_queue_depth": max((len(c.pending) for c in self.active_connections), default=0),
+            "coalesced_status": sum(c.coalesced for c in self.active_connections),
+            "slow_disconnects": self.slow_disconnects
+        }
 
 # Telegram сервис
+@dataclass(slots=True)
+class StreamEvent:
+    """Текущее событие насилия на потоке"""
+    start_time: float
+    last_detection: float
+    last_notification: float
+    notification_count: int = 0
+    max_confidence: float = 0.0
+
+@dataclass(slots=True)
+class DigestEntry:
+    """Событие потока в сводке уведомлений"""
+    kind: str  # started, continues, ongoing или ended
+    confidence: float
+    max_confidence: float
+    duration: int
+    thumbnail_id: Optional[str] = None
+
 class TelegramService:
-    def __init__(self):
+    """Уведомления о событиях насилия: решает, когда уведомлять, и формирует
+    сообщения; отправка - только через TelegramDispatcher.
+
+    В режиме сводки (digest_enabled) события разных потоков за digest_window
+    секунд объединяются в одно сообщение с сеткой миниатюр, вместо отдельного
+    фото на каждую камеру.
+    """
+    
+    EVENT_TITLES = {
+        "started": "🚨 <b>Violence Detection Started</b>",
+        "continues": "⚠️ <b>Violence Continues</b>",
+        "ongoing": "🔄 <b>Violence Ongoing</b>",
+    }
+    DIGEST_LABELS = {"started": "🚨 started", "continues": "⚠️ continues", "ongoing": "🔄 ongoing", "ended": "✅ ended"}
+    
+    def __init__(self, dispatcher: TelegramDispatcher):
+        self.dispatcher = dispatcher
         self.bot_token = ""
         self.chat_id = ""
         self.enabled = False
         self.notification_interval = 300
         self.max_notifications = 5
         self.send_thumbnails = True
-        self.last_notification_time = {}  # stream_id -> timestamp
-        self.violence_events = {}  # stream_id -> event_info
+        self.violence_events: Dict[str, StreamEvent] = {}
+        
+        # Сводка по нескольким потокам
+        self.digest_enabled = False
+        self.digest_window = 3.0
+        self.digest_max_streams = 9
+        self.pending_digest: Dict[str, DigestEntry] = {}
+        self.digest_timer: Optional[asyncio.TimerHandle] = None
+        # Задачи уведомлений с фото: миниатюры и сетка кодируются вне event loop
+        self.photo_tasks: Set[asyncio.Task] = set()
+        self.digests_sent = 0
+        self.digest_streams = 0
     
     def update_settings(self, settings: TelegramSettings):
         """Обновление настроек Telegram"""
@@ -629,6 +1509,15 @@ class TelegramService:
         self.notification_interval = settings.notification_interval
         self.max_notifications = settings.max_notifications
         self.send_thumbnails = settings.send_thumbnails
+        self.digest_window = settings.digest_window
+        self.digest_max_streams = settings.digest_max_streams
+        if self.digest_enabled and not settings.digest_enabled:
+            self.flush_digest()
+        self.digest_enabled = settings.digest_enabled
+        self.dispatcher.configure(settings.bot_token, settings.api_url)
+        self.dispatcher.configure_rates(settings.global_rate, settings.chat_rate, settings.group_rate)
+        self.dispatcher.max_queue = settings.queue_size
+        self.dispatcher.max_retries = settings.max_retries
         print(f"Telegram settings updated: enabled={self.enabled}")
     
     async def test_connection(self) -> bool:
@@ -636,188 +1525,200 @@ class TelegramService:
         if not self.enabled or not self.bot_token or not self.chat_id:
             return False
         
-        try:
-            url = f"https://api.telegram.org/bot{self.bot_token}/getMe"
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return data.get('ok', False)
-                    return False
-        except Exception as e:
-            print(f"Telegram connection test failed: {e}")
-            return False
+        response = await self.dispatcher.call("getMe")
+        if response is None:
+            print(f"Telegram connection test failed: {self.dispatcher.last_error}")
+        return bool(response and response.get('ok', False))
     
-    async def send_message(self, message: str, photo_data: str = None) -> bool:
-        """Отправка сообщения в Telegram"""
+    async def send_message(self, message: str, photo: bytes = None) -> bool:
+        """Отправка сообщения в Telegram с ожиданием результата"""
         if not self.enabled or not self.bot_token or not self.chat_id:
             return False
-        
-        try:
-            if photo_data and self.send_thumbnails:
-                # Отправка фото с подписью
-                url = f"https://api.telegram.org/bot{self.bot_token}/sendPhoto"
-                
-                decoded_photo = base64.b64decode(photo_data)
-                form = aiohttp.FormData()
-                form.add_field('chat_id', self.chat_id)
-                form.add_field('caption', message)
-                form.add_field('parse_mode', 'HTML')
-                form.add_field('photo', decoded_photo,
-                            filename='frame.jpg',
-                            content_type='image/jpeg')
-
-                async with aiohttp.ClientSession() as session:
-                    async with session.post(url, data=form) as response:
-                        if response.status != 200:
-                            error_text = await response.text()
-                            print(f"Telegram photo send error: {response.status} — {error_text}")
-                        return response.status == 200
-            else:
-                # Отправка только текста
-                url = f"https://api.telegram.org/bot{self.bot_token}/sendMessage"
-                data = {
-                    'chat_id': self.chat_id,
-                    'text': message,
-                    'parse_mode': 'HTML'
-                }
-                
-                async with aiohttp.ClientSession() as session:
-                    async with session.post(url, json=data) as response:
-                        return response.status == 200
-        except Exception as e:
-            print(f"Failed to send Telegram message: {e}")
+        return await self.dispatcher.send(self.chat_id, message, photo if self.send_thumbnails else None)
+    
+    def notify(self, message: str, photo: bytes = None) -> bool:
+        """Постановка уведомления в очередь отправки без ожидания"""
+        if not self.enabled or not self.bot_token or not self.chat_id:
             return False
+        return self.dispatcher.submit(self.chat_id, message, photo if self.send_thumbnails else None)
     
-    def should_send_notification(self, stream_id: str, is_violence: bool) -> bool:
+    def should_send_notification(self, stream_id: str, is_violence: bool, confidence: float = 0.0) -> bool:
         """Определение, нужно ли отправлять уведомление"""
         current_time = time.time()
         
         if not is_violence:
             # Если насилия нет, отправляем финальное уведомление если было событие
-            if stream_id in self.violence_events:
-                event_info = self.violence_events[stream_id]
-                duration = int(current_time - event_info['start_time'])
-                
-                # Отправляем финальное уведомление асинхронно
-                asyncio.create_task(self.send_final_notification(stream_id, duration, event_info))
-                
-                # Очищаем событие
-                del self.violence_events[stream_id]
-            if stream_id in self.last_notification_time:
-                del self.last_notification_time[stream_id]
+            event = self.violence_events.pop(stream_id, None)
+            if event is not None:
+                self.send_final_notification(stream_id, int(current_time - event.start_time), event)
             return False
         
         # Если насилие обнаружено
-        if stream_id not in self.violence_events:
+        event = self.violence_events.get(stream_id)
+        if event is None:
             # Новое событие насилия
-            self.violence_events[stream_id] = {
-                'start_time': current_time,
-                'last_detection': current_time,
-                'notification_count': 0,
-                'max_confidence': 0.0
-            }
-            self.last_notification_time[stream_id] = current_time
+            self.violence_events[stream_id] = StreamEvent(
+                start_time=current_time,
+                last_detection=current_time,
+                last_notification=current_time,
+                max_confidence=confidence
+            )
             return True
         
         # Продолжающееся событие
-        event_info = self.violence_events[stream_id]
-        event_info['last_detection'] = current_time
-        
-        # Обновляем максимальную уверенность
-        if hasattr(self, 'current_detection_confidence'):
-            event_info['max_confidence'] = max(event_info['max_confidence'], self.current_detection_confidence)
-        
-        # Проверяем, прошло ли достаточно времени с последнего уведомления
-        last_notification = self.last_notification_time.get(stream_id, 0)
-        time_since_last = current_time - last_notification
+        event.last_detection = current_time
+        event.max_confidence = max(event.max_confidence, confidence)
         
         # Проверяем, не превышено ли максимальное количество уведомлений
-        if event_info['notification_count'] >= self.max_notifications:
+        if event.notification_count >= self.max_notifications:
             return False
         
-        # Адаптивный интервал: увеличиваем интервал с каждым уведомлением
-        base_interval = self.notification_interval
-        adaptive_interval = base_interval * (1 + event_info['notification_count'] * 0.5)  # Увеличиваем на 50% каждый раз
-        
-        # Максимальный интервал - 30 минут
-        adaptive_interval = min(adaptive_interval, 1800)
+        # Адаптивный интервал: +50% с каждым уведомлением, но не больше 30 минут
+        adaptive_interval = min(self.notification_interval * (1 + event.notification_count * 0.5), 1800)
         
-        if time_since_last >= adaptive_interval:
-            event_info['notification_count'] += 1
-            self.last_notification_time[stream_id] = current_time
+        if current_time - event.last_notification >= adaptive_interval:
+            event.notification_count += 1
+            event.last_notification = current_time
             return True
         
         return False
     
-    async def handle_detection(self, detection: DetectionResult):
-        """Обработка результата детекции"""
+    def handle_detection(self, detection: DetectionResult):
+        """Обработка результата детекции (из event loop, не блокирует)"""
         if not self.enabled:
             return
         
         stream_id = detection.stream_id
-        is_violence = detection.is_violence
+        if not self.should_send_notification(stream_id, detection.is_violence, detection.confidence):
+            return
         
-        # Сохраняем текущую уверенность для использования в should_send_notification
-        self.current_detection_confidence = detection.confidence
+        event = self.violence_events[stream_id]
+        duration = int(time.time() - event.start_time)
+        kind = ("started", "continues")[event.notification_count] if event.notification_count < 2 else "ongoing"
         
-        if self.should_send_notification(stream_id, is_violence):
-            # Формируем сообщение
-            if stream_id in self.violence_events:
-                event_info = self.violence_events[stream_id]
-                duration = int(time.time() - event_info['start_time'])
-                notification_count = event_info['notification_count']
-                max_confidence = event_info['max_confidence']
-                
-                # Определяем тип сообщения
-                if notification_count == 0:
-                    message_type = "🚨 <b>Violence Detection Started</b>"
-                elif notification_count == 1:
-                    message_type = "⚠️ <b>Violence Continues</b>"
-                else:
-                    message_type = "🔄 <b>Violence Ongoing</b>"
-                
-                message = (
-                    f"{message_type}\n\n"
-                    f"📹 Stream: {stream_id}\n"
-                    f"🎯 Current Confidence: {detection.confidence:.2%}\n"
-                    f"📊 Max Confidence: {max_confidence:.2%}\n"
-                    f"⏱️ Duration: {duration}s\n"
-                    f"🔔 Notification #{notification_count + 1}\n"
-                    f"🕐 Time: {time.strftime('%Y-%m-%d %H:%M:%S')}"
-                )
-            else:
-                message = (
-                    f"🚨 <b>Violence Detection Alert</b>\n\n"
-                    f"📹 Stream: {stream_id}\n"
-                    f"🎯 Confidence: {detection.confidence:.2%}\n"
-                    f"🕐 Time: {time.strftime('%Y-%m-%d %H:%M:%S')}"
-                )
-            
-            # Отправляем уведомление
-            await self.send_message(message, detection.frame_data)
+        if self.digest_enabled:
+            self.add_to_digest(stream_id, DigestEntry(kind, detection.confidence, event.max_confidence,
+                                                      duration, detection.thumbnail_id))
+            return
+        
+        message = (
+            f"{self.EVENT_TITLES[kind]}\n\n"
+            f"📹 Stream: {stream_id}\n"
+            f"🎯 Current Confidence: {detection.confidence:.2%}\n"
+            f"📊 Max Confidence: {event.max_confidence:.2%}\n"
+            f"⏱️ Duration: {duration}s\n"
+            f"🔔 Notification #{event.notification_count + 1}\n"
+            f"🕐 Time: {time.strftime('%Y-%m-%d %H:%M:%S')}"
+        )
+        
+        # Отправляем уведомление (миниатюра кодируется только при отправке)
+        if self.send_thumbnails and detection.thumbnail_id and thumbnail_cache:
+            self.notify_with_photo(message, thumbnail_cache.get_jpeg, detection.thumbnail_id)
+        else:
+            self.notify(message)
     
-    async def send_final_notification(self, stream_id: str, duration: int, event_info: dict):
+    def send_final_notification(self, stream_id: str, duration: int, event: "StreamEvent"):
         """Отправка финального уведомления о завершении события"""
         if not self.enabled:
             return
         
-        notification_count = event_info['notification_count']
-        max_confidence = event_info['max_confidence']
+        if self.digest_enabled:
+            self.add_to_digest(stream_id, DigestEntry("ended", event.max_confidence, event.max_confidence, duration))
+            return
         
         message = (
             f"✅ <b>Violence Event Ended</b>\n\n"
             f"📹 Stream: {stream_id}\n"
             f"⏱️ Total Duration: {duration}s\n"
-            f"📊 Max Confidence: {max_confidence:.2%}\n"
-            f"🔔 Total Notifications: {notification_count + 1}\n"
+            f"📊 Max Confidence: {event.max_confidence:.2%}\n"
+            f"🔔 Total Notifications: {event.notification_count + 1}\n"
             f"🕐 Ended: {time.strftime('%Y-%m-%d %H:%M:%S')}"
         )
         
-        await self.send_message(message)
+        self.notify(message)
+    
+    def add_to_digest(self, stream_id: str, entry: "DigestEntry"):
+        """Событие потока в сводку: сводка уходит через digest_window секунд после
+        первого события или сразу, когда в ней digest_max_streams потоков"""
+        previous = self.pending_digest.get(stream_id)
+        if previous is not None and entry.thumbnail_id is None:
+            entry.thumbnail_id = previous.thumbnail_id
+        self.pending_digest[stream_id] = entry
+        
+        if len(self.pending_digest) >= self.digest_max_streams:
+            self.flush_digest()
+        elif self.digest_timer is None:
+            self.digest_timer = asyncio.get_running_loop().call_later(self.digest_window, self.flush_digest)
+    
+    def flush_digest(self):
+        """Отправка накопленной сводки одним сообщением с сеткой миниатюр"""
+        if self.digest_timer is not None:
+            self.digest_timer.cancel()
+            self.digest_timer = None
+        entries, self.pending_digest = self.pending_digest, {}
+        if not entries:
+            return
+        
+        if all(entry.kind == "ended" for entry in entries.values()):
+            title = f"✅ <b>Violence Ended on {len(entries)} camera(s)</b>"
+        else:
+            title = f"🚨 <b>Violence on {len(entries)} camera(s)</b>"
+        lines = [
+            f"📹 {stream_id}: {self.DIGEST_LABELS[entry.kind]}, {entry.confidence:.0%} "
+            f"(max {entry.max_confidence:.0%}), {entry.duration}s"
+            for stream_id, entry in sorted(entries.items())
+        ]
+        message = f"{title}\n\n" + "\n".join(lines) + f"\n\n🕐 Time: {time.strftime('%Y-%m-%d %H:%M:%S')}"
+        
+        # Одна сетка миниатюр вместо фото на каждый поток
+        tiles = []
+        if self.send_thumbnails and thumbnail_cache:
+            tiles = [(stream_id, entry.thumbnail_id) for stream_id, entry in sorted(entries.items())
+                     if entry.thumbnail_id]
+        
+        self.digests_sent += 1
+        self.digest_streams += len(entries)
+        if tiles:
+            self.notify_with_photo(message, thumbnail_cache.compose_grid,
+                                   [thumbnail_id for _, thumbnail_id in tiles],
+                                   [stream_id for stream_id, _ in tiles])
+        else:
+            self.notify(message)
+    
+    def notify_with_photo(self, message: str, encode: Callable[..., Optional[bytes]], *args):
+        """Уведомление с фото: JPEG кодируется в отдельном потоке, затем сообщение ставится в очередь"""
+        task = asyncio.get_running_loop().create_task(self._notify_with_photo(message, encode, *args))
+        self.photo_tasks.add(task)
+        task.add_done_callback(self.photo_tasks.discard)
+    
+    async def _notify_with_photo(self, message: str, encode: Callable[..., Optional[bytes]], *args):
+        photo = None
+        try:
+            photo = await asyncio.to_thread(encode, *args)
+        except Exception as e:
+            print(f"Error encoding notification photo: {e}")
+        self.notify(message, photo)
+    
+    async def drain(self):
+        """Отправка накопленной сводки и ожидание постановки всех уведомлений в очередь"""
+        self.flush_digest()
+        if self.photo_tasks:
+            await asyncio.gather(*self.photo_tasks, return_exceptions=True)
+    
+    def get_stats(self) -> Dict:
+        return {
+            **self.dispatcher.get_stats(),
+            "active_events": len(self.violence_events),
+            "digest_enabled": self.digest_enabled,
+            "digest_pending": len(self.pending_digest),
+            "digests_sent": self.digests_sent,
+            "digest_streams": self.digest_streams
+        }
 
 # Глобальные настройки системы
 system_settings = SystemSettings()
+# Версия настроек (для ETag и long-poll)
+settings_version = VersionCounter()
 
 # Файл для сохранения настроек
 SETTINGS_FILE = "system_settings.json"
@@ -857,12 +1758,42 @@ async def root():
         "status": "running"
     }
 
+# Верхняя граница ожидания для long-poll (?wait=секунды)
+MAX_LONG_POLL_WAIT = 60.0
+
+async def conditional_get(request: Request, counter: VersionCounter, make_etag, build, wait: float = 0):
+    """Ответ с ETag: 304 если данные не изменились.
+    
+    ETag строится из версии counter. При wait > 0 и совпадающем If-None-Match
+    запрос ждет изменения ETag не дольше wait секунд, прежде чем ответить.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    version = counter.value
+    etag = make_etag(version)
+    if wait > 0 and if_none_match == etag:
+        deadline = time.monotonic() + min(wait, MAX_LONG_POLL_WAIT)
+        while etag == if_none_match:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not await counter.wait(version, remaining):
+                break
+            version = counter.value
+            etag = make_etag(version)
+    
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(content=jsonable_encoder(build()), headers={"ETag": etag})
+
 @app.get("/api/streams")
-async def get_streams():
+async def get_streams(request: Request, wait: float = 0):
     """Получить список всех RTSP потоков"""
     if rtsp_manager is None:
         raise HTTPException(status_code=503, detail="Service not ready")
-    return rtsp_manager.get_all_streams()
+    return await conditional_get(
+        request, rtsp_manager.version,
+        lambda version: f'"streams-{version}"',
+        rtsp_manager.get_all_streams,
+        wait
+    )
 
 @app.post("/api/streams")
 async def add_stream(stream: RTSPStream):
@@ -870,7 +1801,7 @@ async def add_stream(stream: RTSPStream):
     if rtsp_manager is None:
         raise HTTPException(status_code=503, detail="Service not ready")
     try:
-        success = rtsp_manager.add_stream(stream.id, stream.url, stream.name)
+        success = await asyncio.to_thread(rtsp_manager.add_stream, stream.id, stream.url, stream.name)
         if success:
             return {"message": f"Stream {stream.id} added successfully"}
         else:
@@ -884,8 +1815,9 @@ async def remove_stream(stream_id: str):
     if rtsp_manager is None:
         raise HTTPException(status_code=503, detail="Service not ready")
     try:
-        success = rtsp_manager.remove_stream(stream_id)
+        success = await asyncio.to_thread(rtsp_manager.remove_stream, stream_id)
         if success:
+            preview_messages.pop(stream_id, None)
             return {"message": f"Stream {stream_id} removed successfully"}
         else:
             raise HTTPException(status_code=404, detail="Stream not found")
@@ -921,16 +1853,31 @@ async def stop_stream(stream_id: str):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/api/status")
-async def get_status():
+async def get_status(request: Request, wait: float = 0):
     """Получить статус системы"""
     if rtsp_manager is None:
         raise HTTPException(status_code=503, detail="Service not ready")
-    return {
-        "triton_server": rtsp_manager.triton_client.is_healthy(),
-        "active_streams": len(rtsp_manager.get_active_streams()),
-        "total_streams": len(rtsp_manager.streams),
-        "uptime": time.time() - rtsp_manager.triton_client.start_time if hasattr(rtsp_manager.triton_client, 'start_time') else 0
-    }
+    
+    def get_uptime() -> float:
+        return time.time() - rtsp_manager.triton_client.start_time if hasattr(rtsp_manager.triton_client, 'start_time') else 0
+    
+    def make_etag(version: int) -> str:
+        # Статус зависит только от нескольких счетчиков, поэтому ETag строится
+        # из них, а не из версии: изменения fps не будят long-poll клиентов.
+        # Здоровье Triton берется из результата фоновой проверки monitor_triton_health
+        healthy = int(rtsp_manager.triton_client.healthy)
+        active = len(rtsp_manager.get_active_streams())
+        return f'"status-{healthy}-{active}-{len(rtsp_manager.streams)}"'
+    
+    def build() -> Dict:
+        return {
+            "triton_server": rtsp_manager.triton_client.healthy,
+            "active_streams": len(rtsp_manager.get_active_streams()),
+            "total_streams": len(rtsp_manager.streams),
+            "uptime": get_uptime()
+        }
+    
+    return await conditional_get(request, rtsp_manager.version, make_etag, build, wait)
 
 @app.get("/api/detections")
 async def get_detections(limit: int = 50):
@@ -940,10 +1887,36 @@ async def get_detections(limit: int = 50):
     detections = rtsp_manager.get_latest_detections()
     return detections[:limit]
 
+@app.get("/api/metrics")
+async def get_metrics():
+    """Метрики доставки результатов детекции"""
+    if detection_bridge is None or delivery_latency is None:
+        raise HTTPException(status_code=503, detail="Service not ready")
+    return {
+        "detection_delivery": {
+            **detection_bridge.get_stats(),
+            "latency": delivery_latency.summary()
+        },
+        "websocket": connection_manager.get_stats() if connection_manager else {},
+        "encoding": encode_metrics.summary(),
+        "event_log": event_log.get_stats() if event_log else {},
+        "thumbnails": thumbnail_cache.get_stats() if thumbnail_cache else {},
+        "persistence": detection_writer.get_stats() if detection_writer else {},
+        "partitions": partition_manager.get_stats() if partition_manager else {},
+        "retention": retention_worker.get_stats() if retention_worker else {},
+        "query_cache": query_cache.get_stats() if query_cache else {},
+        "telegram": telegram_service.get_stats() if telegram_service else {}
+    }
+
 @app.get("/api/settings")
-async def get_settings():
+async def get_settings(request: Request, wait: float = 0):
     """Получить текущие настройки системы"""
-    return system_settings
+    return await conditional_get(
+        request, settings_version,
+        lambda version: f'"settings-{version}"',
+        lambda: system_settings,
+        wait
+    )
 
 @app.post("/api/settings")
 async def update_settings(settings: SystemSettings):
@@ -951,6 +1924,24 @@ async def update_settings(settings: SystemSettings):
     try:
         global system_settings
         system_settings = settings
+        settings_version.bump()
+        if detection_writer:
+            detection_writer.incident_gap = settings.incident_gap_seconds
+            detection_writer.store_raw_detections = settings.store_raw_detections
+        if query_cache:
+            query_cache.ttl = settings.query_cache_ttl
+            query_cache.max_entries = settings.query_cache_size
+        if thumbnail_cache:
+            thumbnail_cache.resize(thumbnail_cache_budget(settings))
+        if partition_manager:
+            partition_manager.premake_days = settings.partition_premake_days
+            partition_manager.batch_size = settings.retention_batch_size
+        if retention_worker:
+            retention_worker.retention_days = settings.retention_days
+            retention_worker.interval = settings.retention_interval
+            retention_worker.max_batch_size = settings.retention_batch_size
+            retention_worker.max_transaction_seconds = settings.retention_max_transaction_seconds
+            retention_worker.pause = settings.retention_pause
         if save_settings():
             # Перезапускаем активные потоки с новыми настройками
             if rtsp_manager:
@@ -977,6 +1968,7 @@ async def update_telegram_settings(telegram_settings: TelegramSettings):
     """Обновить настройки Telegram"""
     try:
         system_settings.telegram = telegram_settings
+        settings_version.bump()
         if save_settings():
             # Обновляем Telegram сервис
             if telegram_service:
@@ -1016,33 +2008,46 @@ async def test_telegram_connection():
         raise HTTPException(status_code=500, detail=f"Telegram test failed: {str(e)}")
 
 # API endpoints для алертов
+def invalidate_after_flush(detection_streams: Set[str], alert_streams: Set[str], rollups: bool):
+    """Сброс кэша запросов после записи пакета детекций (вызывается из потока writer'а)"""
+    if query_cache is None:
+        return
+    tags = []
+    if detection_streams:
+        tags.extend(stream_write_tags("detections", detection_streams))
+    if alert_streams:
+        tags.append("alerts")
+    if rollups:
+        tags.append("statistics")
+    query_cache.invalidate(*tags)
+
+def next_page_cursor(rows: List[Dict], limit: int, time_field: str) -> Optional[str]:
+    """Курсор следующей страницы или None, если страница последняя"""
+    if not rows or len(rows) < limit:
+        return None
+    return AlertService.encode_cursor(rows[-1][time_field], rows[-1]["id"])
+
 @app.get("/api/alerts")
 async def get_alerts(limit: int = 100, offset: int = 0, 
-                    alert_type: str = None, acknowledged: bool = None):
-    """Получение списка алертов"""
+                    alert_type: str = None, acknowledged: bool = None, cursor: str = None):
+    """Получение списка алертов; следующая страница - по next_cursor"""
     if alert_service is None:
         raise HTTPException(status_code=503, detail="Alert service not available")
     
+    async def load():
+        alerts = await alert_service.get_alerts(limit=limit, offset=offset,
+                                                alert_type=alert_type, acknowledged=acknowledged,
+                                                cursor=cursor)
+        return {"alerts": alerts, "next_cursor": next_page_cursor(alerts, limit, "created_at")}
+    
     try:
-        alerts = alert_service.get_alerts(limit=limit, offset=offset, 
-                                        alert_type=alert_type, acknowledged=acknowledged)
-        return {
-            "alerts": [
-                {
-                    "id": alert.id,
-                    "type": alert.type,
-                    "message": alert.message,
-                    "severity": alert.severity,
-                    "acknowledged": alert.acknowledged,
-                    "acknowledged_by": alert.acknowledged_by,
-                    "acknowledged_at": alert.acknowledged_at.isoformat() if alert.acknowledged_at else None,
-                    "created_at": alert.created_at.isoformat(),
-                    "stream_id": alert.stream.stream_id if alert.stream else None,
-                    "detection_id": alert.detection_id
-                }
-                for alert in alerts
-            ]
-        }
+        key = query_key("alerts", limit=limit, offset=offset, alert_type=alert_type,
+                        acknowledged=acknowledged, cursor=cursor)
+        return await query_cache.get_or_load(key, table_tags("alerts"), load)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Database query timed out")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get alerts: {str(e)}")
 
@@ -1053,43 +2058,178 @@ async def acknowledge_alert(alert_id: int, acknowledged_by: str = "system"):
         raise HTTPException(status_code=503, detail="Alert service not available")
     
     try:
-        success = alert_service.acknowledge_alert(alert_id, acknowledged_by)
-        if success:
-            return {"success": True, "message": "Alert acknowledged"}
-        else:
-            raise HTTPException(status_code=404, detail="Alert not found")
+        success = await asyncio.to_thread(alert_service.acknowledge_alert, alert_id, acknowledged_by)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to acknowledge alert: {str(e)}")
+    if not success:
+        raise HTTPException(status_code=404, detail="Alert not found")
+    query_cache.invalidate("alerts")
+    return {"success": True, "message": "Alert acknowledged"}
 
 @app.get("/api/detections/history")
 async def get_detection_history(limit: int = 100, offset: int = 0, 
-                               stream_id: str = None, is_violence: bool = None):
-    """Получение истории детекций"""
+                               stream_id: str = None, is_violence: bool = None, cursor: str = None):
+    """Получение истории детекций; следующая страница - по next_cursor"""
     if alert_service is None:
         raise HTTPException(status_code=503, detail="Alert service not available")
     
+    async def load():
+        detections = await alert_service.get_detections(limit=limit, offset=offset,
+                                                        stream_id=stream_id, is_violence=is_violence,
+                                                        cursor=cursor)
+        return {"detections": detections, "next_cursor": next_page_cursor(detections, limit, "timestamp")}
+    
     try:
-        detections = alert_service.get_detections(limit=limit, offset=offset, 
-                                                stream_id=stream_id, is_violence=is_violence)
-        return {
-            "detections": [
-                {
-                    "id": detection.id,
-                    "stream_id": detection.stream.stream_id,
-                    "timestamp": detection.timestamp.isoformat(),
-                    "is_violence": detection.is_violence,
-                    "confidence": detection.confidence,
-                    "frame_data": detection.frame_data,
-                    "processed": detection.processed,
-                    "acknowledged": detection.acknowledged,
-                    "created_at": detection.created_at.isoformat()
-                }
-                for detection in detections
-            ]
-        }
+        key = query_key("detections", limit=limit, offset=offset, stream_id=stream_id,
+                        is_violence=is_violence, cursor=cursor)
+        return await query_cache.get_or_load(key, table_tags("detections", stream_id), load)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Database query timed out")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get detections: {str(e)}")
 
+def export_response(name: str, fmt: str, batches, columns) -> StreamingResponse:
+    """Потоковый ответ с выгрузкой: строки читаются и отправляются порциями"""
+    media_type, extension = EXPORT_FORMATS[fmt]
+    return StreamingResponse(export_stream(batches, columns, fmt), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{name}.{extension}"'})
+
+def check_export_format(fmt: str):
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {fmt}. Use one of {', '.join(EXPORT_FORMATS)}")
+    if fmt == "parquet" and not parquet_available():
+        raise HTTPException(status_code=400, detail="Parquet export requires pyarrow")
+
+@app.get("/api/export/detections")
+async def export_detections(format: str = "csv", stream_id: str = None,
+                            since: datetime = None, until: datetime = None,
+                            min_confidence: float = None, max_confidence: float = None,
+                            is_violence: bool = None, include_thumbnails: bool = False):
+    """Выгрузка сохраненных детекций в CSV, NDJSON или Parquet с постоянным расходом памяти"""
+    if alert_service is None:
+        raise HTTPException(status_code=503, detail="Alert service not available")
+    check_export_format(format)
+    
+    columns = list(AlertService.DETECTION_EXPORT_COLUMNS)
+    if include_thumbnails:
+        columns.append(("thumbnail", "bytes"))
+    batches = alert_service.stream_detections(stream_id=stream_id, since=since, until=until,
+                                              min_confidence=min_confidence, max_confidence=max_confidence,
+                                              is_violence=is_violence, include_thumbnails=include_thumbnails,
+                                              batch_size=system_settings.export_batch_size)
+    return export_response("detections", format, batches, columns)
+
+@app.get("/api/export/alerts")
+async def export_alerts(format: str = "csv", stream_id: str = None,
+                        since: datetime = None, until: datetime = None,
+                        alert_type: str = None, acknowledged: bool = None):
+    """Выгрузка алертов в CSV, NDJSON или Parquet"""
+    if alert_service is None:
+        raise HTTPException(status_code=503, detail="Alert service not available")
+    check_export_format(format)
+    
+    batches = alert_service.stream_alerts(stream_id=stream_id, since=since, until=until,
+                                          alert_type=alert_type, acknowledged=acknowledged,
+                                          batch_size=system_settings.export_batch_size)
+    return export_response("alerts", format, batches, AlertService.ALERT_EXPORT_COLUMNS)
+
+# Миниатюры неизменяемы, поэтому клиенты могут кэшировать их без ограничений
+THUMBNAIL_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Ключ сохраненной миниатюры - SHA-256 содержимого (идентификаторы кэша в памяти короче)
+STORED_THUMBNAIL_ID = re.compile(r"[0-9a-f]{64}")
+
+@app.get("/api/thumbnails/{thumbnail_id}")
+async def get_thumbnail(thumbnail_id: str, request: Request):
+    """Миниатюра детекции: из кэша в памяти, сохраненная - из базы по ключу содержимого"""
+    if thumbnail_cache is None:
+        raise HTTPException(status_code=503, detail="Service not ready")
+    
+    etag = f'"{thumbnail_id}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": THUMBNAIL_CACHE_CONTROL})
+    
+    # Первый запрос миниатюры кодирует JPEG: вне event loop
+    jpeg = await asyncio.to_thread(thumbnail_cache.get_jpeg, thumbnail_id)
+    if jpeg is None and alert_service is not None and STORED_THUMBNAIL_ID.fullmatch(thumbnail_id):
+        try:
+            jpeg = await alert_service.get_thumbnail(thumbnail_id)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Database query timed out")
+    if jpeg is None:
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+    return Response(content=jpeg, media_type="image/jpeg",
+                    headers={"ETag": etag, "Cache-Control": THUMBNAIL_CACHE_CONTROL})
+
+@app.get("/api/detections/{detection_id}/thumbnail")
+async def get_detection_thumbnail(detection_id: int, request: Request):
+    """Миниатюра сохраненной детекции из базы данных"""
+    if alert_service is None:
+        raise HTTPException(status_code=503, detail="Alert service not available")
+    
+    etag = f'"detection-{detection_id}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": THUMBNAIL_CACHE_CONTROL})
+    
+    try:
+        jpeg = await alert_service.get_detection_thumbnail(detection_id)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Database query timed out")
+    if not jpeg:
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+    return Response(content=jpeg, media_type="image/jpeg",
+                    headers={"ETag": etag, "Cache-Control": THUMBNAIL_CACHE_CONTROL})
+
+@app.get("/api/incidents")
+async def get_incidents(limit: int = 100, offset: int = 0,
+                        stream_id: str = None, is_open: bool = None, cursor: str = None):
+    """Получение списка инцидентов; следующая страница - по next_cursor"""
+    if alert_service is None:
+        raise HTTPException(status_code=503, detail="Alert service not available")
+    
+    try:
+        incidents = await alert_service.get_incidents(limit=limit, offset=offset,
+                                                      stream_id=stream_id, is_open=is_open, cursor=cursor)
+        return {"incidents": incidents, "next_cursor": next_page_cursor(incidents, limit, "started_at")}
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Database query timed out")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get incidents: {str(e)}")
+
+@app.get("/api/incidents/{incident_id}/thumbnails/{role}")
+async def get_incident_thumbnail(incident_id: int, role: str):
+    """Представительная миниатюра инцидента (first, peak или last)"""
+    if alert_service is None:
+        raise HTTPException(status_code=503, detail="Alert service not available")
+    
+    try:
+        jpeg = await alert_service.get_incident_thumbnail(incident_id, role)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Database query timed out")
+    if not jpeg:
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+    # Миниатюры открытого инцидента меняются, поэтому только короткое кэширование
+    return Response(content=jpeg, media_type="image/jpeg",
+                    headers={"Cache-Control": "private, max-age=5"})
+
+@app.post("/api/incidents/{incident_id}/acknowledge")
+async def acknowledge_incident(incident_id: int):
+    """Подтверждение инцидента"""
+    if alert_service is None:
+        raise HTTPException(status_code=503, detail="Alert service not available")
+    
+    try:
+        success = await asyncio.to_thread(alert_service.acknowledge_incident, incident_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to acknowledge incident: {str(e)}")
+    if not success:
+        raise HTTPException(status_code=404, detail="Incident not found")
+    query_cache.invalidate("alerts")
+    return {"success": True, "message": "Incident acknowledged"}
+
 @app.post("/api/detections/{detection_id}/acknowledge")
 async def acknowledge_detection(detection_id: int):
     """Подтверждение детекции"""
@@ -1097,13 +2237,13 @@ async def acknowledge_detection(detection_id: int):
         raise HTTPException(status_code=503, detail="Alert service not available")
     
     try:
-        success = alert_service.acknowledge_detection(detection_id)
-        if success:
-            return {"success": True, "message": "Detection acknowledged"}
-        else:
-            raise HTTPException(status_code=404, detail="Detection not found")
+        success = await asyncio.to_thread(alert_service.acknowledge_detection, detection_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to acknowledge detection: {str(e)}")
+    if not success:
+        raise HTTPException(status_code=404, detail="Detection not found")
+    query_cache.invalidate("detections")
+    return {"success": True, "message": "Detection acknowledged"}
 
 @app.get("/api/statistics")
 async def get_statistics(days: int = 7):
@@ -1112,26 +2252,142 @@ async def get_statistics(days: int = 7):
         raise HTTPException(status_code=503, detail="Alert service not available")
     
     try:
-        stats = alert_service.get_statistics(days=days)
-        return stats
+        return await query_cache.get_or_load(query_key("statistics", days=days), ("statistics",),
+                                             lambda: alert_service.get_statistics(days=days))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Database query timed out")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get statistics: {str(e)}")
 
 @app.post("/api/cleanup")
-async def cleanup_old_data(days: int = 30):
-    """Очистка старых данных"""
-    if alert_service is None:
-        raise HTTPException(status_code=503, detail="Alert service not available")
+async def cleanup_old_data(days: int = None):
+    """Внеочередной проход фоновой очистки (по умолчанию - retention_days из настроек)"""
+    if retention_worker is None:
+        raise HTTPException(status_code=503, detail="Retention worker not available")
+    if days is not None and days < 0:
+        raise HTTPException(status_code=400, detail="days must not be negative")
     
+    if not retention_worker.trigger(days):
+        raise HTTPException(status_code=409, detail="Retention is already running")
+    return {
+        "success": True,
+        "message": f"Cleanup of data older than "
+                   f"{days if days is not None else system_settings.retention_days} days started",
+        "status": retention_worker.get_stats()
+    }
+
+@app.get("/api/cleanup")
+async def get_cleanup_status():
+    """Ход фоновой очистки: удалено строк по таблицам, скорость, удаленные секции"""
+    if retention_worker is None:
+        raise HTTPException(status_code=503, detail="Retention worker not available")
+    return retention_worker.get_stats()
+
+PONG_MESSAGE = OutgoingMessage({"type": "pong"})
+
+async def resume_client(client: ClientConnection, request: Dict):
+    """Досылка пропущенных клиентом событий.
+    
+    Если события после last_seq еще в журнале, они отправляются повторно (с учетом подписки).
+    Иначе (журнал вытеснен, сервер перезапущен или событий слишком много) клиент получает
+    инциденты (и сырые детекции, если они сохраняются) из базы данных начиная с since.
+    """
     try:
-        result = alert_service.cleanup_old_data(days=days)
-        return {
-            "success": True,
-            "message": f"Cleaned up data older than {days} days",
-            "deleted": result
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to cleanup data: {str(e)}")
+        last_seq = int(request.get("last_seq"))
+    except (TypeError, ValueError):
+        return
+    
+    events = event_log.since(last_seq) if request.get("epoch") == event_log.epoch else None
+    if events is not None:
+        replay = [message for _, topics, stream_id, message in events if client.wants(topics, stream_id)]
+        # Слишком длинный повтор переполнит очередь клиента: отдаем историю одним сообщением
+        if len(client.pending) + len(replay) < client.max_queue // 2:
+            for message in replay:
+                if not connection_manager.send(client, message):
+                    return
+            connection_manager.send(client, OutgoingMessage({
+                "type": "resumed",
+                "mode": "log",
+                "epoch": event_log.epoch,
+                "seq": event_log.seq,
+                "replayed": len(replay)
+            }))
+            return
+    
+    detections = []
+    incidents = []
+    since = request.get("since")
+    if since is not None and alert_service is not None:
+        try:
+            since_time = datetime.fromtimestamp(float(since))
+            rows = await alert_service.get_incidents(limit=system_settings.resume_history_limit,
+                                                     since=since_time)
+            incidents = [incident for incident in rows
+                         if client.streams is None or incident["stream_id"] in client.streams]
+            if system_settings.store_raw_detections:
+                rows = await alert_service.get_detections(limit=system_settings.resume_history_limit,
+                                                          is_violence=True,
+                                                          since=since_time)
+                detections = [detection for detection in rows
+                              if client.streams is None or detection["stream_id"] in client.streams]
+        except Exception as e:
+            print(f"Error loading history for resume: {e}")
+    
+    connection_manager.send(client, OutgoingMessage({
+        "type": "resumed",
+        "mode": "history",
+        "epoch": event_log.epoch,
+        "seq": event_log.seq,
+        "incidents": incidents,
+        "detections": detections
+    }))
+
+def is_string_list(value) -> bool:
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+def handle_subscription(client: ClientConnection, message: Dict):
+    """Обработка subscribe/unsubscribe от клиента /ws.
+    
+    {"type": "subscribe", "topics": [...], "streams": [...] | "*"}
+    {"type": "unsubscribe", "topics": [...], "streams": [...]}
+    
+    Некорректный запрос не меняет подписку, клиент получает сообщение об ошибке.
+    """
+    topics = message.get("topics")
+    streams = message.get("streams")
+    error = None
+    if topics is not None and not is_string_list(topics):
+        error = "topics must be a list of strings"
+    elif streams is not None and not is_string_list(streams) and not (
+            streams == "*" and message["type"] == "subscribe"):
+        error = "streams must be a list of strings" + (" or \"*\"" if message["type"] == "subscribe" else "")
+    elif message["type"] == "unsubscribe" and streams and client.streams is None:
+        # Отписка от отдельных потоков при подписке на все потоки ничего бы не изменила
+        error = "cannot unsubscribe from individual streams while subscribed to all streams"
+    if error is not None:
+        connection_manager.send(client, OutgoingMessage({"type": "error", "request": message["type"], "message": error}))
+        return
+    
+    topics = set(topics or [])
+    had_status = TOPIC_STATUS in client.topics
+    previous_streams = client.streams
+    
+    if message["type"] == "subscribe":
+        connection_manager.update_subscription(client, add_topics=topics, streams=streams)
+    else:
+        connection_manager.update_subscription(client, remove_topics=topics,
+                                               remove_streams=set(streams or []))
+    
+    # При изменении подписки на статус клиент получает новый снимок
+    if TOPIC_STATUS in client.topics and (not had_status or client.streams != previous_streams):
+        connection_manager.send_status_snapshot(
+            client, OutgoingMessage(status_snapshot.snapshot_message(client.streams)))
+    
+    connection_manager.send(client, OutgoingMessage({
+        "type": "subscribed",
+        "topics": sorted(client.topics),
+        "streams": sorted(client.streams) if client.streams is not None else None
+    }))
 
 # WebSocket endpoint
 @app.websocket("/ws")
@@ -1140,24 +2396,93 @@ async def websocket_endpoint(websocket: WebSocket):
         await websocket.close(code=503, reason="Service not ready")
         return
     
-    await connection_manager.connect(websocket)
+    # Начальная подписка может быть задана параметрами ?topics=...&streams=...
+    topics = websocket.query_params.get("topics")
+    streams = websocket.query_params.get("streams")
+    client = await connection_manager.connect(
+        websocket,
+        topics=set(topics.split(",")) if topics else None,
+        streams=set(streams.split(",")) if streams else None,
+        codec=negotiate_codec(websocket)
+    )
+    connection_manager.send(client, OutgoingMessage({"type": "hello", "epoch": event_log.epoch, "seq": event_log.seq}))
+    # Новый клиент сначала получает полный снимок статуса потоков
+    if TOPIC_STATUS in client.topics:
+        connection_manager.send_status_snapshot(
+            client, OutgoingMessage(status_snapshot.snapshot_message(client.streams)))
     try:
+        # Восстановление пропущенных событий: ?last_seq=N&epoch=E&since=<unix time>
+        last_seq = websocket.query_params.get("last_seq")
+        if last_seq is not None:
+            await resume_client(client, {
+                "last_seq": last_seq,
+                "epoch": websocket.query_params.get("epoch"),
+                "since": websocket.query_params.get("since")
+            })
+        
         while True:
             # Ожидание сообщений от клиента
             data = await websocket.receive_text()
             try:
-                message = json.loads(data)
+                message = orjson.loads(data)
                 if message.get("type") == "ping":
-                    await websocket.send_text(json.dumps({"type": "pong"}))
-            except json.JSONDecodeError:
+                    # Ответ идет через очередь клиента, чтобы не конкурировать с писателем
+                    connection_manager.send(client, PONG_MESSAGE)
+                elif message.get("type") == "get_status_snapshot":
+                    # Клиент потерял последовательность версий и запрашивает полный снимок
+                    connection_manager.send_status_snapshot(
+                        client, OutgoingMessage(status_snapshot.snapshot_message(client.streams)))
+                elif message.get("type") in ("subscribe", "unsubscribe"):
+                    handle_subscription(client, message)
+                elif message.get("type") == "resume":
+                    await resume_client(client, message)
+            except orjson.JSONDecodeError:
                 pass
     except WebSocketDisconnect:
-        connection_manager.disconnect(websocket)
+        pass
+    finally:
+        connection_manager.disconnect(client)
 
 # WebSocket endpoint для видеопотоков
+# Последнее сообщение с кадром превью по каждому потоку: (seq, сообщение)
+preview_messages: Dict[str, tuple] = {}
+
+def get_preview_message(stream_processor: RTSPProcessor, seq: int, jpeg: bytes) -> OutgoingMessage:
+    """Сообщение с кадром превью; собирается один раз на кадр для всех зрителей"""
+    cached = preview_messages.get(stream_processor.stream_id)
+    if cached and cached[0] == seq:
+        return cached[1]
+    
+    # Получаем последний результат детекции для этого потока
+    last_detection = stream_processor.last_detection
+    
+    # Проверяем, не устарел ли результат детекции (больше 5 секунд)
+    current_time = time.time()
+    detection_data = None
+    
+    if last_detection and (current_time - last_detection.timestamp) < 5.0:
+        # Результат детекции актуален (не старше 5 секунд)
+        detection_data = {
+            "is_violence": last_detection.is_violence,
+            "confidence": last_detection.confidence,
+            "timestamp": last_detection.timestamp
+        }
+    
+    # Кадр передается как JPEG: base64 для JSON, бинарно для msgpack
+    message = OutgoingMessage({
+        "type": "frame",
+        "stream_id": stream_processor.stream_id,
+        "timestamp": current_time,
+        "frame": jpeg,
+        "detection": detection_data
+    })
+    preview_messages[stream_processor.stream_id] = (seq, message)
+    return message
+
 @app.websocket("/stream/{stream_id}")
 async def stream_websocket(websocket: WebSocket, stream_id: str):
     await websocket.accept()
+    codec = negotiate_codec(websocket)
     
     # Проверяем, существует ли поток
     if rtsp_manager is None or stream_id not in rtsp_manager.streams:
@@ -1165,124 +2490,129 @@ async def stream_websocket(websocket: WebSocket, stream_id: str):
         return
     
     stream_processor = rtsp_manager.streams[stream_id]
+    stream_processor.attach_viewer()
+    last_sent_seq = -1
+    loading_message = OutgoingMessage({
+        "type": "loading",
+        "stream_id": stream_id,
+        "message": "Buffering frames..."
+    })
     
     try:
         while True:
             # Проверяем, что поток активен
             if not stream_processor.is_running:
-                await websocket.send_text(json.dumps({
+                await send_encoded(websocket, OutgoingMessage({
                     "type": "error",
                     "message": "Stream is not running"
-                }))
+                }).encode(codec))
                 break
             
-            # Безопасно получаем последний кадр из буфера
-            frame_data = None
-            with stream_processor.buffer_lock:
-                if stream_processor.frame_buffer:
-                    # Берем последний кадр (формат CHW: 3, 224, 224)
-                    last_frame = stream_processor.frame_buffer[-1]
-                    
-                    # Конвертируем обратно в HWC формат для OpenCV
-                    frame_hwc = np.transpose(last_frame, (1, 2, 0))  # (H, W, C)
-                    
-                    # Конвертируем обратно в uint8 для кодирования
-                    frame_uint8 = (frame_hwc * 255).astype(np.uint8)
-                    
-                    # Изменяем размер для передачи (лучшее качество)
-                    frame_resized = cv2.resize(frame_uint8, (640, 480))
-                    
-                    # Кодируем в JPEG с высоким качеством
-                    _, buffer = cv2.imencode('.jpg', frame_resized, [cv2.IMWRITE_JPEG_QUALITY, 95])
-                    frame_data = base64.b64encode(buffer).decode('utf-8')
-                
-            if frame_data:
-                # Получаем последний результат детекции для этого потока
-                last_detection = stream_processor.last_detection
-                
-                # Проверяем, не устарел ли результат детекции (больше 5 секунд)
-                current_time = time.time()
-                detection_data = None
-                
-                if last_detection and (current_time - last_detection.timestamp) < 5.0:
-                    # Результат детекции актуален (не старше 5 секунд)
-                    detection_data = {
-                        "is_violence": last_detection.is_violence,
-                        "confidence": last_detection.confidence,
-                        "timestamp": last_detection.timestamp
-                    }
-                
-                # Отправляем кадр с результатом детекции
-                await websocket.send_text(json.dumps({
-                    "type": "frame",
-                    "stream_id": stream_id,
-                    "timestamp": time.time(),
-                    "frame": frame_data,
-                    "detection": detection_data
-                }))
+            # Берем последний кадр из слота превью (кодирование JPEG вне event loop)
+            seq, jpeg = await asyncio.to_thread(stream_processor.get_preview_jpeg)
+            
+            if jpeg is not None:
+                # Повторно один и тот же кадр не отправляем
+                if seq != last_sent_seq:
+                    last_sent_seq = seq
+                    message = get_preview_message(stream_processor, seq, jpeg)
+                    await send_encoded(websocket, message.encode(codec))
             else:
-                # Если буфер пуст, отправляем сообщение о загрузке
-                await websocket.send_text(json.dumps({
-                    "type": "loading",
-                    "stream_id": stream_id,
-                    "message": "Buffering frames..."
-                }))
+                # Если кадра еще нет, отправляем сообщение о загрузке
+                await send_encoded(websocket, loading_message.encode(codec))
             
-            # Ждем немного перед отправкой следующего кадра (25 FPS для баланса качества/производительности)
-            await asyncio.sleep(0.04)  # 25 FPS для плавного видео
+            # Частота отправки соответствует частоте обновления превью
+            await asyncio.sleep(1.0 / max(1, system_settings.preview_fps))
             
     except WebSocketDisconnect:
         print(f"Stream WebSocket disconnected for {stream_id}")
     except Exception as e:
         print(f"Stream WebSocket error for {stream_id}: {e}")
         try:
-            await websocket.send_text(json.dumps({
+            await send_encoded(websocket, OutgoingMessage({
                 "type": "error",
                 "message": str(e)
-            }))
+            }).encode(codec))
         except:
             pass
+    finally:
+        stream_processor.detach_viewer()
 
-# Фоновая задача для отправки результатов детекции
-@app.on_event("startup")
-async def startup_event():
-    asyncio.create_task(broadcast_detection_results())
+# Фоновые задачи для отправки результатов через WebSocket
+async def deliver_detection_results():
+    """Доставка результатов детекции клиентам сразу после их появления"""
+    while True:
+        detection = await detection_bridge.get()
+        try:
+            if connection_manager is not None:
+                if detection.is_violence:
+                    # События с насилием и алерты получают номер в журнале для восстановления клиентов
+                    topics = [TOPIC_DETECTIONS, TOPIC_VIOLENCE]
+                    message = event_log.append(topics, detection.stream_id, {
+                        "type": "detection_result",
+                        "data": detection.model_dump()
+                    })
+                    connection_manager.publish(topics, detection.stream_id, message,
+                                               created_at=detection.timestamp)
+                    
+                    alert_message = event_log.append([TOPIC_ALERTS], detection.stream_id, {
+                        "type": "alert",
+                        "data": {
+                            "stream_id": detection.stream_id,
+                            "type": "violence",
+                            "severity": "high",
+                            "message": f"Violence detected in stream {detection.stream_id}",
+                            "confidence": detection.confidence,
+                            "timestamp": detection.timestamp
+                        }
+                    })
+                    connection_manager.publish([TOPIC_ALERTS], detection.stream_id, alert_message,
+                                               created_at=detection.timestamp)
+                elif connection_manager.recipients([TOPIC_DETECTIONS], detection.stream_id):
+                    connection_manager.publish([TOPIC_DETECTIONS], detection.stream_id, OutgoingMessage({
+                        "type": "detection_result",
+                        "data": detection.model_dump()
+                    }), created_at=detection.timestamp)
+            
+            # Уведомления Telegram только ставятся в очередь TelegramDispatcher
+            if telegram_service:
+                telegram_service.handle_detection(detection)
+        except Exception as e:
+            print(f"Error delivering detection result: {e}")
 
-async def broadcast_detection_results():
-    """Фоновая задача для отправки результатов детекции через WebSocket"""
+async def broadcast_streams_status():
+    """Фоновая задача для отправки статуса потоков через WebSocket"""
     while True:
         try:
             if rtsp_manager is None or connection_manager is None:
                 await asyncio.sleep(1)
                 continue
-                
-            # Получение новых результатов
-            detections = rtsp_manager.get_latest_detections()
             
-            for detection in detections:
-                message = {
-                    "type": "detection_result",
-                    "data": detection.model_dump()
-                }
-                await connection_manager.broadcast(json.dumps(message))
-                
-                # Обработка Telegram уведомлений
-                if telegram_service:
-                    await telegram_service.handle_detection(detection)
+            # Отправка только изменившихся полей статуса потоков
+            delta = status_snapshot.update(rtsp_manager.get_all_streams())
+            if delta is not None:
+                connection_manager.broadcast_status(delta, status_snapshot)
+                # Long-poll /api/streams просыпается только от смены состояния потоков
+                if StatusSnapshot.lifecycle_changed(delta):
+                    rtsp_manager.version.bump()
             
-            # Отправка статуса потоков
-            streams_status = rtsp_manager.get_all_streams()
-            status_message = {
-                "type": "streams_status",
-                "data": [stream.model_dump() for stream in streams_status]
-            }
-            await connection_manager.broadcast(json.dumps(status_message))
-            
-            await asyncio.sleep(0.1)  # 10 FPS обновление
+            await asyncio.sleep(system_settings.status_update_interval)
         except Exception as e:
-            print(f"Error broadcasting results: {e}")
+            print(f"Error broadcasting streams status: {e}")
             await asyncio.sleep(1)
 
+async def monitor_triton_health():
+    """Фоновая проверка здоровья Triton: смена состояния будит long-poll /api/status"""
+    while True:
+        try:
+            if rtsp_manager is not None:
+                if await asyncio.to_thread(rtsp_manager.triton_client.refresh_health):
+                    print(f"Triton server is {'ready' if rtsp_manager.triton_client.healthy else 'not ready'}")
+                    rtsp_manager.version.bump()
+        except Exception as e:
+            print(f"Error checking Triton health: {e}")
+        await asyncio.sleep(TritonClient.HEALTH_CHECK_INTERVAL)
+
 if __name__ == "__main__":
     import uvicorn
     
@@ -0,0 +1,191 @@
+import re
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+# Секционированные по суткам таблицы и их ключ секционирования
+PARTITIONED_TABLES = {
+    "detections": "timestamp",
+    "alerts": "created_at",
+    "system_events": "created_at",
+}
+
+PARTITION_LOWER_BOUND = re.compile(r"FROM \('([^']+)'\)")
+PARTITION_UPPER_BOUND = re.compile(r"TO \('([^']+)'\)")
+
+class PartitionManager:
+    """Обслуживание секций PostgreSQL для таблиц detections, alerts и system_events.
+
+    Заранее создает секции на ближайшие premake_days суток, а для соблюдения
+    срока хранения отсоединяет и удаляет целые секции вместо DELETE по строкам.
+    Строки, попавшие в секцию DEFAULT (сервис не создал секцию вовремя),
+    переносятся в новую секцию их дня или удаляются порциями по сроку хранения.
+    В SQLite и в несекционированной схеме (до миграции 0006) ничего не делает.
+    """
+
+    def __init__(self, engine: Engine, premake_days: int = 3, lock_timeout: str = "5s",
+                 batch_size: int = 1000):
+        self.engine = engine
+        self.premake_days = premake_days
+        # Ожидание блокировки при DETACH/CREATE, чтобы не останавливать запись детекций
+        self.lock_timeout = lock_timeout
+        # Порция удаления устаревших строк из секции DEFAULT
+        self.batch_size = batch_size
+        self.partitioned_tables: List[str] = []
+
+        # Статистика
+        self.created = 0
+        self.dropped = 0
+        self.moved = 0
+        self.purged = 0
+        self.last_run: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+
+    def refresh(self) -> List[str]:
+        """Определение таблиц, которые в базе действительно секционированы"""
+        if self.engine.dialect.name != "postgresql":
+            self.partitioned_tables = []
+            return self.partitioned_tables
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text("SELECT relname FROM pg_class WHERE relkind = 'p' AND relname = ANY(:tables)"),
+                {"tables": list(PARTITIONED_TABLES)}
+            ).scalars().all()
+        self.partitioned_tables = [table for table in PARTITIONED_TABLES if table in rows]
+        return self.partitioned_tables
+
+    @staticmethod
+    def partition_name(table: str, day: date) -> str:
+        return f"{table}_p{day:%Y%m%d}"
+
+    def partitions(self, table: str) -> List[Tuple[str, Optional[datetime], Optional[datetime]]]:
+        """Секции таблицы и их границы [нижняя, верхняя).
+
+        Для секции DEFAULT обе границы None, для FROM (MINVALUE) - только нижняя.
+        """
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(
+                "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) "
+                "FROM pg_inherits JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+                "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                "WHERE parent.relname = :table ORDER BY child.relname"
+            ), {"table": table}).all()
+        result = []
+        for name, bound in rows:
+            lower = PARTITION_LOWER_BOUND.search(bound or "")
+            upper = PARTITION_UPPER_BOUND.search(bound or "")
+            result.append((
+                name,
+                datetime.fromisoformat(lower.group(1)) if lower else None,
+                datetime.fromisoformat(upper.group(1)) if upper else None
+            ))
+        return result
+
+    def ensure_partitions(self, today: date = None) -> int:
+        """Создание секций с сегодняшнего дня на premake_days суток вперед.
+
+        Покрытие определяется по границам существующих секций, а не по именам:
+        дни до наибольшей верхней границы уже покрыты (например, прежней
+        таблицей, подключенной миграцией 0006 до завтрашнего дня).
+        """
+        today = today or date.today()
+        created = 0
+        for table in self.partitioned_tables:
+            partitions = self.partitions(table)
+            default = next((name for name, lower, upper in partitions if upper is None), None)
+            covered = max((upper for _, _, upper in partitions if upper is not None), default=None)
+            for offset in range(self.premake_days + 1):
+                day = today + timedelta(days=offset)
+                if covered is not None and datetime.combine(day, datetime.min.time()) < covered:
+                    continue
+                self._create_partition(table, day, default)
+                created += 1
+        self.created += created
+        return created
+
+    def _create_partition(self, table: str, day: date, default: Optional[str]):
+        name = self.partition_name(table, day)
+        key = PARTITIONED_TABLES[table]
+        params = {"lower": day, "upper": day + timedelta(days=1)}
+        bounds = f"FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+        with self.engine.begin() as conn:
+            conn.execute(text(f"SET LOCAL lock_timeout = '{self.lock_timeout}'"))
+            stranded = default is not None and conn.execute(text(
+                f"SELECT 1 FROM {default} WHERE {key} >= :lower AND {key} < :upper LIMIT 1"
+            ), params).scalar()
+            if not stranded:
+                conn.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} FOR VALUES {bounds}"))
+                return
+            # Секция не могла быть создана, пока в DEFAULT есть строки ее дня:
+            # переносим их в новую таблицу и подключаем ее в той же транзакции
+            conn.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)"))
+            moved = conn.execute(text(
+                f"WITH moved AS (DELETE FROM {default} WHERE {key} >= :lower AND {key} < :upper RETURNING *) "
+                f"INSERT INTO {name} SELECT * FROM moved"
+            ), params).rowcount
+            conn.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES {bounds}"))
+        self.moved += moved
+        print(f"Partition {name}: moved {moved} rows from {default}")
+
+    def drop_expired(self, cutoff: datetime) -> List[str]:
+        """Отсоединение и удаление секций, все строки которых старше cutoff,
+        и удаление устаревших строк из секции DEFAULT"""
+        dropped = []
+        for table in self.partitioned_tables:
+            for name, lower, upper in self.partitions(table):
+                if upper is None:
+                    if lower is None:
+                        self.purge_default(table, name, cutoff)
+                    continue
+                if upper > cutoff:
+                    continue
+                # Отдельные короткие транзакции: DETACH берет блокировку родителя
+                with self.engine.begin() as conn:
+                    conn.execute(text(f"SET LOCAL lock_timeout = '{self.lock_timeout}'"))
+                    conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+                with self.engine.begin() as conn:
+                    conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                dropped.append(name)
+        self.dropped += len(dropped)
+        return dropped
+
+    def purge_default(self, table: str, name: str, cutoff: datetime) -> int:
+        """Удаление строк старше cutoff из секции DEFAULT порциями по batch_size"""
+        key = PARTITIONED_TABLES[table]
+        purged = 0
+        while True:
+            with self.engine.begin() as conn:
+                deleted = conn.execute(text(
+                    f"DELETE FROM {name} WHERE ctid IN "
+                    f"(SELECT ctid FROM {name} WHERE {key} < :cutoff LIMIT :limit)"
+                ), {"cutoff": cutoff, "limit": self.batch_size}).rowcount
+            purged += deleted
+            if deleted < self.batch_size:
+                break
+        self.purged += purged
+        return purged
+
+    def maintain(self, retention_days: int) -> Dict:
+        """Плановое обслуживание: секции на будущее и удаление устаревших"""
+        self.last_run = datetime.now()
+        try:
+            self.refresh()
+            created = self.ensure_partitions()
+            dropped = self.drop_expired(datetime.now() - timedelta(days=retention_days))
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            raise
+        return {"created_partitions": created, "dropped_partitions": dropped}
+
+    def get_stats(self) -> Dict:
+        return {
+            "partitioned_tables": self.partitioned_tables,
+            "created": self.created,
+            "dropped": self.dropped,
+            "moved_from_default": self.moved,
+            "purged_from_default": self.purged,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+            "last_error": self.last_error
+        }
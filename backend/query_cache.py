@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+def query_key(name: str, **params) -> tuple:
+    """Ключ запроса: имя и параметры без None в постоянном порядке"""
+    return (name,) + tuple(sorted((key, value) for key, value in params.items() if value is not None))
+
+def table_tags(table: str, stream_id: Optional[str] = None) -> Tuple[str, ...]:
+    """Теги запроса к таблице: вся таблица и поток (или "все потоки", если фильтра нет)"""
+    return (table, f"{table}:{stream_id}" if stream_id else f"{table}:*")
+
+def stream_write_tags(table: str, stream_ids: Iterable[str]) -> Tuple[str, ...]:
+    """Теги, которые сбрасывает запись в таблицу по потокам stream_ids"""
+    return (f"{table}:*",) + tuple(f"{table}:{stream_id}" for stream_id in stream_ids)
+
+class QueryCache:
+    """Кэш результатов запросов к базе с коротким TTL и сбросом по тегам.
+
+    Результат хранится не дольше ttl секунд и не больше max_entries записей
+    (LRU). Запись помечается тегами (таблица, поток); запись в базу сбрасывает
+    теги, и все результаты с ними становятся недействительными. Одновременные
+    одинаковые запросы выполняются одним обращением к базе: остальные ждут
+    уже запущенную загрузку, если с ее начала теги не сбрасывались. Чтение - из event loop, сброс - из любого потока.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 2.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # ключ -> (истекает, теги, поколения тегов при загрузке, результат)
+        self.entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        # Поколение тега увеличивается при каждом сбросе
+        self.generations: Dict[str, int] = {}
+        # Загрузки в процессе: ключ -> (поколения тегов при запуске, задача), только из event loop
+        self.inflight: Dict[tuple, Tuple[tuple, asyncio.Task]] = {}
+        self.lock = threading.Lock()
+
+        # Статистика
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def _snapshot(self, tags: Tuple[str, ...]) -> tuple:
+        return tuple(self.generations.get(tag, 0) for tag in tags)
+
+    async def get_or_load(self, key: tuple, tags: Tuple[str, ...],
+                          loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Результат из кэша или загрузка через loader (одна на все одинаковые запросы)"""
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return await loader()
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires, _, generations, value = entry
+                if expires > time.monotonic() and generations == self._snapshot(tags):
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+            generations = self._snapshot(tags)
+
+        inflight = self.inflight.get(key)
+        # Загрузка, начатая до сброса тегов, могла не увидеть новую запись: к ней не присоединяемся
+        if inflight is None or inflight[0] != generations:
+            self.misses += 1
+            # Загрузка не привязана к запросу: отключение клиента не отменяет ее для остальных
+            task = asyncio.ensure_future(loader())
+            self.inflight[key] = (generations, task)
+            task.add_done_callback(lambda done: self._store(key, tags, generations, done))
+        else:
+            task = inflight[1]
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _store(self, key: tuple, tags: Tuple[str, ...], generations: tuple, task: asyncio.Task):
+        if self.inflight.get(key, (None, None))[1] is task:
+            del self.inflight[key]
+        if task.cancelled() or task.exception() is not None:
+            return
+        with self.lock:
+            # Результат, прочитанный до записи в базу, не сохраняем
+            if generations != self._snapshot(tags):
+                return
+            self.entries[key] = (time.monotonic() + self.ttl, tags, generations, task.result())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *tags: str):
+        """Сброс всех результатов с любым из тегов"""
+        if not tags:
+            return
+        with self.lock:
+            for tag in tags:
+                self.generations[tag] = self.generations.get(tag, 0) + 1
+            self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get_stats(self) -> Dict:
+        requests = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((self.hits + self.coalesced) / requests, 3) if requests else 0.0,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+            "inflight": len(self.inflight)
+        }
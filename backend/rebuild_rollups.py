@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Скрипт для пересчета агрегатов статистики (stats_rollups) из сохраненных данных.
+
+Нужен после миграции, которая добавила агрегаты, или если агрегаты разошлись
+с данными. Лучше запускать при остановленном backend: приращения, записанные
+во время пересчета, могут быть потеряны.
+"""
+
+import argparse
+import sys
+from dotenv import load_dotenv
+
+# Загружаем переменные окружения
+load_dotenv()
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description="Пересчет агрегатов статистики")
+    parser.add_argument("--days", type=int, default=None,
+                        help="пересчитать только последние N суток (по умолчанию - все данные)")
+    args = parser.parse_args()
+
+    print("🔄 Пересчет агрегатов статистики")
+    print("=" * 50)
+
+    try:
+        from alert_service import AlertService
+        result = AlertService().rebuild_rollups(days=args.days)
+    except Exception as e:
+        print(f"❌ Ошибка пересчета агрегатов: {e}")
+        sys.exit(1)
+
+    if result['since']:
+        print(f"📅 Пересчитаны агрегаты начиная с {result['since']:%Y-%m-%d}")
+    print(f"📊 Инцидентов: {result['incidents']}, детекций: {result['detections']}")
+    if result['spread_incidents']:
+        print(f"⚠️  Инцидентов на границе минут: {result['spread_incidents']} - их окна распределены "
+              f"по минутам пропорционально длительности, поминутная и почасовая разбивка приблизительна")
+    print(f"✅ Записано агрегатов: {result['rollups']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+from sqlalchemy import select, delete, exists, or_, text, tuple_
+from database import session_scope, Detection, Thumbnail, Incident, Alert, StatsRollup, SystemEvent
+
+@dataclass
+class RetentionTarget:
+    """Таблица, из которой удаляются устаревшие строки"""
+    name: str
+    model: type
+    keys: tuple  # колонки ключа для выборки порции
+    expired: Callable[[datetime], object]  # условие устаревания строки
+    ranged: bool = True  # целочисленный id: удаление диапазоном id
+
+# Порядок важен: алерты до инцидентов, миниатюры после детекций и инцидентов
+RETENTION_TARGETS = [
+    RetentionTarget("alerts", Alert, (Alert.id,), lambda cutoff: Alert.created_at < cutoff),
+    RetentionTarget("detections", Detection, (Detection.id,), lambda cutoff: Detection.timestamp < cutoff),
+    RetentionTarget("incidents", Incident, (Incident.id,),
+                    lambda cutoff: (Incident.ended_at < cutoff) & (Incident.is_open == False)),
+    RetentionTarget("thumbnails", Thumbnail, (Thumbnail.id,), lambda cutoff: (
+        (Thumbnail.created_at < cutoff) &
+        ~exists().where(Detection.thumbnail_id == Thumbnail.id) &
+        ~exists().where(or_(
+            Incident.first_thumbnail_id == Thumbnail.id,
+            Incident.peak_thumbnail_id == Thumbnail.id,
+            Incident.last_thumbnail_id == Thumbnail.id
+        ))
+    ), ranged=False),
+    # Поминутные агрегаты нужны только для краев недавних периодов
+    RetentionTarget("stats_rollups", StatsRollup,
+                    (StatsRollup.granularity, StatsRollup.bucket_start, StatsRollup.stream_id),
+                    lambda cutoff: (StatsRollup.granularity == "minute") & (StatsRollup.bucket_start < cutoff),
+                    ranged=False),
+    RetentionTarget("system_events", SystemEvent, (SystemEvent.id,), lambda cutoff: SystemEvent.created_at < cutoff),
+]
+
+class RetentionWorker:
+    """Фоновое удаление данных старше retention_days небольшими порциями.
+
+    Каждая порция - отдельная короткая транзакция: строки выбираются по
+    возрастанию ключа и удаляются диапазоном id, между порциями делается пауза,
+    поэтому запись детекций не ждет очистку. Размер порции подстраивается так,
+    чтобы транзакция укладывалась в max_transaction_seconds (в PostgreSQL это
+    же время ограничивает statement_timeout). Секционированные таблицы
+    очищаются удалением целых секций через PartitionManager.
+    """
+
+    def __init__(self, partition_manager=None, retention_days: int = 30, interval: float = 3600.0,
+                 batch_size: int = 1000, max_transaction_seconds: float = 1.0, pause: float = 0.1):
+        self.partition_manager = partition_manager
+        self.retention_days = retention_days
+        self.interval = interval
+        self.max_batch_size = batch_size
+        self.max_transaction_seconds = max_transaction_seconds
+        self.pause = pause
+        self.thread: Optional[threading.Thread] = None
+        self.stop_event = threading.Event()
+        self.wake_event = threading.Event()
+        # Внеочередной проход запрошен, но еще не начат
+        self.trigger_lock = threading.Lock()
+        self.triggered = False
+        self.requested_days: Optional[int] = None
+
+        # Ход текущего или последнего прохода
+        self.running = False
+        self.current_table: Optional[str] = None
+        self.deleted: Dict[str, int] = {}
+        self.dropped_partitions: List[str] = []
+        self.batches = 0
+        self.batch_size = batch_size
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.last_cutoff: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+        self.runs = 0
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="retention-worker", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Остановка; текущая порция дописывается, оставшиеся строки удалит следующий проход"""
+        if not self.thread:
+            return
+        self.stop_event.set()
+        self.wake_event.set()
+        self.thread.join(timeout=timeout)
+        self.thread = None
+
+    def trigger(self, days: int = None) -> bool:
+        """Внеочередной проход; False, если проход уже идет или уже запрошен"""
+        with self.trigger_lock:
+            if self.running or self.triggered:
+                return False
+            self.triggered = True
+            self.requested_days = days
+        self.wake_event.set()
+        return True
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.wake_event.wait(self.interval)
+            self.wake_event.clear()
+            if self.stop_event.is_set():
+                break
+            with self.trigger_lock:
+                # Запрос принят в работу: до конца прохода trigger видит running
+                days = self.requested_days if self.requested_days is not None else self.retention_days
+                self.requested_days = None
+                self.triggered = False
+                self.running = True
+            try:
+                self.run_once(days)
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Retention error: {e}")
+            finally:
+                self.running = False
+
+    def run_once(self, days: int) -> Dict:
+        """Один проход очистки по всем таблицам"""
+        cutoff = datetime.now() - timedelta(days=days)
+        self.running = True
+        self.last_cutoff = cutoff
+        self.deleted = {}
+        self.dropped_partitions = []
+        self.batches = 0
+        self.last_error = None
+        self.started_at = time.time()
+        self.finished_at = None
+        try:
+            skip_tables = ()
+            if self.partition_manager:
+                # Ошибка обслуживания секций не должна останавливать очистку остальных таблиц
+                try:
+                    result = self.partition_manager.maintain(days)
+                    self.dropped_partitions = result["dropped_partitions"]
+                except Exception as e:
+                    self.last_error = f"partitions: {e}"
+                    print(f"Partition maintenance error: {e}")
+                skip_tables = self.partition_manager.partitioned_tables
+
+            for target in RETENTION_TARGETS:
+                if target.name in skip_tables:
+                    continue
+                self.current_table = target.name
+                self.deleted[target.name] = 0
+                self._purge(target, cutoff)
+                if self.stop_event.is_set():
+                    break
+        finally:
+            self.current_table = None
+            self.running = False
+            self.finished_at = time.time()
+            self.runs += 1
+        print(f"Retention ({days} days): deleted {self.deleted}, "
+              f"dropped partitions {self.dropped_partitions}, {self.rows_per_second():.0f} rows/s")
+        return self.get_stats()
+
+    def _purge(self, target: RetentionTarget, cutoff: datetime):
+        while not self.stop_event.is_set():
+            started = time.monotonic()
+            try:
+                deleted = self._delete_batch(target, cutoff)
+            except Exception as e:
+                # Порция не уложилась в ограничение времени: уменьшаем и пробуем снова
+                if self.batch_size > 1 and "timeout" in str(e).lower():
+                    self.batch_size = max(1, self.batch_size // 2)
+                    continue
+                raise
+            elapsed = time.monotonic() - started
+            self.batches += 1
+            self.deleted[target.name] += deleted
+
+            # Подстройка размера порции под ограничение длительности транзакции
+            if elapsed > self.max_transaction_seconds / 2:
+                self.batch_size = max(1, self.batch_size // 2)
+            elif elapsed < self.max_transaction_seconds / 4:
+                self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+
+            if deleted == 0:
+                break
+            self.stop_event.wait(self.pause)
+
+    def _delete_batch(self, target: RetentionTarget, cutoff: datetime) -> int:
+        """Удаление одной порции в отдельной транзакции"""
+        condition = target.expired(cutoff)
+        with session_scope() as db:
+            if db.get_bind().dialect.name == "postgresql":
+                timeout_ms = int(self.max_transaction_seconds * 1000)
+                db.execute(text(f"SET LOCAL statement_timeout = {timeout_ms}"))
+
+            keys = db.execute(
+                select(*target.keys).where(condition).order_by(*target.keys).limit(self.batch_size)
+            ).all()
+            if not keys:
+                return 0
+
+            if target.ranged:
+                key = target.keys[0]
+                statement = delete(target.model).where(key >= keys[0][0], key <= keys[-1][0], condition)
+            elif len(target.keys) == 1:
+                statement = delete(target.model).where(target.keys[0].in_([row[0] for row in keys]), condition)
+            else:
+                statement = delete(target.model).where(tuple_(*target.keys).in_([tuple(row) for row in keys]))
+            return db.execute(statement, execution_options={"synchronize_session": False}).rowcount
+
+    def rows_per_second(self) -> float:
+        if not self.started_at:
+            return 0.0
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return sum(self.deleted.values()) / elapsed if elapsed > 0 else 0.0
+
+    def get_stats(self) -> Dict:
+        return {
+            "running": self.running,
+            "current_table": self.current_table,
+            "retention_days": self.retention_days,
+            "cutoff": self.last_cutoff.isoformat() if self.last_cutoff else None,
+            "deleted": dict(self.deleted),
+            "dropped_partitions": list(self.dropped_partitions),
+            "batches": self.batches,
+            "batch_size": self.batch_size,
+            "rows_per_second": round(self.rows_per_second(), 1),
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "runs": self.runs,
+            "last_error": self.last_error
+        }
@@ -0,0 +1,251 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+import aiohttp
+
+@dataclass
+class TelegramMessage:
+    """Сообщение в очереди отправки"""
+    chat_id: str
+    text: str
+    photo: Optional[bytes] = None
+    created_at: float = field(default_factory=time.monotonic)
+    # Результат для отправителя, который ждет доставки (send)
+    result: Optional[asyncio.Future] = None
+
+class TokenBucket:
+    """Ограничитель частоты: rate отправок в секунду, не больше burst подряд"""
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Списание токена; возвращает, сколько секунд подождать до отправки"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+class TelegramDispatcher:
+    """Отправка уведомлений в Telegram из одной очереди.
+
+    Все сообщения идут через ограниченную очередь (при переполнении вытесняется
+    самое старое) и одну задачу-отправителя с постоянной сессией aiohttp, поэтому
+    соединения с API переиспользуются. Частота ограничена token bucket'ами под
+    лимиты Telegram: общий (около 30 сообщений в секунду), на чат (1 в секунду)
+    и на группу (20 в минуту). Ответ 429 повторяется через retry_after из ответа,
+    5xx и сетевые ошибки - с экспоненциальной паузой, не больше max_retries раз.
+    api_url можно направить на локальный Bot API сервер или заглушку для тестов.
+    """
+
+    def __init__(self, api_url: str = "https://api.telegram.org", bot_token: str = "",
+                 max_queue: int = 100, global_rate: float = 30.0, chat_rate: float = 1.0,
+                 group_rate: float = 20 / 60, max_retries: int = 3, backoff: float = 1.0,
+                 timeout: float = 15.0, connection_limit: int = 4):
+        self.api_url = api_url.rstrip("/")
+        self.bot_token = bot_token
+        # Предел очереди проверяется в _enqueue, поэтому его можно менять на ходу
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.connection_limit = connection_limit
+        self.queue: Optional[asyncio.Queue] = None
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.worker: Optional[asyncio.Task] = None
+        self.chat_buckets: Dict[str, TokenBucket] = {}
+        self.configure_rates(global_rate, chat_rate, group_rate)
+
+        # Статистика
+        self.submitted = 0
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.last_latency_ms = 0.0
+        self.last_error: Optional[str] = None
+
+    async def start(self):
+        """Запуск отправителя (вызывается из event loop)"""
+        if self.worker and not self.worker.done():
+            return
+        self.queue = asyncio.Queue()
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.connection_limit, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+        self.worker = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 5.0):
+        """Остановка: ждем отправки очереди не дольше timeout, затем закрываем сессию"""
+        if self.worker:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout)
+            except asyncio.TimeoutError:
+                print(f"Telegram dispatcher: {self.queue.qsize()} messages not sent on shutdown")
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    def configure(self, bot_token: str, api_url: str = None):
+        self.bot_token = bot_token
+        if api_url:
+            self.api_url = api_url.rstrip("/")
+
+    def configure_rates(self, global_rate: float, chat_rate: float, group_rate: float):
+        """Новые лимиты частоты: общий bucket пересоздается, bucket'ы чатов
+        создадутся заново с новыми лимитами при следующей отправке"""
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.global_bucket = TokenBucket(global_rate, burst=max(1.0, global_rate))
+        self.chat_buckets.clear()
+
+    def submit(self, chat_id: str, text: str, photo: bytes = None) -> bool:
+        """Постановка сообщения в очередь без ожидания отправки (только из event loop)"""
+        return self._enqueue(TelegramMessage(chat_id, text, photo))
+
+    async def send(self, chat_id: str, text: str, photo: bytes = None) -> bool:
+        """Отправка через ту же очередь с ожиданием результата"""
+        message = TelegramMessage(chat_id, text, photo, result=asyncio.get_running_loop().create_future())
+        if not self._enqueue(message):
+            return False
+        return await message.result
+
+    def _enqueue(self, message: TelegramMessage) -> bool:
+        if self.queue is None:
+            return False
+        # При переполнении вытесняем самые старые сообщения
+        while self.queue.qsize() >= max(1, self.max_queue):
+            dropped = self.queue.get_nowait()
+            self.queue.task_done()
+            self._finish(dropped, False)
+            self.dropped += 1
+        self.queue.put_nowait(message)
+        self.submitted += 1
+        return True
+
+    @staticmethod
+    def _finish(message: TelegramMessage, ok: bool):
+        if message.result is not None and not message.result.done():
+            message.result.set_result(ok)
+
+    async def call(self, method: str, **params) -> Optional[Dict]:
+        """Вызов метода Bot API вне очереди (getMe и т.п.), ответ или None при ошибке"""
+        if self.session is None or not self.bot_token:
+            return None
+        try:
+            async with self.session.post(f"{self.api_url}/bot{self.bot_token}/{method}", json=params) as response:
+                return await response.json(content_type=None)
+        except Exception as e:
+            self.last_error = str(e)
+            return None
+
+    async def _run(self):
+        while True:
+            message = await self.queue.get()
+            try:
+                ok = await self._deliver(message)
+            except Exception as e:
+                self.last_error = str(e)
+                ok = False
+            finally:
+                self.queue.task_done()
+            self._finish(message, ok)
+
+    def _chat_bucket(self, chat_id: str) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            # Отрицательный chat_id - группа или канал, у них лимит строже
+            rate = self.group_rate if str(chat_id).startswith("-") else self.chat_rate
+            bucket = self.chat_buckets[chat_id] = TokenBucket(rate)
+        return bucket
+
+    async def _deliver(self, message: TelegramMessage) -> bool:
+        for attempt in range(self.max_retries + 1):
+            wait = max(self.global_bucket.reserve(), self._chat_bucket(message.chat_id).reserve())
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            status, retry_after, error = await self._post(message)
+            if status == 200:
+                self.sent += 1
+                self.last_latency_ms = (time.monotonic() - message.created_at) * 1000
+                return True
+
+            self.last_error = error
+            if status == 429:
+                self.rate_limited += 1
+                delay = retry_after if retry_after is not None else self.backoff * 2 ** attempt
+            elif status is None or status >= 500:
+                delay = self.backoff * 2 ** attempt
+            else:
+                # Ошибка запроса (неверный токен, чат и т.п.) повтором не исправится
+                print(f"Telegram send error: {status} — {error}")
+                break
+            if attempt < self.max_retries:
+                self.retries += 1
+                await asyncio.sleep(delay)
+
+        self.failed += 1
+        return False
+
+    async def _post(self, message: TelegramMessage) -> Tuple[Optional[int], Optional[float], Optional[str]]:
+        """Один запрос к API: (HTTP статус или None при сетевой ошибке, retry_after, текст ошибки)"""
+        if self.session is None or not self.bot_token:
+            return 401, None, "Bot token is not configured"
+        try:
+            if message.photo:
+                # Форма собирается заново на каждую попытку: тело отправленной формы не переиспользуется
+                form = aiohttp.FormData()
+                form.add_field('chat_id', message.chat_id)
+                form.add_field('caption', message.text)
+                form.add_field('parse_mode', 'HTML')
+                form.add_field('photo', message.photo, filename='frame.jpg', content_type='image/jpeg')
+                request = self.session.post(f"{self.api_url}/bot{self.bot_token}/sendPhoto", data=form)
+            else:
+                request = self.session.post(f"{self.api_url}/bot{self.bot_token}/sendMessage", json={
+                    'chat_id': message.chat_id,
+                    'text': message.text,
+                    'parse_mode': 'HTML'
+                })
+            async with request as response:
+                if response.status == 200:
+                    return 200, None, None
+                text = await response.text()
+                retry_after = None
+                if response.status == 429:
+                    try:
+                        retry_after = float((await response.json(content_type=None))
+                                            .get('parameters', {}).get('retry_after'))
+                    except Exception:
+                        retry_after = None
+                return response.status, retry_after, text
+        except Exception as e:
+            return None, None, str(e) or type(e).__name__
+
+    def get_stats(self) -> Dict:
+        return {
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "queue_size": self.max_queue,
+            "submitted": self.submitted,
+            "sent": self.sent,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "last_latency_ms": round(self.last_latency_ms, 2),
+            "last_error": self.last_error
+        }
@@ -0,0 +1,76 @@
+"""Общие настройки тестов.
+
+По умолчанию тесты работают с временной базой SQLite в режиме WAL. Для
+проверки на PostgreSQL задайте TEST_DATABASE_URL (схема базы будет очищена);
+тесты с меткой postgresql без нее пропускаются.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Настройки базы читаются при импорте database
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+else:
+    os.environ["DB_BACKEND"] = "sqlite"
+    os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="violence_tests_"), "test.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.environ['SQLITE_PATH']}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+
+import database
+from sqlalchemy import text
+
+def pytest_collection_modifyitems(config, items):
+    if database.IS_SQLITE:
+        skip = pytest.mark.skip(reason="нужна PostgreSQL: задайте TEST_DATABASE_URL")
+        for item in items:
+            if "postgresql" in item.keywords:
+                item.add_marker(skip)
+
+def reset_schema():
+    """Пустая база без таблиц"""
+    if database.IS_SQLITE:
+        database.engine.dispose()
+        for suffix in ("", "-wal", "-shm"):
+            path = database.SQLITE_PATH + suffix
+            if os.path.exists(path):
+                os.remove(path)
+        return
+    with database.engine.begin() as conn:
+        conn.execute(text("DROP SCHEMA public CASCADE"))
+        conn.execute(text("CREATE SCHEMA public"))
+
+def migrate(revision: str = "head"):
+    """Миграции alembic до revision"""
+    from alembic import command
+    from alembic.config import Config
+    config = Config(os.path.join(BACKEND_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(BACKEND_DIR, "alembic"))
+    command.upgrade(config, revision)
+
+@pytest.fixture
+def db():
+    """Чистая база со схемой из моделей (create_tables)"""
+    reset_schema()
+    database.create_tables()
+    yield database
+    database.engine.dispose()
+
+@pytest.fixture
+def run():
+    """Выполнение корутины в новом event loop; асинхронный движок привязан к loop
+    и закрывается после каждого вызова"""
+    def runner(coroutine):
+        async def wrapped():
+            try:
+                return await coroutine
+            finally:
+                await database.dispose_async_engine()
+        return asyncio.run(wrapped())
+    return runner
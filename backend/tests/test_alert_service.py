@@ -0,0 +1,123 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import inspect, text
+import database
+from alert_service import AlertService
+from conftest import migrate, reset_schema
+from database import get_async_engine
+
+def batch(stream_id: str, moment: datetime):
+    """Пакет writer'а: сырое окно, новый инцидент и приращение агрегатов"""
+    return dict(
+        records=[{"stream_id": stream_id, "timestamp": moment, "is_violence": True, "confidence": 0.9}],
+        incidents=[{
+            "id": None, "stream_id": stream_id, "started_at": moment, "ended_at": moment,
+            "peak_confidence": 0.9, "mean_confidence": 0.9, "window_count": 1,
+            "thumbnail_ids": {}, "is_open": False
+        }],
+        rollups=[{
+            "stream_id": stream_id, "granularity": granularity,
+            "bucket_start": database.rollup_bucket(moment, granularity),
+            "windows": 2, "violent_windows": 1, "incidents": 1, "confidence_sum": 0.9, "max_confidence": 0.9
+        } for granularity in database.ROLLUP_GRANULARITIES]
+    )
+
+@pytest.mark.skipif(not database.IS_SQLITE, reason="настройки соединения SQLite")
+def test_sqlite_connections_use_wal(db, run):
+    with database.engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert conn.exec_driver_sql("PRAGMA foreign_keys").scalar() == 1
+        assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() == database.SQLITE_BUSY_TIMEOUT_MS
+
+    async def read_pragmas():
+        async with get_async_engine().connect() as conn:
+            return ((await conn.exec_driver_sql("PRAGMA journal_mode")).scalar(),
+                    (await conn.exec_driver_sql("PRAGMA foreign_keys")).scalar())
+
+    assert run(read_pragmas()) == ("wal", 1)
+
+def test_write_read_and_acknowledge(db, run):
+    service = AlertService()
+    service.register_stream("cam", "Cam", "rtsp://cam")
+    now = datetime.now().replace(microsecond=0)
+    incident_ids = service.save_detections_batch(**batch("cam", now))
+    alert_id = service.create_system_alert("warning", "disk almost full", stream_id="cam")
+
+    async def read():
+        return (await service.get_detections(stream_id="cam"), await service.get_alerts(),
+                await service.get_incidents(), await service.get_statistics(days=1))
+
+    detections, alerts, incidents, statistics = run(read())
+    assert [detection["is_violence"] for detection in detections] == [True]
+    assert {alert["type"] for alert in alerts} == {"violence", "warning"}
+    assert [incident["id"] for incident in incidents] == incident_ids
+    assert statistics["total_detections"] == 2
+    assert statistics["violence_detections"] == 1
+    assert statistics["total_incidents"] == 1
+
+    assert service.acknowledge_alert(alert_id, "operator")
+    assert service.acknowledge_incident(incident_ids[0])
+    assert not service.acknowledge_alert(10 ** 6)
+    alerts = run(service.get_alerts(acknowledged=False))
+    assert alerts == []
+
+    assert service.deactivate_stream("cam")
+
+def test_concurrent_writers_and_readers(db, run):
+    """Запись из нескольких потоков во время чтения: без ошибок блокировки базы"""
+    service = AlertService()
+    streams = [f"cam_{index}" for index in range(4)]
+    for stream_id in streams:
+        service.register_stream(stream_id, stream_id, f"rtsp://{stream_id}")
+    errors = []
+    start = datetime.now() - timedelta(hours=1)
+
+    def write(stream_id: str):
+        try:
+            for index in range(25):
+                service.save_detections_batch(**batch(stream_id, start + timedelta(seconds=index)))
+        except Exception as e:
+            errors.append(e)
+
+    async def read_while_writing():
+        threads = [threading.Thread(target=write, args=(stream_id,)) for stream_id in streams]
+        for thread in threads:
+            thread.start()
+        reads = 0
+        while any(thread.is_alive() for thread in threads):
+            await service.get_alerts(limit=20)
+            await service.get_statistics(days=1)
+            reads += 1
+            await asyncio.sleep(0)
+        for thread in threads:
+            thread.join()
+        return reads, await service.get_statistics(days=1)
+
+    reads, statistics = run(read_while_writing())
+    assert errors == []
+    assert reads > 0
+    assert statistics["total_incidents"] == 100
+
+@pytest.mark.skipif(not database.IS_SQLITE, reason="индекс alerts(detection_id) только в SQLite")
+def test_sqlite_migrations_create_detection_index():
+    reset_schema()
+    migrate("head")
+    try:
+        indexes = {index["name"] for index in inspect(database.engine).get_indexes("alerts")}
+        assert "idx_alerts_detection_id" in indexes
+    finally:
+        database.engine.dispose()
+
+@pytest.mark.postgresql
+def test_postgresql_has_no_detection_index_after_migrations():
+    reset_schema()
+    migrate("head")
+    try:
+        with database.engine.connect() as conn:
+            assert conn.execute(text(
+                "SELECT count(*) FROM pg_indexes WHERE indexname = 'idx_alerts_detection_id'"
+            )).scalar() == 0
+    finally:
+        database.engine.dispose()
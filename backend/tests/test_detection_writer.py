@@ -0,0 +1,59 @@
+import time
+import numpy as np
+from sqlalchemy import select
+from alert_service import AlertService
+from database import session_scope, Incident, Thumbnail
+from detection_writer import DetectionWriter, PendingDetection
+from thumbnail_cache import ThumbnailCache
+
+def test_incident_keeps_only_current_thumbnails(db):
+    service = AlertService()
+    cache = ThumbnailCache(max_bytes=64 * 1024 * 1024, size=32)
+    writer = DetectionWriter(service, cache, flush_interval=0.02, incident_gap=5.0)
+    writer.start()
+    rng = np.random.default_rng(0)
+    for index in range(20):
+        frame = rng.integers(0, 255, (64, 64, 3), dtype=np.uint8)
+        # Пик растет с каждым окном: миниатюра пика сменяется при каждой записи
+        writer.submit(PendingDetection("cam", time.time(), True, 0.5 + index / 100, cache.put(frame)))
+        time.sleep(0.03)
+    writer.stop()
+    assert writer.batches > 1
+
+    with session_scope() as session:
+        incident = session.execute(select(Incident.first_thumbnail_id, Incident.peak_thumbnail_id,
+                                          Incident.last_thumbnail_id, Incident.is_open)).one()
+        thumbnails = set(session.scalars(select(Thumbnail.id)))
+    assert not incident.is_open
+    # Последний кадр сохранен при закрытии, замененные кадры пика удалены
+    assert incident.last_thumbnail_id is not None
+    assert incident.peak_thumbnail_id == incident.last_thumbnail_id
+    assert thumbnails == {incident.first_thumbnail_id, incident.peak_thumbnail_id}
+
+class FailingService:
+    """База недоступна: каждая запись пакета падает"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def save_detections_batch(self, *args):
+        self.calls += 1
+        raise ConnectionError("database is unavailable")
+
+def test_failed_flushes_keep_pending_bounded():
+    cache = ThumbnailCache(size=16)
+    writer = DetectionWriter(FailingService(), cache, flush_interval=0.0, max_queue=4, incident_gap=0.5)
+    start = time.time() - 3600
+    # Каждое окно отстоит от предыдущего больше, чем на incident_gap: новый инцидент на каждое окно
+    writer._process([PendingDetection("cam", start + index * 60, True, 0.9,
+                                      cache.put(np.full((16, 16, 3), index * 20, dtype=np.uint8)))
+                     for index in range(10)])
+    writer._close_stale(time.time())
+    assert not writer._flush()
+
+    stats = writer.get_stats()
+    assert stats["pending_incidents"] == 4 and stats["dropped_incidents"] == 6
+    assert stats["pending_rollups"] == 4 and stats["dropped_rollups"] > 0
+    # Остались только миниатюры несброшенных инцидентов
+    kept = {digest for incident in writer.closed_incidents for _, digest in incident.thumbnails.values()}
+    assert len(kept) == 4 and set(writer.pending_thumbnails) == kept
@@ -0,0 +1,81 @@
+import base64
+import csv
+import hashlib
+import io
+from datetime import datetime, timedelta
+import httpx
+import orjson
+import pytest
+from sqlalchemy import insert
+from alert_service import AlertService
+from database import session_scope, Detection, Thumbnail
+from query_cache import QueryCache
+
+ROWS = 23
+BATCH_SIZE = 5  # несколько порций, последняя неполная
+
+@pytest.fixture
+def exported(db, run, monkeypatch):
+    """Детекции с миниатюрами (в том числе не-ASCII имя потока) и выгрузка через API"""
+    import main
+    service = AlertService()
+    stream_pk = service.register_stream("камера_1", "Камера 1", "rtsp://cam")
+    start = datetime(2026, 10, 18, 12, 0, 0)
+    thumbnails = {}
+    for index in range(0, ROWS, 3):
+        data = bytes([index]) * 10 + b"\xff\xd8"
+        thumbnails[index] = hashlib.sha256(data).hexdigest(), data
+    with session_scope() as session:
+        session.execute(insert(Thumbnail), [{"id": key, "data": data, "size": len(data)}
+                                            for key, data in thumbnails.values()])
+        session.execute(insert(Detection), [
+            {"stream_id": stream_pk, "timestamp": start + timedelta(seconds=index), "is_violence": index % 2 == 0,
+             "confidence": index / 100, "thumbnail_id": thumbnails[index][0] if index in thumbnails else None}
+            for index in range(ROWS)
+        ])
+    expected = [
+        (index + 1, "камера_1", start + timedelta(seconds=index), index % 2 == 0, index / 100,
+         thumbnails[index][0] if index in thumbnails else None,
+         thumbnails[index][1] if index in thumbnails else None)
+        for index in range(ROWS)
+    ]
+    monkeypatch.setattr(main, "alert_service", service)
+    monkeypatch.setattr(main, "query_cache", QueryCache())
+    monkeypatch.setattr(main.system_settings, "export_batch_size", BATCH_SIZE)
+
+    def export(fmt: str) -> bytes:
+        async def request():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app),
+                                         base_url="http://test") as client:
+                response = await client.get("/api/export/detections",
+                                            params={"format": fmt, "include_thumbnails": "true"})
+                assert response.status_code == 200
+                return response.content
+        return run(request())
+
+    return export, expected
+
+def test_csv_export_round_trip(exported):
+    export, expected = exported
+    header, *rows = list(csv.reader(io.StringIO(export("csv").decode("utf-8"))))
+    assert header == ["id", "stream_id", "timestamp", "is_violence", "confidence", "thumbnail_id", "thumbnail"]
+    assert rows == [
+        [str(row_id), stream_id, timestamp.isoformat(), str(is_violence), str(confidence),
+         thumbnail_id or "", base64.b64encode(data).decode("ascii") if data else ""]
+        for row_id, stream_id, timestamp, is_violence, confidence, thumbnail_id, data in expected
+    ]
+
+def test_ndjson_export_round_trip(exported):
+    export, expected = exported
+    rows = [orjson.loads(line) for line in export("ndjson").splitlines()]
+    assert [(row["id"], row["stream_id"], datetime.fromisoformat(row["timestamp"]), row["is_violence"],
+             row["confidence"], row["thumbnail_id"],
+             base64.b64decode(row["thumbnail"]) if row["thumbnail"] else None) for row in rows] == expected
+
+def test_parquet_export_round_trip(exported):
+    pq = pytest.importorskip("pyarrow.parquet")
+    export, expected = exported
+    table = pq.read_table(io.BytesIO(export("parquet")))
+    # Каждая порция выгрузки - отдельная группа строк
+    assert pq.ParquetFile(io.BytesIO(export("parquet"))).num_row_groups == -(-ROWS // BATCH_SIZE)
+    assert [tuple(row.values()) for row in table.to_pylist()] == expected
@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta
+import httpx
+import pytest
+from sqlalchemy import event, insert
+import database
+from alert_service import AlertService
+from database import session_scope, get_async_engine, Alert, Detection, Incident
+from query_cache import QueryCache
+
+MOMENT = datetime(2026, 10, 18, 12, 0, 0)
+
+@pytest.fixture
+def service(db):
+    """Данные с повторяющимся временем: порядок внутри одного момента задает id"""
+    service = AlertService()
+    stream_pk = service.register_stream("cam", "Cam", "rtsp://cam")
+    with session_scope() as session:
+        session.execute(insert(Detection), [
+            {"stream_id": stream_pk, "timestamp": MOMENT - timedelta(seconds=index // 4),
+             "is_violence": index % 2 == 0, "confidence": 0.5}
+            for index in range(25)
+        ])
+        session.execute(insert(Alert), [
+            {"stream_id": stream_pk, "type": "violence", "message": "alert",
+             "created_at": MOMENT - timedelta(seconds=index // 4)}
+            for index in range(25)
+        ])
+        session.execute(insert(Incident), [
+            {"stream_id": stream_pk, "started_at": MOMENT - timedelta(seconds=index // 4),
+             "ended_at": MOMENT, "peak_confidence": 0.9, "mean_confidence": 0.8}
+            for index in range(25)
+        ])
+    return service
+
+async def all_pages(load, time_field: str, limit: int = 4) -> list:
+    """Обход всех страниц по курсору последней строки"""
+    rows, cursor = [], None
+    while True:
+        page = await load(limit=limit, cursor=cursor)
+        rows.extend(page)
+        if len(page) < limit:
+            return rows
+        cursor = AlertService.encode_cursor(page[-1][time_field], page[-1]["id"])
+
+@pytest.mark.parametrize("method, time_field", [
+    ("get_detections", "timestamp"),
+    ("get_alerts", "created_at"),
+    ("get_incidents", "started_at"),
+])
+def test_cursor_pages_cover_ties_in_order(service, run, method, time_field):
+    rows = run(all_pages(getattr(service, method), time_field))
+    keys = [(row[time_field], row["id"]) for row in rows]
+    assert len(keys) == 25
+    assert len(set(keys)) == 25
+    assert keys == sorted(keys, reverse=True)
+
+def test_cursor_round_trip():
+    cursor = AlertService.encode_cursor(MOMENT.isoformat(), 42)
+    assert AlertService.decode_cursor(cursor) == (MOMENT, 42)
+    with pytest.raises(ValueError):
+        AlertService.decode_cursor("not-a-cursor")
+
+@pytest.mark.parametrize("path", ["/api/alerts", "/api/detections/history", "/api/incidents"])
+def test_malformed_cursor_is_bad_request(service, run, monkeypatch, path):
+    import main
+    monkeypatch.setattr(main, "alert_service", service)
+    monkeypatch.setattr(main, "query_cache", QueryCache())
+
+    async def request(params):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            return await client.get(path, params=params)
+
+    assert run(request({"cursor": "broken", "limit": 5})).status_code == 400
+    first = run(request({"limit": 5})).json()
+    assert first["next_cursor"]
+    second = run(request({"limit": 5, "cursor": first["next_cursor"]})).json()
+    key = next(name for name in first if name != "next_cursor")
+    assert {row["id"] for row in first[key]}.isdisjoint(row["id"] for row in second[key])
+
+async def query_plan(load, **params) -> str:
+    """План запроса, который выполняет load: текст EXPLAIN (QUERY PLAN) того же SQL"""
+    statements = []
+    engine = get_async_engine()
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        await load(**params)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", capture)
+    statement, parameters = statements[-1]
+    async with engine.connect() as conn:
+        if database.IS_SQLITE:
+            plan = await conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)
+            return "\n".join(row[-1] for row in plan)
+        # На маленькой таблице PostgreSQL иначе выбирает последовательный просмотр
+        await conn.exec_driver_sql("SET enable_seqscan = off")
+        plan = await conn.exec_driver_sql("EXPLAIN " + statement, parameters)
+        return "\n".join(row[0] for row in plan)
+
+KEYSET_INDEXES = [
+    ("get_detections", {}, "idx_detections_timestamp_id"),
+    ("get_detections", {"is_violence": True}, "idx_detections_violence_timestamp"),
+    ("get_alerts", {}, "idx_alerts_created_at_id"),
+    ("get_alerts", {"acknowledged": False}, "idx_alerts_unacknowledged"),
+]
+
+@pytest.mark.skipif(not database.IS_SQLITE, reason="EXPLAIN QUERY PLAN - только SQLite")
+@pytest.mark.parametrize("method, filters, index", KEYSET_INDEXES)
+def test_cursor_page_uses_composite_index(service, run, method, filters, index):
+    cursor = AlertService.encode_cursor(MOMENT.isoformat(), 10)
+    plan = run(query_plan(getattr(service, method), limit=10, cursor=cursor, **filters))
+    assert index in plan
+
+@pytest.mark.postgresql
+@pytest.mark.parametrize("method, filters, index", KEYSET_INDEXES)
+def test_cursor_page_uses_composite_index_postgresql(service, run, method, filters, index):
+    cursor = AlertService.encode_cursor(MOMENT.isoformat(), 10)
+    plan = run(query_plan(getattr(service, method), limit=10, cursor=cursor, **filters))
+    assert index in plan
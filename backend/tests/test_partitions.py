@@ -0,0 +1,84 @@
+from datetime import date, datetime, timedelta
+import pytest
+from sqlalchemy import text
+
+import database
+from conftest import migrate, reset_schema
+from partitions import PartitionManager, PARTITIONED_TABLES
+from retention import RetentionWorker
+from database import session_scope, SystemEvent
+
+@pytest.fixture
+def migrated():
+    """База после миграции 0006 с данными, записанными до нее"""
+    reset_schema()
+    migrate("0005")
+    with database.engine.begin() as conn:
+        conn.execute(text("INSERT INTO streams (id, stream_id, name, url) VALUES (1, 'cam', 'Cam', 'rtsp://cam')"))
+        conn.execute(text("INSERT INTO detections (stream_id, timestamp, is_violence, confidence) "
+                          "VALUES (1, now() - interval '40 days', false, 0.1), (1, now(), true, 0.9)"))
+        conn.execute(text("INSERT INTO alerts (stream_id, type, message, created_at) "
+                          "VALUES (1, 'info', 'old', now() - interval '40 days')"))
+    migrate("head")
+    yield database.engine
+    database.engine.dispose()
+
+def count(table: str) -> int:
+    with database.engine.connect() as conn:
+        return conn.execute(text(f"SELECT count(*) FROM {table}")).scalar()
+
+@pytest.mark.postgresql
+def test_ensure_partitions_right_after_migration(migrated):
+    manager = PartitionManager(migrated, premake_days=3)
+    assert manager.refresh() == list(PARTITIONED_TABLES)
+
+    # Сегодняшний день покрыт прежней таблицей, следующие - секциями миграции
+    assert manager.ensure_partitions() == 0
+    assert manager.maintain(30)["created_partitions"] == 0
+    assert manager.last_error is None
+
+    # За пределами покрытия секции создаются по дням
+    assert manager.ensure_partitions(date.today() + timedelta(days=5)) == 4 * len(PARTITIONED_TABLES)
+    with migrated.begin() as conn:
+        conn.execute(text("INSERT INTO detections (stream_id, timestamp, is_violence, confidence) "
+                          "VALUES (1, now() + interval '2 days', false, 0.2)"))
+    assert count("detections") == 3
+    assert count("detections_default") == 0
+
+@pytest.mark.postgresql
+def test_default_partition_rows_are_moved_and_purged(migrated):
+    manager = PartitionManager(migrated, premake_days=0)
+    manager.refresh()
+    far = date.today() + timedelta(days=20)
+    with migrated.begin() as conn:
+        conn.execute(text("INSERT INTO detections (stream_id, timestamp, is_violence, confidence) "
+                          "VALUES (1, :day, false, 0.2), (1, :later, false, 0.3)"),
+                     {"day": datetime.combine(far, datetime.min.time()) + timedelta(hours=1),
+                      "later": datetime.combine(far, datetime.min.time()) + timedelta(days=10)})
+    assert count("detections_default") == 2
+
+    # Секция дня с застрявшими строками создается переносом, а не ошибкой
+    manager.ensure_partitions(far)
+    assert count(PartitionManager.partition_name("detections", far)) == 1
+    assert count("detections_default") == 1
+
+    # Устаревшие строки DEFAULT удаляются вместе с секциями
+    dropped = manager.drop_expired(datetime.combine(far, datetime.min.time()) + timedelta(days=11))
+    assert "detections_legacy" in dropped
+    assert count("detections_default") == 0
+
+def test_retention_continues_when_partition_maintenance_fails(db):
+    class BrokenPartitions:
+        partitioned_tables = []
+
+        def maintain(self, days):
+            raise RuntimeError("lock timeout")
+
+    with session_scope() as session:
+        session.add(SystemEvent(event_type="info", message="old", created_at=datetime.now() - timedelta(days=40)))
+        session.add(SystemEvent(event_type="info", message="new", created_at=datetime.now()))
+
+    worker = RetentionWorker(BrokenPartitions(), pause=0)
+    stats = worker.run_once(30)
+    assert stats["deleted"]["system_events"] == 1
+    assert stats["last_error"] == "partitions: lock timeout"
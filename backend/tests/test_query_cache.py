@@ -0,0 +1,80 @@
+import asyncio
+from query_cache import QueryCache, query_key, stream_write_tags, table_tags
+
+class Loader:
+    """Загрузка из "базы": ждет release и возвращает номер загрузки"""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        call = self.calls
+        await self.release.wait()
+        return call
+
+KEY = query_key("detections", stream_id="cam1", limit=50)
+TAGS = table_tags("detections", "cam1")
+
+def test_concurrent_gets_share_one_load():
+    async def scenario():
+        cache, loader = QueryCache(), Loader()
+        requests = [asyncio.create_task(cache.get_or_load(KEY, TAGS, loader)) for _ in range(5)]
+        await asyncio.sleep(0)
+        loader.release.set()
+        results = await asyncio.gather(*requests)
+        # Следующий запрос берется из кэша без загрузки
+        cached = await cache.get_or_load(KEY, TAGS, loader)
+        return cache, loader, results, cached
+
+    cache, loader, results, cached = asyncio.run(scenario())
+    assert loader.calls == 1 and results == [1] * 5 and cached == 1
+    stats = cache.get_stats()
+    assert (stats["misses"], stats["coalesced"], stats["hits"], stats["inflight"]) == (1, 4, 1, 0)
+
+def test_invalidation_drops_cached_result_by_tag():
+    async def scenario():
+        cache, loader = QueryCache(), Loader()
+        loader.release.set()
+        first = await cache.get_or_load(KEY, TAGS, loader)
+        # Запись по другому потоку не трогает результат cam1
+        cache.invalidate(*stream_write_tags("detections", ["cam2"])[1:])
+        second = await cache.get_or_load(KEY, TAGS, loader)
+        cache.invalidate(*stream_write_tags("detections", ["cam1"]))
+        third = await cache.get_or_load(KEY, TAGS, loader)
+        return first, second, third
+
+    assert asyncio.run(scenario()) == (1, 1, 2)
+
+def test_result_loaded_before_invalidation_is_not_stored():
+    async def scenario():
+        cache, loader = QueryCache(), Loader()
+        stale = asyncio.create_task(cache.get_or_load(KEY, TAGS, loader))
+        await asyncio.sleep(0)
+        # Запись в базу во время загрузки: прочитанный результат мог ее не увидеть
+        cache.invalidate("detections:cam1")
+        fresh = asyncio.create_task(cache.get_or_load(KEY, TAGS, loader))
+        await asyncio.sleep(0)
+        loader.release.set()
+        results = await asyncio.gather(stale, fresh)
+        after = await cache.get_or_load(KEY, TAGS, loader)
+        return cache, loader, results, after
+
+    cache, loader, results, after = asyncio.run(scenario())
+    # Запрос после сброса не присоединяется к загрузке, начатой до него
+    assert results == [1, 2] and loader.calls == 2
+    # В кэше только результат загрузки после сброса
+    assert after == 2 and len(cache.entries) == 1
+
+def test_cancelled_request_does_not_cancel_shared_load():
+    async def scenario():
+        cache, loader = QueryCache(), Loader()
+        first = asyncio.create_task(cache.get_or_load(KEY, TAGS, loader))
+        second = asyncio.create_task(cache.get_or_load(KEY, TAGS, loader))
+        await asyncio.sleep(0)
+        first.cancel()
+        loader.release.set()
+        return await second, first.cancelled()
+
+    assert asyncio.run(scenario()) == (1, True)
@@ -0,0 +1,96 @@
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, select
+from database import session_scope, Alert, SystemEvent
+from retention import RetentionWorker
+
+def add_events(old: int, recent: int):
+    """old событий старше 40 суток и recent свежих"""
+    now = datetime.now()
+    with session_scope() as session:
+        session.execute(insert(SystemEvent), [
+            {"event_type": "info", "message": f"event {index}",
+             "created_at": now - timedelta(days=40 if index < old else 0, seconds=index)}
+            for index in range(old + recent)
+        ])
+
+def count(model) -> int:
+    with session_scope() as session:
+        return session.scalar(select(func.count()).select_from(model))
+
+class FakePartitionManager:
+    """Секционированные таблицы очищаются удалением секций, а не порциями"""
+    partitioned_tables = ("system_events",)
+
+    def __init__(self):
+        self.maintained = []
+
+    def maintain(self, days: int):
+        self.maintained.append(days)
+        return {"dropped_partitions": ["system_events_p20260901"]}
+
+def test_deletes_expired_rows_in_chunks(db):
+    add_events(old=25, recent=5)
+    worker = RetentionWorker(batch_size=4, pause=0)
+    worker.max_transaction_seconds = 60  # без подстройки размера порции
+
+    stats = worker.run_once(30)
+    assert stats["deleted"]["system_events"] == 25
+    # 25 строк порциями по 4, плюс пустая порция в конце каждой таблицы
+    assert stats["batches"] >= 7 + len(stats["deleted"])
+    assert count(SystemEvent) == 5
+
+def test_batch_is_halved_after_statement_timeout(db, monkeypatch):
+    add_events(old=10, recent=0)
+    worker = RetentionWorker(batch_size=8, pause=0)
+    worker.max_transaction_seconds = 60
+    delete_batch = worker._delete_batch
+    timeouts = []
+
+    def flaky(target, cutoff):
+        if target.name == "system_events" and not timeouts:
+            timeouts.append(worker.batch_size)
+            raise RuntimeError("canceling statement due to statement timeout")
+        return delete_batch(target, cutoff)
+
+    monkeypatch.setattr(worker, "_delete_batch", flaky)
+    stats = worker.run_once(30)
+    assert timeouts == [8]
+    assert stats["deleted"]["system_events"] == 10 and count(SystemEvent) == 0
+    assert stats["last_error"] is None
+
+def test_partitioned_tables_are_skipped(db):
+    add_events(old=3, recent=0)
+    with session_scope() as session:
+        session.execute(insert(Alert), [{"type": "info", "message": "old",
+                                         "created_at": datetime.now() - timedelta(days=40)}])
+    manager = FakePartitionManager()
+    worker = RetentionWorker(manager, pause=0)
+
+    stats = worker.run_once(30)
+    assert manager.maintained == [30]
+    assert stats["dropped_partitions"] == ["system_events_p20260901"]
+    assert "system_events" not in stats["deleted"] and count(SystemEvent) == 3
+    assert stats["deleted"]["alerts"] == 1
+
+def test_trigger_accepts_one_request_until_it_starts(db, monkeypatch):
+    worker = RetentionWorker(interval=3600, pause=0)
+    passes = []
+    started, release = threading.Event(), threading.Event()
+
+    def run_once(days):
+        passes.append(days)
+        started.set()
+        release.wait(5)
+
+    monkeypatch.setattr(worker, "run_once", run_once)
+    assert worker.trigger(0)
+    # Второй запрос до начала прохода не перезаписывает первый
+    assert not worker.trigger(7)
+    worker.start()
+    assert started.wait(5)
+    assert not worker.trigger(7)
+    release.set()
+    worker.stop()
+    # Явные 0 суток не подменяются значением по умолчанию
+    assert passes == [0]
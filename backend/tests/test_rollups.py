@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+from sqlalchemy import insert, select
+from alert_service import AlertService
+from database import session_scope, rollup_bucket, StatsRollup
+from detection_writer import DetectionWriter, PendingDetection
+
+def write_windows(service: AlertService) -> datetime:
+    """10 минут окон двух потоков (по два в секунду) с несколькими сериями насилия"""
+    for stream_id in ("cam_a", "cam_b"):
+        service.register_stream(stream_id, stream_id, f"rtsp://{stream_id}")
+    # Все окна внутри одного часа: серии приписываются тем же часу и суткам
+    start = rollup_bucket(datetime.now() - timedelta(hours=3), "hour") + timedelta(minutes=10)
+    writer = DetectionWriter(service, flush_interval=0.05, incident_gap=5.0)
+    writer.start()
+    for index in range(1200):
+        moment = start + timedelta(seconds=index / 2)
+        for stream_id in ("cam_a", "cam_b"):
+            violent = (index // 100) % 3 == 0 and (stream_id == "cam_a" or index < 300)
+            writer.submit(PendingDetection(stream_id, moment.timestamp(), violent, 0.9 if violent else 0.1))
+    writer.stop()
+    assert writer.dropped == 0
+    return start
+
+def test_rebuild_keeps_statistics(db, run):
+    service = AlertService()
+    write_windows(service)
+    before = run(service.get_statistics(days=7))
+    assert before["total_detections"] == 2400
+    assert before["violence_detections"] > 0
+    assert before["total_incidents"] == 5
+
+    result = service.rebuild_rollups()
+    assert result["incidents"] == 5
+    assert result["since"] is None
+    # Окна без насилия в базе не хранятся, но счетчики окон не теряются
+    assert run(service.get_statistics(days=7)) == before
+
+def test_rebuild_skips_periods_without_source_rows(db, run):
+    service = AlertService()
+    start = write_windows(service)
+    # Агрегат за сутки, исходные строки которых уже удалены очисткой
+    old_day = rollup_bucket(datetime.now() - timedelta(days=40), "day")
+    with session_scope() as session:
+        session.execute(insert(StatsRollup), [{
+            "granularity": "day", "bucket_start": old_day, "stream_id": service.stream_ids["cam_a"],
+            "windows": 500, "violent_windows": 40, "incidents": 3,
+            "confidence_sum": 30.0, "max_confidence": 0.95
+        }])
+    before = run(service.get_statistics(days=7))
+
+    result = service.rebuild_rollups()
+    assert result["since"] == start
+    assert run(service.get_statistics(days=7)) == before
+    with session_scope() as session:
+        old = session.execute(select(StatsRollup.windows, StatsRollup.violent_windows)
+                              .where(StatsRollup.bucket_start == old_day)).one()
+    assert tuple(old) == (500, 40)
+
+def minute_rollups(stream_pk: int) -> dict:
+    with session_scope() as session:
+        rows = session.execute(select(StatsRollup.bucket_start, StatsRollup.violent_windows, StatsRollup.incidents)
+                               .where(StatsRollup.granularity == "minute", StatsRollup.stream_id == stream_pk))
+        return {row.bucket_start: (row.violent_windows, row.incidents) for row in rows if row.violent_windows}
+
+def test_rebuild_buckets_incident_windows_like_ingestion(db):
+    service = AlertService()
+    write_windows(service)
+    stream_pk = service.stream_ids["cam_a"]
+    before = minute_rollups(stream_pk)
+
+    result = service.rebuild_rollups()
+    # Серии по 50 секунд: часть из них пересекает границу минуты
+    assert result["spread_incidents"] > 0
+    assert minute_rollups(stream_pk) == before
+
+def test_spread_windows_keeps_window_count():
+    start = datetime(2026, 10, 18, 12, 0, 50)
+    parts = AlertService._spread_windows(start, start + timedelta(seconds=75), 7)
+    assert [moment for moment, _ in parts] == [start, datetime(2026, 10, 18, 12, 1), datetime(2026, 10, 18, 12, 2)]
+    assert sum(count for _, count in parts) == 7 and all(count >= 1 for _, count in parts)
+    assert AlertService._spread_windows(start, start + timedelta(seconds=5), 3) == [(start, 3)]
@@ -0,0 +1,122 @@
+import asyncio
+import time
+from types import SimpleNamespace
+import httpx
+import pytest
+
+class FlakyTriton:
+    """Triton, который становится доступен после нескольких проверок"""
+
+    def __init__(self, ready_after: int):
+        self.healthy = False
+        self.checks = 0
+        self.ready_after = ready_after
+
+    def refresh_health(self) -> bool:
+        self.checks += 1
+        healthy = self.checks >= self.ready_after
+        changed, self.healthy = healthy != self.healthy, healthy
+        return changed
+
+@pytest.fixture
+def main(monkeypatch):
+    import main
+    manager = SimpleNamespace(triton_client=FlakyTriton(ready_after=3), version=main.VersionCounter(),
+                              streams={}, get_active_streams=lambda: [])
+    monkeypatch.setattr(main, "rtsp_manager", manager)
+    monkeypatch.setattr(main.TritonClient, "HEALTH_CHECK_INTERVAL", 0.05)
+    return main
+
+def test_status_long_poll_wakes_on_triton_health_change(main):
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = await client.get("/api/status")
+            monitor = asyncio.create_task(main.monitor_triton_health())
+            started = time.monotonic()
+            try:
+                second = await client.get("/api/status", params={"wait": 10},
+                                          headers={"If-None-Match": first.headers["etag"]})
+            finally:
+                monitor.cancel()
+            return first, second, time.monotonic() - started
+
+    first, second, elapsed = asyncio.run(scenario())
+    assert first.json()["triton_server"] is False
+    assert second.status_code == 200 and second.json()["triton_server"] is True
+    assert second.headers["etag"] != first.headers["etag"]
+    assert elapsed < 5
+
+def stream(main, stream_id: str, fps: float = 10.0, is_running: bool = True, name: str = None):
+    return main.StreamStatus(id=stream_id, url=f"rtsp://{stream_id}", name=name or stream_id, enabled=True,
+                             is_running=is_running, fps=fps, total_frames=0, detection_count=0)
+
+class StatusGap(Exception):
+    """Клиент пропустил дельту и запросил бы get_status_snapshot"""
+
+def apply(state: dict, message: dict) -> dict:
+    """Применение сообщения статуса так же, как во frontend (WebSocketContext.applyStatus)"""
+    if message["snapshot"]:
+        return {"version": message["version"], "streams": {status["id"]: status for status in message["data"]}}
+    if state is None or message["base_version"] > state["version"]:
+        raise StatusGap(message["base_version"])
+    streams = {stream_id: dict(fields) for stream_id, fields in state["streams"].items()}
+    for stream_id in message["removed"]:
+        streams.pop(stream_id, None)
+    for stream_id, fields in message["changes"].items():
+        streams.setdefault(stream_id, {}).update(fields)
+    return {"version": message["version"], "streams": streams}
+
+def test_coalesced_deltas_match_snapshot(main):
+    snapshot = main.StatusSnapshot()
+    snapshot.update([stream(main, "cam1"), stream(main, "cam2")])
+    client = apply(None, snapshot.snapshot_message())
+
+    # Клиент не успел получить три дельты: они объединены в одну
+    deltas = [
+        snapshot.update([stream(main, "cam1", fps=12.0), stream(main, "cam2")]),
+        snapshot.update([stream(main, "cam1", fps=12.0)]),
+        snapshot.update([stream(main, "cam1", fps=9.0), stream(main, "cam2", name="Камера 2")]),
+    ]
+    merged = deltas[0]
+    for delta in deltas[1:]:
+        merged = main.merge_status_deltas(merged, delta)
+
+    assert merged["base_version"] == 1 and merged["version"] == 4 and merged["removed"] == []
+    # Удаленный и снова добавленный поток приходит целиком
+    assert merged["changes"]["cam2"]["name"] == "Камера 2" and "url" in merged["changes"]["cam2"]
+    assert apply(client, merged) == apply(None, snapshot.snapshot_message())
+
+def test_filtered_deltas_skip_other_streams_without_gap(main):
+    snapshot = main.StatusSnapshot()
+    snapshot.update([stream(main, "cam1"), stream(main, "cam2")])
+    client = apply(None, snapshot.snapshot_message({"cam1"}))
+
+    for fps in (11.0, 12.0, 13.0):
+        delta = snapshot.update([stream(main, "cam1"), stream(main, "cam2", fps=fps)])
+        # Изменения чужого потока клиенту не отправляются
+        assert snapshot.filter_delta(delta, {"cam1"}) is None
+
+    delta = snapshot.update([stream(main, "cam1", is_running=False), stream(main, "cam2", fps=13.0)])
+    filtered = snapshot.filter_delta(delta, {"cam1"})
+    assert filtered["changes"] == {"cam1": {"is_running": False}}
+    client = apply(client, filtered)
+    assert client == apply(None, snapshot.snapshot_message({"cam1"}))
+
+def test_missed_filtered_delta_is_a_gap(main):
+    snapshot = main.StatusSnapshot()
+    snapshot.update([stream(main, "cam1")])
+    client = apply(None, snapshot.snapshot_message({"cam1"}))
+    snapshot.filter_delta(snapshot.update([stream(main, "cam1", fps=1.0)]), {"cam1"})
+    missed_next = snapshot.filter_delta(snapshot.update([stream(main, "cam1", fps=2.0)]), {"cam1"})
+
+    with pytest.raises(StatusGap):
+        apply(client, missed_next)
+
+def test_lifecycle_changed_ignores_counters(main):
+    snapshot = main.StatusSnapshot()
+    assert main.StatusSnapshot.lifecycle_changed(snapshot.update([stream(main, "cam1")]))
+    assert not main.StatusSnapshot.lifecycle_changed(snapshot.update([stream(main, "cam1", fps=5.0)]))
+    assert main.StatusSnapshot.lifecycle_changed(
+        snapshot.update([stream(main, "cam1", fps=5.0, is_running=False)]))
+    assert main.StatusSnapshot.lifecycle_changed(snapshot.update([]))
@@ -0,0 +1,79 @@
+import asyncio
+import time
+import threading
+import numpy as np
+import pytest
+from thumbnail_cache import ThumbnailCache
+
+class RecordingDispatcher:
+    """Диспетчер, который только запоминает поставленные сообщения"""
+
+    def __init__(self):
+        self.messages = []
+
+    def submit(self, chat_id: str, text: str, photo: bytes = None) -> bool:
+        self.messages.append((chat_id, text, photo))
+        return True
+
+class ThreadRecordingCache(ThumbnailCache):
+    def compose_grid(self, thumbnail_ids, labels):
+        self.grid_thread = threading.current_thread()
+        return super().compose_grid(thumbnail_ids, labels)
+
+@pytest.fixture
+def service(monkeypatch):
+    import main
+    cache = ThreadRecordingCache()
+    monkeypatch.setattr(main, "thumbnail_cache", cache)
+    service = main.TelegramService(RecordingDispatcher())
+    service.enabled, service.bot_token, service.chat_id = True, "token", "chat"
+    service.digest_enabled, service.digest_window = True, 0.05
+    return service
+
+def entry(kind: str, thumbnail_id: str = None):
+    import main
+    return main.DigestEntry(kind, 0.9, 0.9, 5, thumbnail_id)
+
+def test_digest_grid_is_composed_off_the_event_loop(service):
+    import main
+    frame = np.full((64, 64, 3), 200, dtype=np.uint8)
+
+    async def scenario():
+        service.add_to_digest("cam1", entry("started", main.thumbnail_cache.put(frame)))
+        service.add_to_digest("cam2", entry("started", main.thumbnail_cache.put(frame)))
+        await asyncio.sleep(0.2)
+
+    asyncio.run(scenario())
+    assert main.thumbnail_cache.grid_thread is not threading.main_thread()
+    [(chat_id, text, photo)] = service.dispatcher.messages
+    assert chat_id == "chat" and "cam1" in text and "cam2" in text
+    assert photo.startswith(b"\xff\xd8")
+
+def test_drain_waits_for_pending_digest(service):
+    async def scenario():
+        service.add_to_digest("cam1", entry("ended"))
+        await service.drain()
+        return service.dispatcher.messages
+
+    [(_, text, photo)] = asyncio.run(scenario())
+    assert "Ended on 1 camera" in text and photo is None
+    assert service.digest_timer is None and not service.photo_tasks
+
+def test_single_notification_encodes_thumbnail_off_the_event_loop(service, monkeypatch):
+    import main
+    service.digest_enabled = False
+    threads = []
+    get_jpeg = main.thumbnail_cache.get_jpeg
+    monkeypatch.setattr(main.thumbnail_cache, "get_jpeg",
+                        lambda thumbnail_id: threads.append(threading.current_thread()) or get_jpeg(thumbnail_id))
+    detection = main.DetectionResult(stream_id="cam1", timestamp=time.time(), is_violence=True, confidence=0.9,
+                                     thumbnail_id=main.thumbnail_cache.put(np.zeros((64, 64, 3), dtype=np.uint8)))
+
+    async def scenario():
+        service.handle_detection(detection)
+        await service.drain()
+
+    asyncio.run(scenario())
+    assert threads and threading.main_thread() not in threads
+    [(_, text, photo)] = service.dispatcher.messages
+    assert "Violence Detection Started" in text and photo.startswith(b"\xff\xd8")
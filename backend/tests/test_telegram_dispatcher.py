@@ -0,0 +1,143 @@
+import asyncio
+import time
+from aiohttp import web
+from telegram_dispatcher import TelegramDispatcher
+
+class StubBotApi:
+    """Заглушка Bot API: отвечает по сценарию и запоминает время запросов"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    async def handle(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        self.requests.append((time.monotonic(), request.match_info["method"], payload["text"]))
+        status, body = self.responses.pop(0) if self.responses else (200, {"ok": True})
+        return web.json_response(body, status=status)
+
+    def intervals(self):
+        times = [moment for moment, _, _ in self.requests]
+        return [later - earlier for earlier, later in zip(times, times[1:])]
+
+async def serve(stub: StubBotApi, **options) -> tuple:
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", stub.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    dispatcher = TelegramDispatcher(api_url=f"http://127.0.0.1:{port}", bot_token="token", **options)
+    await dispatcher.start()
+    return dispatcher, runner
+
+async def shutdown(dispatcher: TelegramDispatcher, runner: web.AppRunner):
+    await dispatcher.stop()
+    await runner.cleanup()
+
+def test_429_waits_for_retry_after():
+    async def scenario():
+        stub = StubBotApi((429, {"ok": False, "parameters": {"retry_after": 0.3}}))
+        dispatcher, runner = await serve(stub, backoff=5.0)
+        try:
+            assert await dispatcher.send("1", "hello")
+        finally:
+            await shutdown(dispatcher, runner)
+        return stub, dispatcher
+
+    stub, dispatcher = asyncio.run(scenario())
+    assert len(stub.requests) == 2
+    # Пауза из retry_after, а не экспоненциальная (backoff=5 с)
+    assert 0.3 <= stub.intervals()[0] < 2.0
+    assert dispatcher.rate_limited == 1
+    assert dispatcher.retries == 1
+    assert dispatcher.sent == 1
+
+def test_5xx_backs_off_exponentially_and_gives_up():
+    async def scenario():
+        stub = StubBotApi(*[(502, {"ok": False})] * 3)
+        dispatcher, runner = await serve(stub, backoff=0.1, max_retries=2, chat_rate=100.0)
+        try:
+            assert not await dispatcher.send("1", "hello")
+        finally:
+            await shutdown(dispatcher, runner)
+        return stub, dispatcher
+
+    stub, dispatcher = asyncio.run(scenario())
+    assert len(stub.requests) == 3
+    first, second = stub.intervals()
+    assert first >= 0.1
+    assert second >= 0.2
+    assert dispatcher.failed == 1
+    assert dispatcher.retries == 2
+
+def test_client_error_is_not_retried():
+    async def scenario():
+        stub = StubBotApi((400, {"ok": False, "description": "chat not found"}))
+        dispatcher, runner = await serve(stub)
+        try:
+            assert not await dispatcher.send("1", "hello")
+        finally:
+            await shutdown(dispatcher, runner)
+        return stub
+
+    assert len(asyncio.run(scenario()).requests) == 1
+
+def test_chat_and_group_rate_limits():
+    async def scenario():
+        stub = StubBotApi()
+        dispatcher, runner = await serve(stub, chat_rate=10.0, group_rate=4.0)
+        try:
+            for _ in range(3):
+                dispatcher.submit("1", "private")
+            await dispatcher.queue.join()
+            private = stub.intervals()
+            stub.requests.clear()
+            for _ in range(3):
+                dispatcher.submit("-100", "group")
+            await dispatcher.queue.join()
+            group = stub.intervals()
+        finally:
+            await shutdown(dispatcher, runner)
+        return private, group
+
+    private, group = asyncio.run(scenario())
+    assert all(interval >= 0.09 for interval in private)
+    assert all(interval >= 0.24 for interval in group)
+
+def test_configure_rates_applies_to_existing_buckets():
+    async def scenario():
+        stub = StubBotApi()
+        dispatcher, runner = await serve(stub, global_rate=1.0, chat_rate=1.0)
+        try:
+            assert await dispatcher.send("1", "first")
+            dispatcher.configure_rates(global_rate=100.0, chat_rate=100.0, group_rate=100.0)
+            started = time.monotonic()
+            for _ in range(3):
+                dispatcher.submit("1", "fast")
+            await dispatcher.queue.join()
+            return time.monotonic() - started
+        finally:
+            await shutdown(dispatcher, runner)
+
+    # Со старыми лимитами (1 в секунду) три сообщения заняли бы больше двух секунд
+    assert asyncio.run(scenario()) < 0.5
+
+def test_queue_size_drops_oldest():
+    async def scenario():
+        stub = StubBotApi()
+        dispatcher, runner = await serve(stub, max_queue=2, chat_rate=100.0)
+        try:
+            for index in range(3):
+                dispatcher.submit("1", f"message {index}")
+            dispatcher.max_queue = 1
+            dispatcher.submit("1", "last")
+            await dispatcher.queue.join()
+        finally:
+            await shutdown(dispatcher, runner)
+        return stub, dispatcher
+
+    stub, dispatcher = asyncio.run(scenario())
+    assert dispatcher.dropped == 3
+    assert [text for _, _, text in stub.requests] == ["last"]
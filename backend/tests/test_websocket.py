@@ -0,0 +1,134 @@
+import asyncio
+import pytest
+
+@pytest.fixture
+def main(monkeypatch):
+    import main
+    monkeypatch.setattr(main, "connection_manager", main.ConnectionManager(max_queue=8, max_lag=10.0))
+    monkeypatch.setattr(main, "status_snapshot", main.StatusSnapshot())
+    return main
+
+def client_for(main, streams=None, topics=None):
+    client = main.ClientConnection(websocket=None, max_queue=8, max_lag=10.0)
+    client.streams = streams
+    if topics is not None:
+        client.topics = topics
+    main.connection_manager.index.add(client)
+    return client
+
+def replies(client) -> list:
+    return [message.payload for _, message, _ in client.pending]
+
+@pytest.mark.parametrize("message", [
+    {"type": "subscribe", "topics": "alert"},
+    {"type": "subscribe", "topics": ["alert", 1]},
+    {"type": "subscribe", "streams": "cam1"},
+    {"type": "unsubscribe", "streams": "*"},
+])
+def test_subscription_rejects_malformed_lists(main, message):
+    client = client_for(main, streams={"cam1"})
+    topics = set(client.topics)
+    main.handle_subscription(client, message)
+
+    assert client.topics == topics and client.streams == {"cam1"}
+    assert [reply["type"] for reply in replies(client)] == ["error"]
+
+def test_unsubscribe_streams_while_subscribed_to_all(main):
+    client = client_for(main)
+    main.handle_subscription(client, {"type": "unsubscribe", "streams": ["cam1"]})
+
+    assert client.streams is None
+    assert replies(client)[0]["type"] == "error"
+
+def test_subscription_updates_streams(main):
+    client = client_for(main, streams={"cam1"})
+    main.handle_subscription(client, {"type": "subscribe", "streams": ["cam2"]})
+    main.handle_subscription(client, {"type": "unsubscribe", "streams": ["cam1"]})
+
+    assert client.streams == {"cam2"}
+    assert replies(client)[-1] == {"type": "subscribed", "topics": sorted(client.topics), "streams": ["cam2"]}
+
+def test_replies_to_lagging_client_drop_it(main):
+    async def scenario():
+        client = client_for(main)
+        main.connection_manager.active_connections.append(client)
+        for _ in range(client.max_queue):
+            client.enqueue(main.PONG_MESSAGE)
+
+        assert not main.connection_manager.send(client, main.PONG_MESSAGE)
+        main.handle_subscription(client, {"type": "subscribe", "topics": ["alert"]})
+        return client
+
+    client = asyncio.run(scenario())
+    assert client.closed and len(client.pending) == client.max_queue
+    assert main.connection_manager.slow_disconnects == 1
+
+class HistoryService:
+    """История из базы для режима history"""
+
+    def __init__(self):
+        self.requests = []
+
+    async def get_incidents(self, limit: int, since):
+        self.requests.append(since)
+        return [{"id": 1, "stream_id": "cam1"}, {"id": 2, "stream_id": "cam2"}]
+
+@pytest.fixture
+def event_log(main, monkeypatch):
+    log = main.EventLog(maxlen=5)
+    monkeypatch.setattr(main, "event_log", log)
+    monkeypatch.setattr(main, "alert_service", HistoryService())
+    monkeypatch.setattr(main.system_settings, "store_raw_detections", False)
+    for index in range(4):
+        log.append([main.TOPIC_ALERTS], f"cam{index % 2 + 1}", {"type": "alert", "index": index})
+    return log
+
+def resume(main, client, request: dict) -> list:
+    asyncio.run(main.resume_client(client, request))
+    return replies(client)
+
+def test_resume_replays_missed_events_from_log(main, event_log):
+    client = client_for(main, streams={"cam1"}, topics={main.TOPIC_ALERTS})
+    messages = resume(main, client, {"last_seq": 1, "epoch": event_log.epoch, "since": 0})
+
+    # События 2-4, из них на cam1 подписан только клиент: 3
+    assert [message.get("seq") for message in messages[:-1]] == [3]
+    assert messages[-1] == {"type": "resumed", "mode": "log", "epoch": event_log.epoch,
+                            "seq": 4, "replayed": 1}
+    assert main.alert_service.requests == []
+
+def test_resume_after_restart_loads_history(main, event_log):
+    client = client_for(main, streams={"cam1"})
+    [message] = resume(main, client, {"last_seq": 1, "epoch": "previous-run", "since": 1000})
+
+    assert message["mode"] == "history" and message["epoch"] == event_log.epoch
+    assert message["incidents"] == [{"id": 1, "stream_id": "cam1"}]
+    assert len(main.alert_service.requests) == 1
+
+def test_resume_after_log_overflow_loads_history(main, event_log):
+    for index in range(4, 8):
+        event_log.append([main.TOPIC_ALERTS], "cam1", {"type": "alert", "index": index})
+    client = client_for(main)
+    # Событие 2 уже вытеснено из журнала на 5 событий
+    assert event_log.since(1) is None
+    [message] = resume(main, client, {"last_seq": 1, "epoch": event_log.epoch, "since": 1000})
+
+    assert message["mode"] == "history" and message["seq"] == 8
+    assert [incident["id"] for incident in message["incidents"]] == [1, 2]
+
+def test_resume_too_long_for_client_queue_loads_history(main, event_log):
+    client = client_for(main, topics={main.TOPIC_ALERTS})
+    # Повтор 4 событий не помещается в половину очереди на 8 сообщений
+    [message] = resume(main, client, {"last_seq": 0, "epoch": event_log.epoch, "since": 1000})
+    assert message["mode"] == "history"
+
+def test_encode_metrics_count_utf8_bytes(main, monkeypatch):
+    metrics = main.EncodeMetrics()
+    monkeypatch.setattr(main, "encode_metrics", metrics)
+    message = main.OutgoingMessage({"type": "alert", "stream_id": "Камера у входа"})
+
+    text = message.encode("json")
+    # Текстовый фрейм: строка, а в метриках - байты UTF-8
+    assert isinstance(text, str) and message.encode("json") is text
+    assert metrics.bytes["json"] == len(text.encode("utf-8")) > len(text)
+    assert isinstance(message.encode("msgpack"), bytes)
@@ -0,0 +1,137 @@
+import cv2
+import numpy as np
+import math
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+class ThumbnailCache:
+    """LRU кэш миниатюр детекций с ограничением по объему памяти.
+
+    Кадр сохраняется в виде уменьшенного массива uint8, а JPEG кодируется
+    только при первом запросе миниатюры, поэтому миниатюры, которые никто
+    не запросил, никогда не кодируются. Объем задается через budget() из числа
+    потоков и времени, которое миниатюра должна оставаться доступной.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, size: int = 128, quality: int = 80):
+        self.max_bytes = max_bytes
+        self.size = size
+        self.quality = quality
+        # thumbnail_id -> кадр (np.ndarray) или JPEG (bytes)
+        self.entries: "OrderedDict[str, object]" = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+        # Статистика
+        self.hits = 0
+        self.misses = 0
+        self.encodes = 0
+        self.evictions = 0
+
+    @staticmethod
+    def budget(streams: int, seconds: float, windows_per_second: float, size: int = 128) -> int:
+        """Объем, при котором миниатюры всех потоков живут в кэше не меньше seconds,
+        даже если каждое окно каждого потока попадает в кэш"""
+        return int(max(1, streams) * seconds * windows_per_second * size * size * 3)
+
+    def resize(self, max_bytes: int):
+        with self.lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    @staticmethod
+    def _size_of(entry) -> int:
+        return entry.nbytes if isinstance(entry, np.ndarray) else len(entry)
+
+    def put(self, frame: np.ndarray) -> str:
+        """Сохранение кадра (BGR uint8), возвращает идентификатор миниатюры"""
+        thumbnail = cv2.resize(frame, (self.size, self.size), interpolation=cv2.INTER_AREA)
+        thumbnail_id = uuid.uuid4().hex
+
+        with self.lock:
+            self.entries[thumbnail_id] = thumbnail
+            self.total_bytes += thumbnail.nbytes
+            self._evict()
+        return thumbnail_id
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self.entries:
+            _, entry = self.entries.popitem(last=False)
+            self.total_bytes -= self._size_of(entry)
+            self.evictions += 1
+
+    def get_jpeg(self, thumbnail_id: str) -> Optional[bytes]:
+        """JPEG миниатюры; кодируется при первом обращении и заменяет кадр в кэше"""
+        with self.lock:
+            entry = self.entries.get(thumbnail_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(thumbnail_id)
+            if isinstance(entry, bytes):
+                return entry
+
+        ok, buffer = cv2.imencode('.jpg', entry, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return None
+        jpeg = buffer.tobytes()
+
+        with self.lock:
+            self.encodes += 1
+            # Запись могла быть вытеснена, пока шло кодирование
+            if self.entries.get(thumbnail_id) is entry:
+                self.entries[thumbnail_id] = jpeg
+                self.total_bytes += len(jpeg) - entry.nbytes
+        return jpeg
+
+    def get_frame(self, thumbnail_id: str) -> Optional[np.ndarray]:
+        """Кадр миниатюры (если миниатюра уже закодирована - декодированный JPEG)"""
+        with self.lock:
+            entry = self.entries.get(thumbnail_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(thumbnail_id)
+        if isinstance(entry, bytes):
+            return cv2.imdecode(np.frombuffer(entry, np.uint8), cv2.IMREAD_COLOR)
+        return entry
+
+    def compose_grid(self, thumbnail_ids: List[str], labels: List[str]) -> Optional[bytes]:
+        """JPEG сетки из миниатюр с подписями (например, id потоков); None, если кадров нет"""
+        tiles = [(frame, label) for frame, label in
+                 ((self.get_frame(thumbnail_id), label) for thumbnail_id, label in zip(thumbnail_ids, labels))
+                 if frame is not None]
+        if not tiles:
+            return None
+
+        columns = math.ceil(math.sqrt(len(tiles)))
+        rows = math.ceil(len(tiles) / columns)
+        grid = np.zeros((rows * self.size, columns * self.size, 3), dtype=np.uint8)
+        for index, (frame, label) in enumerate(tiles):
+            if frame.shape[:2] != (self.size, self.size):
+                frame = cv2.resize(frame, (self.size, self.size), interpolation=cv2.INTER_AREA)
+            top, left = (index // columns) * self.size, (index % columns) * self.size
+            grid[top:top + self.size, left:left + self.size] = frame
+            # Подпись с обводкой, чтобы читалась на любом кадре
+            origin = (left + 4, top + self.size - 6)
+            cv2.putText(grid, label, origin, cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 0, 0), 3, cv2.LINE_AA)
+            cv2.putText(grid, label, origin, cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1, cv2.LINE_AA)
+
+        ok, buffer = cv2.imencode('.jpg', grid, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return buffer.tobytes() if ok else None
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "encodes": self.encodes,
+                "evictions": self.evictions
+            }
@@ -1,5 +1,6 @@
-import React, { createContext, useContext, useState, useEffect, useCallback } from 'react';
+import React, { createContext, useContext, useState, useEffect, useCallback, useRef } from 'react';
 import axios from 'axios';
+import { useWebSocket } from './WebSocketContext';
 
 interface Stream {
   id: string;
@@ -18,7 +19,7 @@ interface DetectionResult {
   timestamp: number;
   is_violence: boolean;
   confidence: number;
-  frame_data: string;
+  thumbnail_id?: string | null;
 }
 
 interface SystemStatus {
@@ -53,6 +54,8 @@ export const useStreams = () => {
 };
 
 const API_BASE_URL = 'http://localhost:8003';
+// Сколько секунд сервер держит long-poll запрос статуса
+const STATUS_LONG_POLL_WAIT = 25;
 
 export const StreamsProvider: React.FC<{ children: React.ReactNode }> = ({ children }) => {
   const [streams, setStreams] = useState<Stream[]>([]);
@@ -64,11 +67,30 @@ export const StreamsProvider: React.FC<{ children: React.ReactNode }> = ({ child
   });
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
+  const { streamsStatus } = useWebSocket();
+  // ETag последних ответов: сервер отвечает 304, если данные не изменились
+  const streamsEtagRef = useRef<string | null>(null);
+  const statusEtagRef = useRef<string | null>(null);
+
+  // Живой статус потоков приходит по WebSocket (снимок + дельты)
+  useEffect(() => {
+    if (streamsStatus) {
+      setStreams(streamsStatus);
+      setLoading(false);
+    }
+  }, [streamsStatus]);
 
   const refreshStreams = useCallback(async () => {
     try {
       setError(null);
-      const response = await axios.get(`${API_BASE_URL}/api/streams`);
+      const response = await axios.get(`${API_BASE_URL}/api/streams`, {
+        headers: streamsEtagRef.current ? { 'If-None-Match': streamsEtagRef.current } : {},
+        validateStatus: status => status === 200 || status === 304,
+      });
+      if (response.status === 304) {
+        return;
+      }
+      streamsEtagRef.current = response.headers['etag'] || null;
       // Обновляем только если данные изменились
       setStreams(prevStreams => {
         const newStreams = response.data;
@@ -96,24 +118,36 @@ export const StreamsProvider: React.FC<{ children: React.ReactNode }> = ({ child
     }
   }, []);
 
+  const fetchStatus = useCallback(async (wait: number = 0) => {
+    const response = await axios.get(`${API_BASE_URL}/api/status`, {
+      params: wait > 0 ? { wait } : {},
+      headers: statusEtagRef.current ? { 'If-None-Match': statusEtagRef.current } : {},
+      validateStatus: status => status === 200 || status === 304,
+    });
+    if (response.status === 304) {
+      return;
+    }
+    statusEtagRef.current = response.headers['etag'] || null;
+    // Обновляем только если данные изменились
+    setSystemStatus(prevStatus => {
+      const newStatus = response.data;
+      if (prevStatus.triton_server !== newStatus.triton_server ||
+          prevStatus.active_streams !== newStatus.active_streams ||
+          prevStatus.total_streams !== newStatus.total_streams ||
+          prevStatus.uptime !== newStatus.uptime) {
+        return newStatus;
+      }
+      return prevStatus;
+    });
+  }, []);
+
   const refreshStatus = useCallback(async () => {
     try {
-      const response = await axios.get(`${API_BASE_URL}/api/status`);
-      // Обновляем только если данные изменились
-      setSystemStatus(prevStatus => {
-        const newStatus = response.data;
-        if (prevStatus.triton_server !== newStatus.triton_server ||
-            prevStatus.active_streams !== newStatus.active_streams ||
-            prevStatus.total_streams !== newStatus.total_streams ||
-            prevStatus.uptime !== newStatus.uptime) {
-          return newStatus;
-        }
-        return prevStatus;
-      });
+      await fetchStatus();
     } catch (err) {
       console.error('Error loading system status:', err);
     }
-  }, []);
+  }, [fetchStatus]);
 
   const addStream = async (stream: Omit<Stream, 'fps' | 'total_frames' | 'detection_count' | 'is_running'>) => {
     try {
@@ -177,19 +211,30 @@ export const StreamsProvider: React.FC<{ children: React.ReactNode }> = ({ child
   };
 
   useEffect(() => {
+    let active = true;
     refreshStreams();
-    refreshStatus();
     
-    // Обновление статуса каждые 10 секунд
-    const statusInterval = setInterval(refreshStatus, 10000);
-    // Обновление потоков каждые 8 секунд
+    // Long-poll статуса: сервер отвечает только при изменении или по таймауту
+    const pollStatus = async () => {
+      while (active) {
+        try {
+          await fetchStatus(STATUS_LONG_POLL_WAIT);
+        } catch (err) {
+          console.error('Error loading system status:', err);
+          await new Promise(resolve => setTimeout(resolve, 5000));
+        }
+      }
+    };
+    pollStatus();
+    
+    // Условный запрос потоков каждые 8 секунд (живой статус приходит по WebSocket)
     const streamsInterval = setInterval(refreshStreams, 8000);
     
     return () => {
-      clearInterval(statusInterval);
+      active = false;
       clearInterval(streamsInterval);
     };
-  }, [refreshStreams, refreshStatus]);
+  }, [refreshStreams, fetchStatus]);
 
   return (
     <StreamsContext.Provider value={{
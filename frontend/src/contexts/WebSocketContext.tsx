@@ -4,6 +4,7 @@ interface WebSocketContextType {
   isConnected: boolean;
   sendMessage: (message: any) => void;
   lastMessage: any;
+  streamsStatus: any[] | null;
 }
 
 const WebSocketContext = createContext<WebSocketContextType | undefined>(undefined);
@@ -20,15 +21,61 @@ export const WebSocketProvider: React.FC<{ children: React.ReactNode }> = ({ chi
   const [ws, setWs] = useState<WebSocket | null>(null);
   const [isConnected, setIsConnected] = useState(false);
   const [lastMessage, setLastMessage] = useState<any>(null);
+  const [streamsStatus, setStreamsStatus] = useState<any[] | null>(null);
   const reconnectTimeoutRef = useRef<NodeJS.Timeout | null>(null);
+  // Версионированный снимок статусов потоков, к которому применяются дельты
+  const statusRef = useRef<{ version: number; streams: Map<string, any> } | null>(null);
+  // Позиция в журнале событий сервера для досылки пропущенного после переподключения
+  const epochRef = useRef<string | null>(null);
+  const lastSeqRef = useRef(0);
+  const lastEventTimeRef = useRef<number | null>(null);
 
   useEffect(() => {
     const connectWebSocket = () => {
-      const websocket = new WebSocket('ws://localhost:8003/ws');
+      const params = new URLSearchParams();
+      if (epochRef.current !== null) {
+        params.set('epoch', epochRef.current);
+        params.set('last_seq', lastSeqRef.current.toString());
+        if (lastEventTimeRef.current !== null) {
+          params.set('since', lastEventTimeRef.current.toString());
+        }
+      }
+      const query = params.toString();
+      const websocket = new WebSocket(`ws://localhost:8003/ws${query ? `?${query}` : ''}`);
       
       websocket.onopen = () => {
         console.log('WebSocket connected');
         setIsConnected(true);
+        // После переподключения сервер присылает новый полный снимок
+        statusRef.current = null;
+      };
+      
+      const applyStatus = (data: any) => {
+        let next: { version: number; streams: Map<string, any> };
+        if (data.snapshot) {
+          next = {
+            version: data.version,
+            streams: new Map(data.data.map((stream: any) => [stream.id, stream])),
+          };
+        } else {
+          const current = statusRef.current;
+          // Дельта применима к любому состоянию не старше base_version
+          if (!current || data.base_version > current.version) {
+            // Пропущена дельта: запрашиваем полный снимок
+            if (websocket.readyState === WebSocket.OPEN) {
+              websocket.send(JSON.stringify({ type: 'get_status_snapshot' }));
+            }
+            return;
+          }
+          const streams = new Map(current.streams);
+          data.removed.forEach((streamId: string) => streams.delete(streamId));
+          Object.entries(data.changes).forEach(([streamId, fields]: [string, any]) => {
+            streams.set(streamId, { ...streams.get(streamId), ...fields });
+          });
+          next = { version: data.version, streams };
+        }
+        statusRef.current = next;
+        setStreamsStatus(Array.from(next.streams.values()));
       };
       
       websocket.onmessage = (event) => {
@@ -36,11 +83,28 @@ export const WebSocketProvider: React.FC<{ children: React.ReactNode }> = ({ chi
           const data = JSON.parse(event.data);
           setLastMessage(data);
           
+          if (typeof data.seq === 'number' && data.type !== 'hello' && data.type !== 'resumed') {
+            lastSeqRef.current = Math.max(lastSeqRef.current, data.seq);
+          }
+          if (data.type === 'detection_result' && data.data?.timestamp) {
+            lastEventTimeRef.current = data.data.timestamp;
+          }
+          
           // Обработка различных типов сообщений
-          if (data.type === 'detection_result') {
+          if (data.type === 'hello') {
+            // Первое подключение: начинаем с текущей позиции журнала
+            if (epochRef.current === null) {
+              epochRef.current = data.epoch;
+              lastSeqRef.current = data.seq;
+              lastEventTimeRef.current = Date.now() / 1000;
+            }
+          } else if (data.type === 'resumed') {
+            epochRef.current = data.epoch;
+            lastSeqRef.current = Math.max(lastSeqRef.current, data.seq);
+          } else if (data.type === 'detection_result') {
             console.log('Detection result:', data.data);
           } else if (data.type === 'streams_status') {
-            console.log('Streams status update:', data.data);
+            applyStatus(data);
           } else if (data.type === 'stream_update') {
             console.log('Stream update:', data.data);
           }
@@ -88,7 +152,7 @@ export const WebSocketProvider: React.FC<{ children: React.ReactNode }> = ({ chi
   };
   
   return (
-    <WebSocketContext.Provider value={{ isConnected, sendMessage, lastMessage }}>
+    <WebSocketContext.Provider value={{ isConnected, sendMessage, lastMessage, streamsStatus }}>
       {children}
     </WebSocketContext.Provider>
   );
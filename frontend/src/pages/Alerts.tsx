@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import {
   Box,
   Typography,
@@ -63,17 +63,32 @@ interface Detection {
   timestamp: string;
   is_violence: boolean;
   confidence: number;
-  frame_data?: string;
+  thumbnail_url?: string | null;
   processed: boolean;
   acknowledged: boolean;
   created_at: string;
 }
 
+interface Incident {
+  id: number;
+  stream_id: string;
+  started_at: string;
+  ended_at: string;
+  duration: number;
+  peak_confidence: number;
+  mean_confidence: number;
+  window_count: number;
+  thumbnail_urls: { [role: string]: string };
+  is_open: boolean;
+  acknowledged: boolean;
+}
+
 interface Statistics {
   period_days: number;
   total_detections: number;
   violence_detections: number;
   violence_percentage: number;
+  total_incidents?: number;
   stream_statistics: Array<{
     stream_id: string;
     name: string;
@@ -88,10 +103,11 @@ const Alerts: React.FC = () => {
   const [activeTab, setActiveTab] = useState(0);
   const [alerts, setAlerts] = useState<Alert[]>([]);
   const [detections, setDetections] = useState<Detection[]>([]);
+  const [incidents, setIncidents] = useState<Incident[]>([]);
   const [statistics, setStatistics] = useState<Statistics | null>(null);
   const [loading, setLoading] = useState(false);
   const [settingsOpen, setSettingsOpen] = useState(false);
-  const [selectedDetection, setSelectedDetection] = useState<Detection | null>(null);
+  const [selectedImageUrl, setSelectedImageUrl] = useState<string | null>(null);
   const [imageDialogOpen, setImageDialogOpen] = useState(false);
   
   // Фильтры
@@ -103,6 +119,8 @@ const Alerts: React.FC = () => {
   // Пагинация
   const [page, setPage] = useState(1);
   const [totalPages, setTotalPages] = useState(1);
+  // Курсоры страниц истории, алертов и инцидентов: cursorsRef.current[page - 1] открывает страницу page
+  const cursorsRef = useRef<(string | null)[]>([null]);
   const limit = 20;
 
   const [settings, setSettings] = useState({
@@ -142,21 +160,35 @@ const Alerts: React.FC = () => {
     }
   };
 
+  // Параметры страницы: курсор, если он известен, иначе смещение
+  const pageParams = () => {
+    const params = new URLSearchParams({ limit: limit.toString() });
+    const cursor = cursorsRef.current[page - 1];
+    if (cursor) {
+      params.append('cursor', cursor);
+    } else {
+      params.append('offset', ((page - 1) * limit).toString());
+    }
+    return params;
+  };
+
+  const updatePages = (nextCursor: string | null) => {
+    cursorsRef.current[page] = nextCursor;
+    setTotalPages(nextCursor ? page + 1 : page);
+  };
+
   // Загрузка данных
   const loadAlerts = async () => {
     setLoading(true);
     try {
-      const params = new URLSearchParams({
-        limit: limit.toString(),
-        offset: ((page - 1) * limit).toString(),
-      });
+      const params = pageParams();
       
       if (alertType) params.append('alert_type', alertType);
       if (acknowledged !== '') params.append('acknowledged', acknowledged);
       
       const response = await axios.get(`http://localhost:8003/api/alerts?${params}`);
       setAlerts(response.data.alerts);
-      setTotalPages(Math.ceil(response.data.alerts.length / limit));
+      updatePages(response.data.next_cursor);
     } catch (error) {
       console.error('Error loading alerts:', error);
     } finally {
@@ -167,17 +199,14 @@ const Alerts: React.FC = () => {
   const loadDetections = async () => {
     setLoading(true);
     try {
-      const params = new URLSearchParams({
-        limit: limit.toString(),
-        offset: ((page - 1) * limit).toString(),
-      });
+      const params = pageParams();
       
       if (detectionType !== '') params.append('is_violence', detectionType);
       if (streamFilter) params.append('stream_id', streamFilter);
       
       const response = await axios.get(`http://localhost:8003/api/detections/history?${params}`);
       setDetections(response.data.detections);
-      setTotalPages(Math.ceil(response.data.detections.length / limit));
+      updatePages(response.data.next_cursor);
     } catch (error) {
       console.error('Error loading detections:', error);
     } finally {
@@ -185,6 +214,23 @@ const Alerts: React.FC = () => {
     }
   };
 
+  const loadIncidents = async () => {
+    setLoading(true);
+    try {
+      const params = pageParams();
+      
+      if (streamFilter) params.append('stream_id', streamFilter);
+      
+      const response = await axios.get(`http://localhost:8003/api/incidents?${params}`);
+      setIncidents(response.data.incidents);
+      updatePages(response.data.next_cursor);
+    } catch (error) {
+      console.error('Error loading incidents:', error);
+    } finally {
+      setLoading(false);
+    }
+  };
+
   const loadStatistics = async () => {
     try {
       const response = await axios.get('http://localhost:8003/api/statistics?days=7');
@@ -199,6 +245,12 @@ const Alerts: React.FC = () => {
     loadSystemSettings();
   }, []);
 
+  useEffect(() => {
+    // При смене вкладки или фильтров курсоры прежней выборки недействительны
+    cursorsRef.current = [null];
+    setPage(1);
+  }, [activeTab, alertType, acknowledged, detectionType, streamFilter]);
+
   useEffect(() => {
     if (activeTab === 0) {
       loadAlerts();
@@ -206,6 +258,8 @@ const Alerts: React.FC = () => {
       loadDetections();
     } else if (activeTab === 2) {
       loadStatistics();
+    } else if (activeTab === 3) {
+      loadIncidents();
     }
   }, [activeTab, page, alertType, acknowledged, detectionType, streamFilter]);
 
@@ -227,6 +281,15 @@ const Alerts: React.FC = () => {
     }
   };
 
+  const handleAcknowledgeIncident = async (incidentId: number) => {
+    try {
+      await axios.post(`http://localhost:8003/api/incidents/${incidentId}/acknowledge`);
+      loadIncidents(); // Перезагружаем список
+    } catch (error) {
+      console.error('Error acknowledging incident:', error);
+    }
+  };
+
   const getAlertIcon = (type: string) => {
     switch (type) {
       case 'violence':
@@ -477,12 +540,12 @@ const Alerts: React.FC = () => {
                   size="small"
                 />
                 
-                {detection.frame_data && (
+                {detection.thumbnail_url && (
                   <Tooltip title="View frame">
                     <IconButton
                       size="small"
                       onClick={() => {
-                        setSelectedDetection(detection);
+                        setSelectedImageUrl(detection.thumbnail_url || null);
                         setImageDialogOpen(true);
                       }}
                     >
@@ -518,6 +581,116 @@ const Alerts: React.FC = () => {
     </Box>
   );
 
+  const renderIncidentsTab = () => (
+    <Box>
+      <Box display="flex" justifyContent="space-between" alignItems="center" mb={2}>
+        <Typography variant="h6">Incidents</Typography>
+        <Box display="flex" gap={1}>
+          <TextField
+            size="small"
+            label="Stream ID"
+            value={streamFilter}
+            onChange={(e) => setStreamFilter(e.target.value)}
+            sx={{ minWidth: 150 }}
+          />
+          
+          <IconButton onClick={loadIncidents}>
+            <RefreshIcon />
+          </IconButton>
+        </Box>
+      </Box>
+
+      {loading ? (
+        <Box display="flex" justifyContent="center" p={4}>
+          <CircularProgress />
+        </Box>
+      ) : incidents.length === 0 ? (
+        <Card>
+          <CardContent>
+            <Typography color="text.secondary" sx={{ textAlign: 'center', py: 4 }}>
+              No incidents found
+            </Typography>
+          </CardContent>
+        </Card>
+      ) : (
+        <List>
+          {incidents.map(incident => (
+            <ListItem
+              key={incident.id}
+              divider
+              sx={{
+                backgroundColor: incident.acknowledged ? 'transparent' : 'rgba(244, 67, 54, 0.1)',
+              }}
+            >
+              <ListItemIcon>
+                <ErrorIcon color="error" />
+              </ListItemIcon>
+              
+              <ListItemText
+                primary={`Incident in stream ${incident.stream_id}`}
+                secondary={
+                  <Box>
+                    <Typography variant="body2" color="text.secondary">
+                      {formatDate(incident.started_at)} — {formatDate(incident.ended_at)} ({incident.duration.toFixed(1)} s)
+                    </Typography>
+                    <Typography variant="body2" color="text.secondary">
+                      Peak: {(incident.peak_confidence * 100).toFixed(1)}% | Mean: {(incident.mean_confidence * 100).toFixed(1)}% | Windows: {incident.window_count}
+                    </Typography>
+                    <Typography variant="body2" color="text.secondary">
+                      Status: {incident.acknowledged ? 'Acknowledged' : 'Unacknowledged'}
+                    </Typography>
+                  </Box>
+                }
+              />
+              
+              <Box display="flex" alignItems="center" gap={1}>
+                <Chip
+                  label={incident.is_open ? 'ONGOING' : 'ENDED'}
+                  color={incident.is_open ? 'error' : 'default'}
+                  size="small"
+                />
+                
+                {incident.thumbnail_urls.peak && (
+                  <Tooltip title="View peak frame">
+                    <IconButton
+                      size="small"
+                      onClick={() => {
+                        setSelectedImageUrl(incident.thumbnail_urls.peak);
+                        setImageDialogOpen(true);
+                      }}
+                    >
+                      <VisibilityIcon />
+                    </IconButton>
+                  </Tooltip>
+                )}
+                
+                {!incident.acknowledged && (
+                  <Button
+                    size="small"
+                    variant="outlined"
+                    onClick={() => handleAcknowledgeIncident(incident.id)}
+                  >
+                    Acknowledge
+                  </Button>
+                )}
+              </Box>
+            </ListItem>
+          ))}
+        </List>
+      )}
+      
+      {totalPages > 1 && (
+        <Box display="flex" justifyContent="center" mt={2}>
+          <Pagination
+            count={totalPages}
+            page={page}
+            onChange={(_, value) => setPage(value)}
+          />
+        </Box>
+      )}
+    </Box>
+  );
+
   const renderStatisticsTab = () => (
     <Box>
       <Typography variant="h6" gutterBottom>Statistics (Last 7 Days)</Typography>
@@ -589,11 +762,13 @@ const Alerts: React.FC = () => {
         <Tab label="Alerts" />
         <Tab label="Detection History" />
         <Tab label="Statistics" />
+        <Tab label="Incidents" />
       </Tabs>
 
       {activeTab === 0 && renderAlertsTab()}
       {activeTab === 1 && renderDetectionsTab()}
       {activeTab === 2 && renderStatisticsTab()}
+      {activeTab === 3 && renderIncidentsTab()}
 
       {/* Settings Dialog */}
       <Dialog open={settingsOpen} onClose={() => setSettingsOpen(false)} maxWidth="sm" fullWidth>
@@ -665,10 +840,10 @@ const Alerts: React.FC = () => {
       >
         <DialogTitle>Detection Frame</DialogTitle>
         <DialogContent>
-          {selectedDetection?.frame_data && (
+          {selectedImageUrl && (
             <Box display="flex" justifyContent="center">
               <img
-                src={`data:image/jpeg;base64,${selectedDetection.frame_data}`}
+                src={`http://localhost:8003${selectedImageUrl}`}
                 alt="Detection frame"
                 style={{ maxWidth: '100%', maxHeight: '400px' }}
               />
@@ -39,7 +39,7 @@ const StreamsManager: React.FC = () => {
 
   // Автоматическое обновление при получении WebSocket сообщений
   useEffect(() => {
-    if (lastMessage && (lastMessage.type === 'detection_result' || lastMessage.type === 'streams_status')) {
+    if (lastMessage && lastMessage.type === 'detection_result') {
       refreshStreams();
     }
   }, [lastMessage, refreshStreams]);